@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+bench_dates.py — השוואת פענוח תאריכים: המסלולים הקודמים (מיזוג/BI כריתה, ו־parse_any_date לכל תא בדף הערעורים)
+מול date_engine.parse_dates.
+שימוש:
+  python benchmarks/bench_dates.py [--rows 1000000] [--repeat 3] [--per-cell-rows 50000]
+"""
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import sys
+import time
+import warnings
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from date_engine import parse_dates  # noqa: E402
+
+
+# ---------- המסלולים הקודמים, לצורך השוואה ----------
+
+def legacy_safe_to_datetime(s: pd.Series) -> pd.Series:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        out = pd.to_datetime(s, errors="coerce", infer_datetime_format=True, dayfirst=True)
+    need = out.isna()
+    if need.any():
+        numeric = pd.to_numeric(s[need], errors="coerce")
+        good = numeric[numeric.notna()]
+        if not good.empty:
+            out.loc[good.index] = pd.to_datetime(good, unit="D", origin="1899-12-30", errors="coerce")
+    return out
+
+
+def legacy_parse_any_date(v):
+    if pd.isna(v):
+        return pd.NaT
+    if isinstance(v, (int, float, np.integer, np.floating)):
+        return pd.to_datetime(v, unit="D", origin="1899-12-30", errors="coerce")
+    s = str(v).replace("\u200f", "").replace("\u200e", "").strip()
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        out = pd.to_datetime(s, dayfirst=True, errors="coerce", infer_datetime_format=True)
+        if pd.isna(out):
+            out = pd.to_datetime(s, dayfirst=False, errors="coerce")
+    return out
+
+
+# ---------- דאטה סינתטי ----------
+
+def make_text_column(rows: int, seed: int = 0) -> pd.Series:
+    """מחרוזות dd/mm/yyyy (כמו בייצוא מהרשויות), עם חסרים — כ־3 שנים של ימים שונים."""
+    rng = np.random.default_rng(seed)
+    days = pd.Timestamp("2022-01-01") + pd.to_timedelta(rng.integers(0, 1100, rows), unit="D")
+    s = pd.Series(days.strftime("%d/%m/%Y"), dtype=object)
+    s[rng.random(rows) < 0.05] = None
+    return s
+
+
+def make_mixed_column(rows: int, seed: int = 1) -> tuple[pd.Series, pd.Series]:
+    """עמודה כמו בגיליון מאוחד: datetime מאקסל, serial מספרי, טקסט וחסרים. מחזיר (עמודה, התאריכים הנכונים)."""
+    rng = np.random.default_rng(seed)
+    serial = rng.integers(44562, 45662, rows)
+    kind = rng.integers(0, 4, rows)
+    base = pd.Timestamp("1899-12-30")
+    expected = pd.Series(base + pd.to_timedelta(serial, unit="D")).where(kind != 3)
+    vals = np.empty(rows, dtype=object)
+    for i, (k, n) in enumerate(zip(kind, serial)):
+        d = base + pd.Timedelta(days=int(n))
+        vals[i] = (
+            dt.datetime(d.year, d.month, d.day) if k == 0
+            else int(n) if k == 1
+            else d.strftime("%d/%m/%Y") if k == 2
+            else None
+        )
+    return pd.Series(vals, dtype=object), expected
+
+
+def _best(fn, s, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(s)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser(description="בנצ'מרק לפענוח תאריכים")
+    ap.add_argument("--rows", type=int, default=1_000_000, help="מספר שורות (ברירת מחדל: 1,000,000)")
+    ap.add_argument("--repeat", type=int, default=3, help="מספר חזרות; נלקח הזמן הטוב ביותר")
+    ap.add_argument("--per-cell-rows", type=int, default=50_000,
+                    help="מספר שורות למסלול parse_any_date (איטי מאוד; הזמן מוכפל לפי --rows)")
+    args = ap.parse_args()
+
+    text = make_text_column(args.rows)
+    mixed, expected = make_mixed_column(args.rows)
+
+    # נכונות: בטקסט — זהה למסלול הקודם; בעמודה המעורבת — התאריכים הנכונים
+    if not parse_dates(text).equals(legacy_safe_to_datetime(text)):
+        raise SystemExit("שגיאה: תוצאה שונה בעמודת הטקסט")
+    if not parse_dates(mixed).equals(expected):
+        raise SystemExit("שגיאה: פענוח שגוי בעמודה המעורבת")
+
+    # המסלולים הקודמים טועים בעמודה המעורבת (serial כ־ns, או datetime שמוחלף בו יום/חודש) — נספר לצורך הדיווח
+    head = mixed.head(args.per_cell_rows)
+    wrong = {
+        "legacy": int((legacy_safe_to_datetime(mixed) != expected).sum() - expected.isna().sum()),
+        "per-cell": int((pd.to_datetime(head.map(legacy_parse_any_date)) != expected.head(len(head))).sum()
+                        - expected.head(len(head)).isna().sum()),
+    }
+    print(f"wrong dates in mixed column: legacy={wrong['legacy']:,}/{args.rows:,}  "
+          f"per-cell={wrong['per-cell']:,}/{len(head):,}")
+
+    for label, s in (("text dd/mm/yyyy", text), ("mixed", mixed)):
+        t_old = _best(legacy_safe_to_datetime, s, args.repeat)
+        t_new = _best(parse_dates, s, args.repeat)
+        print(f"{label:16s} rows={args.rows:,}  legacy={t_old:.3f}s  engine={t_new:.3f}s  speedup=x{t_old / t_new:.1f}")
+
+    t_cell = _best(lambda s: s.map(legacy_parse_any_date), head, 1) * (args.rows / len(head))
+    t_new = _best(parse_dates, mixed, args.repeat)
+    print(f"{'per-cell (est.)':16s} rows={args.rows:,}  legacy={t_cell:.3f}s  engine={t_new:.3f}s  speedup=x{t_cell / t_new:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+bench_decode.py — השוואת זמני פיענוח פעולה/סיבה: הגרסה הישנה (שורה-שורה) מול הווקטורית.
+שימוש:
+  python benchmarks/bench_decode.py [--rows 1000000] [--repeat 3]
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from merge_engine import ACTION_MAP, REASON_MAP, decode_action_reason  # noqa: E402
+
+
+# ---------- הגרסה הקודמת, לצורך השוואה ----------
+
+def _to_int_or_nan(val):
+    if pd.isna(val):
+        return np.nan
+    try:
+        f = float(str(val).strip())
+        i = int(f)
+        return i if f == i else np.nan
+    except Exception:
+        return np.nan
+
+
+def legacy_decode(df: pd.DataFrame) -> pd.DataFrame:
+    out = df.copy()
+    for src, dst, mapping in (
+        ("פעולה", "פעולה_מפוענחת", ACTION_MAP),
+        ("פעולה (2)", "פעולה_מפוענחת (2)", ACTION_MAP),
+        ("סיבה", "סיבה_מפוענחת", REASON_MAP),
+    ):
+        codes = out[src].map(_to_int_or_nan)
+        out[dst] = np.where(
+            codes.notna(),
+            codes.map(mapping).fillna(out[src].astype(str)),
+            out[src].astype(str),
+        )
+    return out
+
+
+# ---------- דאטה סינתטי ----------
+
+def make_frame(rows: int, seed: int = 0) -> pd.DataFrame:
+    """קודים מספריים (int/float/מחרוזת), טקסט חופשי בעברית וערכים חסרים — כמו בדוחות האמיתיים."""
+    rng = np.random.default_rng(seed)
+    pool = np.array(
+        [1, 2, 1.0, 2.0, "1", "2", " 2 ", 0, 3, "כריתה", "העתקה", "כריתה ושתילה", np.nan, None],
+        dtype=object,
+    )
+    reasons = np.array(
+        list(range(1, 11)) + [str(i) for i in range(1, 11)] + [11, "בטיחות", "בנייה חדשה", np.nan],
+        dtype=object,
+    )
+    return pd.DataFrame({
+        "פעולה": pool[rng.integers(0, len(pool), rows)],
+        "פעולה (2)": pool[rng.integers(0, len(pool), rows)],
+        "סיבה": reasons[rng.integers(0, len(reasons), rows)],
+    })
+
+
+def _best(fn, df, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(df)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser(description="בנצ'מרק לפיענוח קודי פעולה/סיבה")
+    ap.add_argument("--rows", type=int, default=1_000_000, help="מספר שורות (ברירת מחדל: 1,000,000)")
+    ap.add_argument("--repeat", type=int, default=3, help="מספר חזרות; נלקח הזמן הטוב ביותר")
+    args = ap.parse_args()
+
+    df = make_frame(args.rows)
+    new = decode_action_reason(df)
+    old = legacy_decode(df)
+    for c in ("פעולה_מפוענחת", "פעולה_מפוענחת (2)", "סיבה_מפוענחת"):
+        if not (new[c] == old[c]).all():
+            raise SystemExit(f"שגיאה: תוצאה שונה בעמודה {c}")
+
+    t_old = _best(legacy_decode, df, args.repeat)
+    t_new = _best(decode_action_reason, df, args.repeat)
+    print(f"rows={args.rows:,}  legacy={t_old:.3f}s  vectorized={t_new:.3f}s  speedup=x{t_old / t_new:.1f}")
+
+
+if __name__ == "__main__":
+    main()
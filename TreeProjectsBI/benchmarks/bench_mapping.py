@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+bench_mapping.py — השוואת זמני מיפוי גיליון לתבנית TARGET_COLS:
+הגרסה הישנה (get_series ושיבוץ עמודה־עמודה) מול המסלול שהמיזוג עצמו מריץ — sheet_reader.iter_sheet_chunks
+(זיהוי כותרת, build_mapping_plan ותוכנית מיפוי מהודרת לכל מקטע). הגיליון מוגש כגיליון טבלה
+(csv_backend.CsvSheet), כך שנמדד המיפוי בלי זמן הפענוח של xlsx.
+הגיליון הסינתטי רחב: כל כותרת מוכרת חוזרת --copies פעמים (עמודות כפולות לאיחוד), ועוד --extra עמודות לא ממופות.
+שימוש:
+  python benchmarks/bench_mapping.py [--rows 20000] [--copies 20] [--extra 200] [--repeat 3]
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from csv_backend import CsvSheet  # noqa: E402
+from sheet_reader import iter_sheet_chunks  # noqa: E402
+from utils_he import TARGET_COLS, clean_text, detect_header_row, map_col  # noqa: E402
+
+
+# ---------- הגרסה הקודמת, לצורך השוואה ----------
+
+def _get_series(df: pd.DataFrame, col_name: str) -> pd.Series:
+    mask = (df.columns == col_name)
+    cols = df.loc[:, mask]
+    if cols.shape[1] == 0:
+        return pd.Series([pd.NA] * len(df), index=df.index)
+    if cols.shape[1] == 1:
+        return cols.iloc[:, 0]
+    return cols.bfill(axis=1).iloc[:, 0]
+
+
+def legacy_map_sheet(df_raw: pd.DataFrame, sname: str, log_rows: list[dict]) -> pd.DataFrame | None:
+    if df_raw.empty:
+        return None
+    hdr = detect_header_row(df_raw, scan_rows=8)
+    headers = [clean_text(c) for c in df_raw.iloc[hdr].tolist()]
+    df = df_raw.iloc[hdr + 1:].reset_index(drop=True)
+    if len(headers) < df.shape[1]:
+        headers += [f"Unnamed_{i}" for i in range(df.shape[1] - len(headers))]
+    headers = headers[: df.shape[1]]
+    df.columns = headers
+
+    out = pd.DataFrame(index=df.index, columns=TARGET_COLS)
+    used = set()
+    for c in df.columns:
+        tgt = map_col(c)
+        if not tgt:
+            log_rows.append({"sheet": sname, "source_column": c, "mapped_to": ""})
+            continue
+        ser = _get_series(df, c)
+        if tgt == "פעולה":
+            if "פעולה" not in used:
+                out["פעולה"] = ser
+                used.add("פעולה")
+            else:
+                out["פעולה (2)"] = ser
+                used.add("פעולה (2)")
+        else:
+            out[tgt] = ser
+            used.add(tgt)
+        log_rows.append({"sheet": sname, "source_column": c, "mapped_to": tgt})
+    out["__source_sheet__"] = sname
+    return out
+
+
+def compiled_map_sheet(df_raw: pd.DataFrame, sname: str, log_rows: list[dict]) -> pd.DataFrame | None:
+    """המסלול של run_merge: iter_sheet_chunks על הגיליון, והמקטעים מאוחדים."""
+    parts = list(iter_sheet_chunks(CsvSheet(df_raw, sname), sname, log_rows))
+    return pd.concat(parts, ignore_index=True) if parts else None
+
+
+# ---------- דאטה סינתטי ----------
+
+def make_sheet(rows: int, copies: int, extra: int, seed: int = 0) -> pd.DataFrame:
+    """
+    גיליון גולמי (בלי כותרת של pandas): שורת כותרת עליונה, שורת הכותרות האמיתית, ומתחתיה הנתונים.
+    בעמודות הכפולות רוב התאים ריקים, כך שהאיחוד (הערך הלא־ריק הראשון) באמת עובד.
+    """
+    rng = np.random.default_rng(seed)
+    known = [c for c in TARGET_COLS if map_col(c)]
+    headers = known * copies + [f"עמודה נוספת {i}" for i in range(extra)]
+    values = rng.integers(0, 1000, size=(rows, len(headers))).astype(object)
+    values[rng.random(values.shape) < 0.6] = None
+    top = [["דוח רישיונות כריתה"] + [None] * (len(headers) - 1), headers]
+    return pd.DataFrame(top + values.tolist(), dtype=object)
+
+
+def _best(fn, df, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(df, "bench", [])
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser(description="בנצ'מרק למיפוי עמודות של גיליון רחב")
+    ap.add_argument("--rows", type=int, default=20_000, help="מספר שורות (ברירת מחדל: 20,000)")
+    ap.add_argument("--copies", type=int, default=20, help="כמה פעמים חוזרת כל כותרת מוכרת")
+    ap.add_argument("--extra", type=int, default=200, help="מספר עמודות לא ממופות")
+    ap.add_argument("--repeat", type=int, default=3, help="מספר חזרות; נלקח הזמן הטוב ביותר")
+    args = ap.parse_args()
+
+    df = make_sheet(args.rows, args.copies, args.extra)
+    log_old: list[dict] = []
+    log_new: list[dict] = []
+    old = legacy_map_sheet(df, "bench", log_old)
+    new = compiled_map_sheet(df, "bench", log_new)
+    old = old.astype(object).where(old.notna(), np.nan)
+    if log_old != log_new or not old.equals(new):
+        raise SystemExit("שגיאה: תוצאה שונה מהגרסה הקודמת")
+
+    t_old = _best(legacy_map_sheet, df, args.repeat)
+    t_new = _best(compiled_map_sheet, df, args.repeat)
+    print(f"rows={args.rows:,}  columns={df.shape[1]:,}  legacy={t_old:.3f}s  compiled={t_new:.3f}s  "
+          f"speedup=x{t_old / t_new:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+bench_reader.py — השוואת מנועי הקריאה של excel_backend (calamine מול openpyxl) על קובץ דוחות אמיתי.
+נמדדים שני המסלולים שבשימוש באפליקציה:
+  stream     — read_and_map: קריאה זורמת של כל הגליונות ומיפוי ל־TARGET_COLS (המיזוג, דף 2);
+  read_excel — pd.read_excel לכל הגליונות (דפי ה־BI וטבלאות הקודים).
+ובנוסף אותם נתונים כקובצי CSV (גיליון → קובץ, כמו ייצוא "CSV" מ־Excel) דרך read_and_map (csv_backend).
+לפני המדידה נבדק שהמסלול הזורם מחזיר באותם מנועים, וגם מה־CSV, את אותן שורות ואותו MappingLog.
+שימוש:
+  python benchmarks/bench_reader.py [--file "input_files/forestry_and_trees_report2024 דוחות כריתה אחוד.xlsx"] [--repeat 3]
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+from excel_backend import BACKEND_ENV, BACKENDS, HAVE_CALAMINE, open_workbook, read_excel  # noqa: E402
+from merge_engine import read_and_map  # noqa: E402
+
+DEFAULT_FILE = ROOT / "input_files" / "forestry_and_trees_report2024 דוחות כריתה אחוד.xlsx"
+
+
+def _stream(path: Path, backend: str) -> tuple[pd.DataFrame, list[dict]]:
+    # read_and_map פותח את החוברת דרך sheet_reader.open_workbook — המנוע נקבע כאן דרך משתנה הסביבה
+    os.environ[BACKEND_ENV] = backend
+    return read_and_map(str(path))
+
+
+def _export_csv(path: Path, out_dir: Path) -> list[Path]:
+    """כל גיליון בחוברת → קובץ CSV בשם הגיליון (utf-8-sig), לפי הסדר שבחוברת."""
+    wb = open_workbook(str(path), backend="calamine")
+    out: list[Path] = []
+    try:
+        for sname in wb.sheetnames:
+            target = out_dir / f"{sname}.csv"
+            with open(target, "w", encoding="utf-8-sig", newline="") as fh:
+                writer = csv.writer(fh)
+                for row in wb[sname].iter_rows(values_only=True):
+                    writer.writerow(["" if v is None else v for v in row])
+            out.append(target)
+    finally:
+        wb.close()
+    return out
+
+
+def _best(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser(description="בנצ'מרק מנועי קריאת Excel (calamine / openpyxl)")
+    ap.add_argument("--file", default=str(DEFAULT_FILE), help="חוברת דוחות כריתה (ברירת מחדל: הקובץ המאוחד ב־input_files)")
+    ap.add_argument("--repeat", type=int, default=3, help="מספר חזרות; נלקח הזמן הטוב ביותר")
+    args = ap.parse_args()
+
+    path = Path(args.file)
+    if not path.is_file():
+        raise SystemExit(f"שגיאה: הקובץ לא קיים: {path}")
+    if not HAVE_CALAMINE:
+        raise SystemExit("שגיאה: python-calamine לא מותקן — אין מול מה להשוות (pip install python-calamine)")
+
+    # נכונות: אותן שורות (לפי גיליון) ואותו מיפוי עמודות בשני המנועים
+    frames = {b: _stream(path, b) for b in BACKENDS}
+    (f_cal, log_cal), (f_opx, log_opx) = frames["calamine"], frames["openpyxl"]
+    if log_cal != log_opx:
+        raise SystemExit("שגיאה: MappingLog שונה בין המנועים")
+    if not f_cal["__source_sheet__"].equals(f_opx["__source_sheet__"]):
+        raise SystemExit("שגיאה: מספר השורות בגליונות שונה בין המנועים")
+    print(f"{path.name}: {len(f_cal):,} rows, {f_cal['__source_sheet__'].nunique()} sheets — identical layout in both backends")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_files = _export_csv(path, Path(tmp))
+        f_csv, log_csv = read_and_map(csv_files)
+        # מקובצי CSV שם הגיליון הוא שם הקובץ — זהה לשם הגיליון בחוברת
+        if log_csv != log_cal or not f_csv["__source_sheet__"].equals(f_cal["__source_sheet__"]):
+            raise SystemExit("שגיאה: קריאת ה־CSV שונה מקריאת החוברת")
+        t_csv = _best(lambda: read_and_map(csv_files), args.repeat)
+
+    timings: dict[tuple[str, str], float] = {}
+    for b in BACKENDS:
+        timings[("stream", b)] = _best(lambda: _stream(path, b), args.repeat)
+        timings[("read_excel", b)] = _best(lambda: read_excel(str(path), sheet_name=None, backend=b), args.repeat)
+
+    print(f"{'path':12s} {'openpyxl':>10s} {'calamine':>10s} {'speedup':>8s}")
+    for kind in ("stream", "read_excel"):
+        t_opx, t_cal = timings[(kind, "openpyxl")], timings[(kind, "calamine")]
+        print(f"{kind:12s} {t_opx:9.3f}s {t_cal:9.3f}s {'x' + format(t_opx / t_cal, '.1f'):>8s}")
+    t_opx, t_cal = timings[("stream", "openpyxl")], timings[("stream", "calamine")]
+    print(f"stream from CSV: {t_csv:.3f}s (x{t_opx / t_csv:.1f} vs openpyxl, x{t_cal / t_csv:.1f} vs calamine)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+bench_suite.py — מדידת ביצועים לכל שלב במיזוג ולכל צבירה בדפי ה־BI, מול קובץ baseline.
+העומס נוצר ב־workload.py (נשמר בתיקיית העבודה ונוצר מחדש רק כשהפרמטרים משתנים).
+כל מדידה רצה --repeat פעמים ונלקח הזמן הטוב ביותר; שלבים שרצים לכל גיליון (read_sheet וכו') מסוכמים.
+השוואה ל־baseline: מדידה שאיטית מ־baseline × tolerance + slack נחשבת רגרסיה — הסקריפט מדפיס אותה ויוצא עם קוד 1.
+שימוש:
+  python benchmarks/bench_suite.py [--rows 10000] [--repeat 3]               # מדידה + השוואה ל־baseline
+  python benchmarks/bench_suite.py --rows 10000 --update-baseline            # כתיבת baseline חדש (אחרי שיפור מכוון)
+ה־baseline תלוי במכונה: אחרי מעבר למכונה אחרת יש להריץ --update-baseline על הקוד הקיים לפני שמשווים.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import pandas as pd
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent))
+sys.path.insert(0, str(HERE))
+from bi_aggregations import (  # noqa: E402
+    APPEAL_AGGREGATIONS,
+    CUT_AGGREGATIONS,
+    filter_appeals,
+    filter_cuts,
+    prepare_appeals,
+    prepare_cuts,
+    read_appeals,
+)
+from layout_cache import LayoutCache  # noqa: E402
+from merge_engine import run_merge  # noqa: E402
+from workload import generate  # noqa: E402
+
+BASELINE_DIR = HERE / "baselines"
+DEFAULT_TOLERANCE = 1.5
+DEFAULT_SLACK = 0.05  # שניות; מונע "רגרסיות" ברעש של מדידות קצרות מאוד
+
+
+def _best(fn, repeat: int) -> tuple[float, object]:
+    best, out = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+# ---------- מדידות ----------
+
+def bench_merge(paths: dict, repeat: int, work: Path,
+                expected_duplicates: int | None = None) -> tuple[dict[str, float], pd.DataFrame]:
+    """
+    זמן לכל שלב ב־run_merge (מתוך MergeStats), הטוב ביותר מבין ההרצות.
+    כל הרצה מתחילה ממטמון פריסות ריק, כדי למדוד גם זיהוי כותרות ומיפוי.
+    expected_duplicates — מספר הכפילויות שנשתלו בעומס; אם ה־dedupe מצא מספר אחר, המדידה לא תקפה
+    (למשל שלב ה־dedupe נמדד על טבלה בלי כפילויות) והסקריפט נעצר.
+    """
+    best: dict[str, float] = {}
+    merged = None
+    for i in range(repeat):
+        layouts = LayoutCache(work / f"layouts_{i}_{time.time_ns()}.json")
+        # מצב drop במפורש (ברירת המחדל היא flag): כך נמדד ה־baseline, ו־cuts.prepare רץ על טבלה בלי כפילויות
+        result = run_merge(paths["main"], paths["cities"], paths["trees"], layouts=layouts, dedupe_mode="drop")
+        found = 0 if result.duplicates is None else int((~result.duplicates["__kept__"]).sum())
+        if expected_duplicates is not None and found != expected_duplicates:
+            raise SystemExit(f"שגיאה: נמצאו {found:,} כפילויות במקום {expected_duplicates:,} שנשתלו בעומס")
+        per_stage: dict[str, float] = defaultdict(float)
+        for row in result.stats:
+            per_stage[f"merge.{row['stage']}"] += row["seconds"] or 0.0
+        for k, v in per_stage.items():
+            best[k] = min(best.get(k, float("inf")), v)
+        merged = result.merged
+    return best, merged
+
+
+def bench_cuts_page(merged: pd.DataFrame, repeat: int, top_n: int = 10) -> dict[str, float]:
+    out: dict[str, float] = {}
+    out["cuts.prepare"], (df, city_col) = _best(lambda: prepare_cuts(merged), repeat)
+    out["cuts.filter"], dfv = _best(lambda: filter_cuts(df), repeat)
+    for name, fn in CUT_AGGREGATIONS.items():
+        out[f"cuts.{name}"], _ = _best(lambda: fn(dfv, top_n, city_col), repeat)
+    return out
+
+
+def bench_appeals_page(path: Path, repeat: int, top_n: int = 10) -> dict[str, float]:
+    out: dict[str, float] = {}
+    out["appeals.read"], (raw, col_map) = _best(lambda: read_appeals(path), repeat)
+    out["appeals.prepare"], ap = _best(lambda: prepare_appeals(raw, col_map), repeat)
+    out["appeals.filter"], apv = _best(lambda: filter_appeals(ap), repeat)
+    for name, fn in APPEAL_AGGREGATIONS.items():
+        out[f"appeals.{name}"], _ = _best(lambda: fn(apv, top_n), repeat)
+    return out
+
+
+# ---------- baseline ----------
+
+def compare(timings: dict[str, float], baseline: dict[str, float], tolerance: float, slack: float) -> list[str]:
+    """שמות המדידות שחרגו מ־baseline × tolerance + slack."""
+    return [k for k, base in baseline.items()
+            if k in timings and timings[k] > base * tolerance + slack]
+
+
+def print_table(timings: dict[str, float], baseline: dict[str, float], regressions: list[str]) -> None:
+    print(f"{'measurement':32s} {'seconds':>9s} {'baseline':>9s} {'ratio':>7s}")
+    for k, v in timings.items():
+        base = baseline.get(k)
+        ratio = f"x{v / base:.2f}" if base else ""
+        mark = "  <-- REGRESSION" if k in regressions else ""
+        print(f"{k:32s} {v:9.4f} {base if base is not None else float('nan'):9.4f} {ratio:>7s}{mark}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="בנצ'מרק שלבי המיזוג וצבירות דפי ה־BI מול baseline")
+    ap.add_argument("--rows", type=int, default=10_000, help="מספר שורות בדוח הכריתה הסינתטי (ברירת מחדל: 10,000)")
+    ap.add_argument("--sheets", type=int, default=12, help="מספר גליונות")
+    ap.add_argument("--appeals-rows", type=int, default=2000, help="מספר שורות בדוח הערעורים")
+    ap.add_argument("--repeat", type=int, default=3, help="מספר חזרות; נלקח הזמן הטוב ביותר")
+    ap.add_argument("--work-dir", default=None,
+                    help="תיקייה לקבצי העומס (ברירת מחדל: תיקייה זמנית קבועה לפי הפרמטרים)")
+    ap.add_argument("--baseline", default=None, help="קובץ baseline (ברירת מחדל: baselines/<rows>.json)")
+    ap.add_argument("--update-baseline", action="store_true", help="כתיבת המדידה הנוכחית כ־baseline")
+    ap.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="יחס מותר מול ה־baseline")
+    ap.add_argument("--slack", type=float, default=DEFAULT_SLACK, help="תוספת מוחלטת מותרת בשניות")
+    ap.add_argument("-o", "--output", default=None, help="נתיב לכתיבת תוצאות המדידה כ־JSON")
+    args = ap.parse_args()
+
+    work = Path(args.work_dir) if args.work_dir else (
+        Path(tempfile.gettempdir()) / f"forestry_bench_{args.rows}_{args.sheets}_{args.appeals_rows}")
+    stamp = work / "workload.json"
+    params = {"rows": args.rows, "sheets": args.sheets, "appeals_rows": args.appeals_rows, "seed": 0}
+    saved = json.loads(stamp.read_text(encoding="utf-8")) if stamp.is_file() else {}
+    if saved.get("params") == params and "info" in saved:
+        paths = {k: Path(v) for k, v in saved["paths"].items()}
+        info = saved["info"]
+    else:
+        t0 = time.perf_counter()
+        paths, info = generate(work, args.rows, args.sheets, args.appeals_rows)
+        stamp.write_text(json.dumps({"params": params, "paths": {k: str(v) for k, v in paths.items()},
+                                     "info": info}, ensure_ascii=False), encoding="utf-8")
+        print(f"workload generated in {time.perf_counter() - t0:.1f}s -> {work}")
+
+    timings, merged = bench_merge(paths, args.repeat, work, expected_duplicates=info["duplicates"])
+    timings.update(bench_cuts_page(merged, args.repeat))
+    timings.update(bench_appeals_page(paths["appeals"], args.repeat))
+    timings = {k: round(v, 5) for k, v in timings.items()}
+
+    report = {
+        "meta": {**params, "repeat": args.repeat, "python": platform.python_version(),
+                 "pandas": pd.__version__, "machine": platform.machine()},
+        "timings": timings,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=1), encoding="utf-8")
+
+    baseline_path = Path(args.baseline) if args.baseline else BASELINE_DIR / f"{args.rows}.json"
+    if args.update_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps(report, ensure_ascii=False, indent=1), encoding="utf-8")
+        print_table(timings, {}, [])
+        print(f"baseline written: {baseline_path}")
+        return
+
+    if not baseline_path.is_file():
+        print_table(timings, {}, [])
+        print(f"no baseline at {baseline_path} (run with --update-baseline to create one)")
+        return
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))["timings"]
+    regressions = compare(timings, baseline, args.tolerance, args.slack)
+    print_table(timings, baseline, regressions)
+    missing = sorted(set(baseline) - set(timings))
+    if missing:
+        print(f"measurements missing vs baseline: {', '.join(missing)}")
+    if regressions:
+        print(f"\n*** PERFORMANCE REGRESSION: {len(regressions)} measurement(s) slower than "
+              f"baseline x{args.tolerance} + {args.slack}s: {', '.join(regressions)} ***")
+        sys.exit(1)
+    print("\nOK — no regressions vs baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""
+workload.py — מחולל עומס סינתטי: חוברות דוחות כריתה מאוחדות, דוח ערעורים וקבצי רשימות קודים (ערים / עצים)
+באותה צורה כמו קבצי המקור ב־input_files, בכל גודל (10 אלף עד 5 מיליון שורות) ובכל מספר גליונות.
+מה שמכוסה, כדי שהמדידה תתרגל את כל המסלולים של צינור המיזוג:
+  • ארבע פריסות גיליון: משרד (כותרות באנגלית, קודים מספריים), רשות (טקסט + שורה ריקה אחרי הכותרת),
+    קק"ל (שמות TARGET_COLS בעברית, תאריכי serial של אקסל) ויעלה (כינויים מ־ALIASES, תאריכים dd/mm/yyyy);
+  • שורת כותרת מוזזת (0–4 שורות כותרת/ריקות מעליה);
+  • קודים מעורבים: מספר, מחרוזת '48.0' או שם בעברית באותה עמודה;
+  • רשומות כפולות בין גליונות (לבדיקת שלב ה־dedupe) — בכל הפריסות מספר הרישיון נכתב לעמודה שממופה
+    ל'מספר רישיון', כך שכל שורה שהועתקה נמצאת כפולה (מספרן מוחזר ב־'duplicates').
+שימוש:
+  python benchmarks/workload.py --rows 100000 [--sheets 12] [--appeals-rows 5000] [--seed 0] -o /tmp/workload
+"""
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import math
+import sys
+from pathlib import Path
+
+import numpy as np
+from openpyxl import Workbook
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from merge_engine import ACTION_MAP, REASON_MAP  # noqa: E402
+
+MAX_SHEET_ROWS = 1_000_000  # מגבלת אקסל היא 1,048,576; משאירים מקום לכותרות
+EXCEL_EPOCH = dt.datetime(1899, 12, 30)
+
+CITIES = [
+    "ירושלים", "תל אביב - יפו", "חיפה", "ראשון לציון", "פתח תקווה", "אשדוד", "נתניה", "באר שבע",
+    "חולון", "בני ברק", "רמת גן", "רחובות", "אשקלון", "בת ים", "כפר סבא", "הרצליה", "חדרה", "מודיעין",
+    "רעננה", "לוד", "רמלה", "נצרת", "גבעתיים", "קרית אתא", "עפולה", "יקנעם עילית", "גבעת שמואל", "סגולה",
+]
+SPECIES = [
+    ("עריים", "זית אירופי", "Olea europaea"), ("מחטניים", "אורן ירושלים", "Pinus halepensis"),
+    ("מחטניים", "ברוש מצוי", "Cupressus sempervirens"), ("עריים", "פיקוס השקמה", "Ficus sycomorus"),
+    ("עריים", "אקליפטוס המקור", "Eucalyptus camaldulensis"), ("דקליים", "תמר מצוי", "Phoenix dactylifera"),
+    ("עריים", "סיסם הודי", "Dalbergia sissoo"), ("עריים", "אלון מצוי", "Quercus calliprinos"),
+    ("עריים", "חרוב מצוי", "Ceratonia siliqua"), ("עריים", "מכנף נאה", "Tipuana tipu"),
+    ("עריים", "ינבוט לבן", "Prosopis alba"), ("עריים", "אשל הפרקים", "Tamarix aphylla"),
+    ("עריים", "פנסית דו-נוצתית", "Delonix regia"), ("עריים", "כליל החורש", "Cercis siliquastrum"),
+    ("עריים", "אלה אטלנטית", "Pistacia atlantica"), ("דקליים", "וושינגטוניה חסונה", "Washingtonia robusta"),
+]
+REGIONS = ["מרכז", "דרום (אזור)", "גליל עליון, מערבי וגולן (אזור)", "ג. מערבי - כרמל", "שפלה", "61", "02"]
+STREETS = ["הרצל", "ויצמן", "בן גוריון", "הדף היומי", "מוצקין", "דרך היוגב", "הנרקיס", "רוטשילד", "הגפן", "שיאון"]
+FIRST = ["אסתר", "משה", "עידו", "מיכל", "אלון", "נועה", "יוסף", "רחל", "חמזה", "אריאל", "צור", "דנה"]
+LAST = ["מירום", "כהן", "לוי", "יהב", "בן שלמה", "מזוז", "סקאי", "אבלס", "חוג'יראת", "ברקמן"]
+APPROVERS = ["פקיד/ת יערות אזורי - אריאל סקאי", "פקיד/ת יערות אזורי - צור אבלס", "מיכה סילקו", "אסתר מירום"]
+REASON_TEXT = ["בנייה", "בטיחות", "מחלת עץ", "עץ מת", "מטרד", "סכנה בריאותית", "הנחת קו מים"]
+
+# ---------- פריסות גיליון ----------
+# לכל פריסה: שמות הכותרות בקובץ, השדה הסינתטי שנכתב לכל עמודה, האם יש שורה ריקה אחרי הכותרת ואופן כתיבת התאריכים
+LAYOUTS = {
+    "office": {
+        "columns": [("License", "license"), ("Ezor", "region_code"), ("Data1Name", "owner"),
+                    ("Data1_ExeDate", "from"), ("Peula", "action_code"), ("Rname", "approver"),
+                    ("Siba", "reason_code"), ("SibaText", "reason_text"), ("City", "city_code"),
+                    ("street", "street"), ("homeNumber", "house"), ("Gush", "gush"), ("Helka", "helka"),
+                    ("FromDate", "from"), ("ToDate", "to"), ("Tree", "tree_mixed"), ("Quant", "count")],
+        "blank_after_header": False,
+        "dates": "datetime",
+    },
+    "municipal": {
+        "columns": [("כמות", "count"), ("מין העץ", "tree_name"), ("סיבה", "reason_text"),
+                    ("פעולה", "action_text"), ("מספר רישיון", "license"), ("ExeDate", "from"),
+                    ("מבקש", "owner"), ("CityName", "city_name")],
+        "blank_after_header": True,
+        "dates": "datetime",
+    },
+    "kkl": {
+        "columns": [("אזור", "region"), ("מספר רישיון", "license"), ("פעולה", "action_text"),
+                    ("שם בעל הרישיו", "owner"), ("סיבה", "reason_text"), ("סיבה  מילולית", "reason_text"),
+                    ("יישוב", "city_name"), ("רחוב", "street"), ("מס'", "house"), ("גוש", "gush"),
+                    ("חלקה", "helka"), ("מ-תאריך", "from"), ("עד-תאריך", "to"),
+                    ("שם   מאשר הרישיון", "approver"), ("שם   מין עץ", "tree_mixed"), ("מספר עצים", "count"),
+                    ("פעולה ", "empty"), ("הערות", "notes")],
+        "blank_after_header": False,
+        "dates": "serial",
+    },
+    "yaale": {
+        "columns": [("מספר רשיון", "license"), ("סטטוס רשיון", "status"), ("fromdate", "from"),
+                    ("todate", "to"), ("אזור", "region"), ("ישוב", "city_name"), ("מין העץ", "tree_name"),
+                    ("כמות עצים", "count"), ("מבקש", "owner"), ("רחוב ומספר בית", "address"),
+                    ("גוש", "gush"), ("חלקה", "helka"), ("תפקיד ושם המאשר", "approver")],
+        "blank_after_header": False,
+        "dates": "text",
+    },
+}
+
+
+# ---------- רשימות קודים ----------
+
+def city_codes() -> list[tuple[int, str]]:
+    return [(1000 + 7 * i, name) for i, name in enumerate(CITIES)]
+
+
+def tree_codes() -> list[tuple[int, str, str, str]]:
+    return [(4920 + i, kind, name, latin) for i, (kind, name, latin) in enumerate(SPECIES)]
+
+
+def write_city_list(path: Path) -> None:
+    """אותה צורה כמו 'רשימת ערים לפי קודים': כותרת, שורת שמות, שורת 0 ואז (מס', ישוב, סמל ישוב)."""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("רשימת ערים לפי קודים")
+    ws.append(["רשימת ערים לפי קודים"])
+    ws.append([None, "ישוב", "סמל ישוב"])
+    ws.append([0, None, None])
+    for i, (code, name) in enumerate(city_codes(), start=1):
+        ws.append([i, name, code])
+    wb.save(path)
+
+
+def write_tree_list(path: Path) -> None:
+    """אותה צורה כמו 'רשימת עצים לפי קודים': כותרת, שורה ריקה, כותרות ואז (קוד, סוג, שם, שם באנגלית, צורה)."""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("רשימת עצים לפי קודים")
+    ws.append(["רשימת עצים"])
+    ws.append([])
+    ws.append(["Tree", "סוג עץ", "שם עץ", "שם באנגלית", "growth_form"])
+    for code, kind, name, latin in tree_codes():
+        ws.append([code, kind, name, latin, "עץ רחב-עלים"])
+    wb.save(path)
+
+
+# ---------- דוחות כריתה ----------
+
+def _fields(rng: np.random.Generator, n: int, start_license: int) -> dict[str, np.ndarray]:
+    """ערכי השדות הסינתטיים לכל שורה (וקטורית); כל עמודה בפריסה לוקחת אחד מהם."""
+    cities = city_codes()
+    trees = tree_codes()
+    city_idx = rng.integers(0, len(cities), n)
+    tree_idx = rng.integers(0, len(trees), n)
+    action = rng.choice(list(ACTION_MAP), n, p=[0.8, 0.2])
+    reason = rng.choice(list(REASON_MAP), n)
+    start = np.datetime64("2010-01-01") + rng.integers(0, 15 * 365, n).astype("timedelta64[D]")
+    end = start + rng.integers(0, 3 * 365, n).astype("timedelta64[D]")
+
+    tree_code = np.array([trees[i][0] for i in tree_idx], dtype=object)
+    tree_name = np.array([trees[i][2] for i in tree_idx], dtype=object)
+    # קודים מעורבים: מספר / מחרוזת '4921.0' / שם בעברית
+    kind = rng.integers(0, 3, n)
+    tree_mixed = np.where(kind == 0, tree_code, np.where(kind == 1, [f"{c}.0" for c in tree_code], tree_name))
+
+    return {
+        "license": (start_license + np.arange(n)).astype(object),
+        "region": rng.choice(REGIONS, n).astype(object),
+        "region_code": rng.choice(["61", "02", "11", "08"], n).astype(object),
+        "owner": np.array([f"{FIRST[a]} {LAST[b]}" for a, b in
+                           zip(rng.integers(0, len(FIRST), n), rng.integers(0, len(LAST), n))], dtype=object),
+        "approver": rng.choice(APPROVERS, n).astype(object),
+        "action_code": action.astype(object),
+        "action_text": np.array([ACTION_MAP[a] for a in action], dtype=object),
+        "reason_code": reason.astype(object),
+        "reason_text": rng.choice(REASON_TEXT, n).astype(object),
+        "city_code": np.array([cities[i][0] for i in city_idx], dtype=object),
+        "city_name": np.array([cities[i][1] for i in city_idx], dtype=object),
+        "street": rng.choice(STREETS, n).astype(object),
+        "house": rng.integers(1, 200, n).astype(str).astype(object),
+        "address": np.array([f"{s} {h}" for s, h in zip(rng.choice(STREETS, n), rng.integers(1, 200, n))],
+                            dtype=object),
+        "gush": rng.integers(1000, 30000, n).astype(str).astype(object),
+        "helka": rng.integers(1, 400, n).astype(str).astype(object),
+        "tree_code": tree_code,
+        "tree_name": tree_name,
+        "tree_mixed": tree_mixed.astype(object),
+        "count": rng.integers(1, 40, n).astype(object),
+        "status": rng.choice(["מאושר", "מותנה בהיתר בנייה"], n).astype(object),
+        "notes": np.where(rng.random(n) < 0.1, "עצים קטנים", None).astype(object),
+        "empty": np.full(n, None, dtype=object),
+        "from": start,
+        "to": end,
+    }
+
+
+def _dates(values: np.ndarray, mode: str) -> np.ndarray:
+    if mode == "serial":
+        return ((values - np.datetime64("1899-12-30")) // np.timedelta64(1, "D")).astype(int).astype(object)
+    py = values.astype("datetime64[s]").astype(dt.datetime)
+    if mode == "text":
+        return np.array([d.strftime("%d/%m/%Y") for d in py], dtype=object)
+    return py.astype(object)
+
+
+def _sheet_rows(rng: np.random.Generator, layout: dict, n: int, start_license: int,
+                dup_pool: list | None, dup_rate: float) -> tuple[list[list], int]:
+    f = _fields(rng, n, start_license)
+    cols = []
+    for _, field in layout["columns"]:
+        v = f[field]
+        if field in ("from", "to"):
+            v = _dates(v, layout["dates"])
+        cols.append(v)
+    rows = [list(r) for r in zip(*cols)]
+    # רשומות כפולות: שורות שהועתקו מגיליון קודם באותה פריסה
+    planted = 0
+    if dup_pool and dup_rate > 0:
+        for i in np.flatnonzero(rng.random(n) < dup_rate):
+            rows[i] = list(dup_pool[rng.integers(0, len(dup_pool))])
+            planted += 1
+    return rows, planted
+
+
+def write_cutting_workbook(path: Path, rows: int, sheets: int = 12, seed: int = 0, dup_rate: float = 0.002) -> dict:
+    """
+    כותב חוברת דוחות כריתה מאוחדת (ללא גליונות רשימות). השורות מחולקות בין הגליונות, והפריסות מתחלפות.
+    מחזיר תיאור קצר: {'rows', 'sheets', 'layouts', 'duplicates'} — duplicates הוא מספר השורות שהועתקו,
+    כלומר מספר הרשומות שה־dedupe אמור למצוא.
+    """
+    sheets = max(sheets, math.ceil(rows / MAX_SHEET_ROWS), 1)
+    rng = np.random.default_rng(seed)
+    per_sheet = np.full(sheets, rows // sheets)
+    per_sheet[: rows % sheets] += 1
+    names = list(LAYOUTS)
+    pools: dict[str, list] = {}
+    used: dict[str, int] = {}
+
+    wb = Workbook(write_only=True)
+    license_no = 100_000
+    duplicates = 0
+    for s, n in enumerate(per_sheet):
+        kind = names[s % len(names)]
+        layout = LAYOUTS[kind]
+        city = CITIES[s % len(CITIES)]
+        base = f"{city} {kind}"[:28]
+        used[base] = used.get(base, 0) + 1
+        title = base if used[base] == 1 else f"{base} {used[base]}"
+        ws = wb.create_sheet(title)
+
+        # שורת כותרת מוזזת: 0–4 שורות של כותרת דוח / ריקות מעל
+        shift = int(rng.integers(0, 5))
+        for k in range(shift):
+            ws.append([f"דוח רישיונות כריתה והעתקה - {city}"] if k == 0 else [])
+        ws.append([h for h, _ in layout["columns"]])
+        if layout["blank_after_header"]:
+            ws.append([])
+
+        data, planted = _sheet_rows(rng, layout, int(n), license_no, pools.get(kind), dup_rate)
+        duplicates += planted
+        license_no += int(n)
+        for row in data:
+            ws.append(row)
+        pools[kind] = data[: min(len(data), 1000)]
+    wb.save(path)
+    return {"rows": int(rows), "sheets": int(sheets), "layouts": names, "duplicates": duplicates}
+
+
+# ---------- דוח ערעורים ----------
+
+def write_appeals_workbook(path: Path, rows: int, seed: int = 0) -> None:
+    """דוח ערעורים כמו ב־input_files: 5 שורות כותרת/ריקות, כותרות בשורה 6 ותאריכים dd.mm.yyyy."""
+    rng = np.random.default_rng(seed + 1)
+    regional = ["דחה בקשה לכריתת עץ 1", "דחה בקשה לכריתת 4 עצים", "אישר כריתת 9 עצים והעתקת עץ 1",
+                "אישר כריתת 23 עצים"]
+    gov = ["ערר התקבל", "ערר נדחה. עצים לשימור", "ערר התקבל חלקית. 5 עצים לכריתה והשאר לשימור",
+           "ערר נדחה. עץ לשימור", "העצים נכרתו טרם הדיון", "ערר התקבל. 3 עצים לשימור"]
+    reasons = ["בטיחות", "בניה", "מטרד", "בריאות", "נזק לתשתיות"]
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('דו"ח  עררים')
+    ws.append([])
+    ws.append([])
+    ws.append([None, None, 'דו"ח  עררים'])
+    ws.append([])
+    ws.append([])
+    ws.append(["מס'", "תאריך הגשת הערר", "ישוב", "סיבת הגשת הבקשה לכריתת העץ",
+               "החלטת פקיד יערות אזורי", "החלטת פקיד יערות ממשלתי", "הערות", "נשלח בתאריך"])
+    days = np.datetime64("2015-01-01") + rng.integers(0, 10 * 365, rows).astype("timedelta64[D]")
+    for i, d in enumerate(days.astype("datetime64[s]").astype(dt.datetime), start=1):
+        ws.append([
+            i,
+            d.strftime("%d.%m.%Y"),
+            f"{STREETS[rng.integers(0, len(STREETS))]} {int(rng.integers(1, 150))} {CITIES[rng.integers(0, len(CITIES))]}",
+            reasons[rng.integers(0, len(reasons))],
+            regional[rng.integers(0, len(regional))],
+            gov[rng.integers(0, len(gov))],
+            None,
+            None,
+        ])
+    wb.save(path)
+
+
+def generate(out_dir: str | Path, rows: int, sheets: int = 12, appeals_rows: int = 2000,
+             seed: int = 0) -> tuple[dict[str, Path], dict]:
+    """
+    כותב את כל קבצי העומס לתיקייה ומחזיר (הנתיבים: main / cities / trees / appeals,
+    תיאור חוברת הכריתה — ראו write_cutting_workbook).
+    """
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    paths = {
+        "main": out / f"cuts_{rows}.xlsx",
+        "cities": out / "cities.xlsx",
+        "trees": out / "trees.xlsx",
+        "appeals": out / f"appeals_{appeals_rows}.xlsx",
+    }
+    info = write_cutting_workbook(paths["main"], rows, sheets=sheets, seed=seed)
+    write_city_list(paths["cities"])
+    write_tree_list(paths["trees"])
+    write_appeals_workbook(paths["appeals"], appeals_rows, seed=seed)
+    return paths, info
+
+
+def main():
+    ap = argparse.ArgumentParser(description="מחולל עומס סינתטי לדוחות כריתה וערעורים")
+    ap.add_argument("--rows", type=int, default=100_000, help="מספר שורות בדוח הכריתה (10,000 עד 5,000,000)")
+    ap.add_argument("--sheets", type=int, default=12, help="מספר גליונות (גדל אוטומטית מעל מיליון שורות לגיליון)")
+    ap.add_argument("--appeals-rows", type=int, default=2000, help="מספר שורות בדוח הערעורים")
+    ap.add_argument("--seed", type=int, default=0, help="seed למחולל (אותו seed — אותם קבצים)")
+    ap.add_argument("-o", "--output", required=True, help="תיקיית הפלט")
+    args = ap.parse_args()
+    paths, info = generate(args.output, args.rows, args.sheets, args.appeals_rows, args.seed)
+    for kind, p in paths.items():
+        print(f"{kind:8s} {p}")
+    print(f"{info['duplicates']:,} רשומות כפולות נשתלו")
+
+
+if __name__ == "__main__":
+    main()
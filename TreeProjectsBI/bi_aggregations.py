@@ -0,0 +1,702 @@
+# -*- coding: utf-8 -*-
+"""
+bi_aggregations.py — הכנת הדאטה והחישובים של דפי ה־BI (כריתות / ערעורים), ללא תלות ב־Streamlit.
+הדפים מציגים את התוצאות; כאן נמצא כל מה שרץ על הדאטה, כך שאפשר למדוד כל צבירה בנפרד
+(benchmarks/bench_suite.py) ולהשתמש בה גם מחוץ לדפים.
+"""
+from __future__ import annotations
+
+import io
+import re
+
+import numpy as np
+import pandas as pd
+
+from date_engine import parse_dates
+from excel_backend import read_excel
+from lut_compiler import load_city_table, load_tree_table, lookup_codes
+from merge_stats import report_progress
+
+SUCCESS_STATUSES = ["התקבל", "התקבל חלקית"]
+
+
+# ---------- עוזרים כלליים ----------
+
+def _norm(s):
+    if s is None or pd.isna(s):
+        return ""
+    return str(s).replace("\u200f", "").replace("\u200e", "").strip()
+
+
+def ensure_bool(series: pd.Series) -> pd.Series:
+    """ממיר עמודות בוליאניות ('TRUE'/'FALSE'/0/1 וכו') ל־bool אמיתי."""
+    if series.dtype == bool:
+        return series.fillna(False)
+    s = series.astype(str).str.strip().str.upper()
+    return s.map({"TRUE": True, "FALSE": False, "1": True, "0": False}).fillna(False)
+
+
+def map_values(s: pd.Series, fn) -> pd.Series:
+    """
+    כמו s.map(fn); בעמודת category (למשל מקובץ Parquet או מהסכמה של merge_engine) הפונקציה רצה
+    פעם אחת לכל קטגוריה והתוצאה נשארת category — כך שה־groupby בהמשך עובד על קודים ולא על מחרוזות.
+    """
+    if not isinstance(s.dtype, pd.CategoricalDtype):
+        return s.map(fn)
+    mapped = [fn(c) for c in s.cat.categories] + [fn(np.nan)]
+    new_codes, uniques = pd.factorize(pd.Series(mapped, dtype=object), sort=True)
+    codes = s.cat.codes.to_numpy()
+    codes = np.where(codes < 0, len(mapped) - 1, codes)
+    return pd.Series(pd.Categorical.from_codes(new_codes[codes], categories=uniques), index=s.index)
+
+
+def pick_first_existing(df: pd.DataFrame, candidates) -> str | None:
+    """מחזיר את שם העמודה הראשון שקיים מתוך רשימה."""
+    for c in candidates:
+        if c in df.columns:
+            return c
+    return None
+
+
+def decode_codes(s: pd.Series, lut: dict[int, str] | None) -> pd.Series:
+    """קודים מספריים שנשארו בעמודה (למשל קובץ שמוזג בלי קובצי קודים) → שמות, לפי טבלת קודים מקומפלת (lut_compiler)."""
+    out = lookup_codes(s, lut) if lut else None
+    return s if out is None else pd.Series(out, index=s.index, name=s.name)
+
+
+# ===================== דוחות כריתה =====================
+
+CUT_TREE_COL = "שם מין עץ (BI)"
+CUT_COUNT_COL = "מספר עצים (BI)"
+
+
+# עמודות המקור של כל שדה, לפי סדר עדיפות
+CITY_COLS = ["יישוב", "ישוב", "עיר"]
+TREE_COLS = ["שם   מין עץ", "שם מין עץ", "מין עץ"]
+COUNT_COLS = ["מספר עצים", "מספר   עצים", "כמות עצים"]
+DATE_COLS = ["מ-תאריך", "מתאריך", "תאריך", "עד-תאריך"]
+CUT_FLAG_COLS = ["__is_cut__", "is_cut"]
+MOVE_FLAG_COLS = ["__is_move__", "is_move"]
+ACTION_TEXT_COLS = ["פעולה_מפוענחת", "פעולה"]
+REASON_TEXT_COLS = ["סיבה_מפוענחת", "סיבה", "סיבה  מילולית"]
+CUT_SOURCE_COLS = (
+    ["__is_dup__"] + CITY_COLS + TREE_COLS + COUNT_COLS + DATE_COLS
+    + CUT_FLAG_COLS + MOVE_FLAG_COLS + ACTION_TEXT_COLS + REASON_TEXT_COLS
+)
+
+
+def _drop_dups(df: pd.DataFrame) -> pd.DataFrame:
+    # רשומות שסומנו במיזוג ככפולות (מצב flag) לא נספרות במדדים
+    if "__is_dup__" in df.columns:
+        return df[~ensure_bool(df["__is_dup__"])]
+    return df
+
+
+def cut_fields(
+    df: pd.DataFrame,
+    city_lut: dict[int, str] | None = None,
+    tree_lut: dict[int, str] | None = None,
+) -> tuple[dict[str, pd.Series], str]:
+    """
+    העמודות הנגזרות של דוחות הכריתה (יישוב, מין עץ, מספר עצים, תאריך/שנה, דגלים, פעולה/סיבה),
+    מחושבות מתוך df בלי לשנות אותו. מחזיר ({שם עמודה: Series}, שם עמודת היישוב המקורית).
+    בלי עמודת יישוב — ValueError.
+    """
+    out = {}
+
+    # שם יישוב
+    city_col = pick_first_existing(df, CITY_COLS)
+    if city_col is None:
+        raise ValueError("לא נמצאה עמודת יישוב ('יישוב' / 'ישוב' / 'עיר') בקובץ.")
+    out["יישוב_cat"] = map_values(decode_codes(df[city_col], city_lut), lambda x: _norm(x) or "לא ידוע")
+
+    # שם מין עץ – אם אין, ניצור עמודה ריקה כדי שהקוד ישאר אחיד
+    tree_col = pick_first_existing(df, TREE_COLS)
+    out[CUT_TREE_COL] = (pd.Series("", index=df.index) if tree_col is None
+                         else map_values(decode_codes(df[tree_col], tree_lut), _norm))
+
+    # מספר עצים – אם אין עמודה מתאימה, נניח 1 לכל רשומה
+    count_col = pick_first_existing(df, COUNT_COLS)
+    if count_col is None:
+        out[CUT_COUNT_COL] = pd.Series(1, index=df.index)
+    else:
+        counts = df[count_col]
+        if isinstance(counts.dtype, pd.CategoricalDtype):
+            counts = counts.astype(object)
+        out[CUT_COUNT_COL] = (
+            pd.to_numeric(counts, errors="coerce")
+              .astype(float)
+              .fillna(1)
+              .clip(lower=1)
+        )
+
+    # תאריכים: נשתמש ב"מ-תאריך" כבסיס; אם אין – "עד-תאריך"
+    date_col = pick_first_existing(df, DATE_COLS)
+    if date_col:
+        out["תאריך"] = parse_dates(df[date_col])
+        out["שנה"] = out["תאריך"].dt.year.astype("Int64")
+    else:
+        out["תאריך"] = pd.Series(pd.NaT, index=df.index)
+        out["שנה"] = pd.Series(pd.NA, index=df.index)
+
+    # פעולה כריתה / העתקה – מתוך הדגלים שהוספנו במיזוג
+    cut_col = pick_first_existing(df, CUT_FLAG_COLS)
+    move_col = pick_first_existing(df, MOVE_FLAG_COLS)
+    out["__is_cut__"] = ensure_bool(df[cut_col]) if cut_col else pd.Series(False, index=df.index)
+    out["__is_move__"] = ensure_bool(df[move_col]) if move_col else pd.Series(False, index=df.index)
+
+    # פעולה/סיבה מפוענחות – אם קיימות
+    action_text_col = pick_first_existing(df, ACTION_TEXT_COLS)
+    reason_text_col = pick_first_existing(df, REASON_TEXT_COLS)
+
+    out["פעולה BI"] = pd.Series(np.select(
+        [out["__is_cut__"], out["__is_move__"]],
+        ["כריתה", "העתקה/שימור"],
+        default=df[action_text_col].astype(str) if action_text_col else "לא ידוע",
+    ), index=df.index)
+    out["סיבה BI"] = (map_values(df[reason_text_col], lambda x: _norm(str(x))) if reason_text_col
+                     else pd.Series("", index=df.index))
+    return out, city_col
+
+
+def prepare_cuts(
+    df_raw: pd.DataFrame,
+    city_lut: dict[int, str] | None = None,
+    tree_lut: dict[int, str] | None = None,
+) -> tuple[pd.DataFrame, str]:
+    """
+    עיבוד בסיסי של קובץ המיזוג לדף ה־BI: כל עמודות הקובץ ועוד העמודות של cut_fields.
+    city_lut / tree_lut — טבלאות הקודים (CodeTable.lut); קודים שנשארו ביישוב / במין העץ מתורגמים לשמות.
+    מחזיר (DataFrame, שם עמודת היישוב המקורית). בלי עמודת יישוב — ValueError.
+    """
+    df = _drop_dups(df_raw.copy())
+    fields, city_col = cut_fields(df, city_lut, tree_lut)
+    for col, values in fields.items():
+        df[col] = values
+    return df, city_col
+
+
+def read_cuts(f, name: str = "") -> pd.DataFrame:
+    """
+    קובץ הכריתות המאוחד: Parquet נקרא ישירות עם הטיפוסים שנשמרו; ב־Excel — הגיליון 'Merged', ואם אין — הגיליון הראשון.
+    """
+    name = name or getattr(f, "name", "") or ""
+    if name.lower().endswith(".parquet"):
+        return pd.read_parquet(f)
+    try:
+        return read_excel(f, sheet_name="Merged")
+    except Exception:
+        return read_excel(f, sheet_name=0)
+
+
+def load_cuts(
+    data: bytes,
+    name: str,
+    city_codes: bytes | None = None,
+    tree_codes: bytes | None = None,
+) -> tuple[pd.DataFrame, str]:
+    """
+    קריאה + prepare_cuts מתוך ה־bytes של הקובץ — עבודת הרקע של דף הכריתות (ראו job_pool).
+    city_codes / tree_codes — קובצי הקודים (אופציונלי); נטענים כטבלאות מקומפלות דרך lut_compiler.
+    חסרות עמודות חיוניות — ValueError, עם רשימת העמודות שנקראו.
+    """
+    report_progress(0.05, "קריאת הקובץ")
+    df_raw = read_cuts(io.BytesIO(data), name)
+    city_lut = load_city_table(city_codes).lut if city_codes else None
+    tree_lut = load_tree_table(tree_codes).lut if tree_codes else None
+    report_progress(0.6, "הכנת הנתונים")
+    try:
+        return prepare_cuts(df_raw, city_lut, tree_lut)
+    except ValueError as e:
+        raise ValueError(f"{e}\nעמודות שנקראו: {', '.join(map(str, df_raw.columns))}") from None
+
+
+def filter_cuts(df: pd.DataFrame, years=(), cities=(), trees=(), actions=(), exclude_cities=()) -> pd.DataFrame:
+    """המסננים של הדף; רשימה ריקה — בלי סינון."""
+    mask = pd.Series(True, index=df.index)
+    if years:
+        mask &= df["שנה"].isin(years)
+    if cities:
+        mask &= df["יישוב_cat"].isin(cities)
+    if trees:
+        mask &= df[CUT_TREE_COL].isin(trees)
+    if actions:
+        mask &= df["פעולה BI"].isin(actions)
+    dfv = df[mask].copy()
+    if exclude_cities:
+        dfv = dfv[~dfv["יישוב_cat"].isin(exclude_cities)]
+    return dfv
+
+
+def cut_kpis(dfv: pd.DataFrame) -> dict:
+    total_trees = int(dfv[CUT_COUNT_COL].sum())
+    total_cuts = int(dfv.loc[dfv["__is_cut__"], CUT_COUNT_COL].sum())
+    total_moves = int(dfv.loc[dfv["__is_move__"], CUT_COUNT_COL].sum())
+    return {
+        "total_trees": total_trees,
+        "total_cuts": total_cuts,
+        "total_moves": total_moves,
+        "total_records": len(dfv),
+        "cut_ratio": (total_cuts / total_trees * 100) if total_trees else 0,
+        "move_ratio": (total_moves / total_trees * 100) if total_trees else 0,
+        "unique_cities": dfv["יישוב_cat"].nunique(dropna=True),
+        "unique_trees": dfv[CUT_TREE_COL].nunique(dropna=True),
+    }
+
+
+def _top_sum(df: pd.DataFrame, by: str, top_n: int, label: str, value: str) -> pd.DataFrame:
+    return (
+        df.groupby(by, observed=True)[CUT_COUNT_COL]
+          .sum()
+          .sort_values(ascending=False)
+          .head(top_n)
+          .reset_index()
+          .rename(columns={by: label, CUT_COUNT_COL: value})
+    )
+
+
+def top_cities_cuts(dfv: pd.DataFrame, top_n: int) -> pd.DataFrame:
+    return _top_sum(dfv[dfv["__is_cut__"]], "יישוב_cat", top_n, "יישוב", "עצים שנכרתו")
+
+
+def top_species_cuts(dfv: pd.DataFrame, top_n: int) -> pd.DataFrame:
+    return _top_sum(dfv[dfv["__is_cut__"]], CUT_TREE_COL, top_n, "מין עץ", "עצים שנכרתו")
+
+
+def top_cities_moves(dfv: pd.DataFrame, top_n: int) -> pd.DataFrame:
+    return _top_sum(dfv[dfv["__is_move__"]], "יישוב_cat", top_n, "יישוב", "עצים שהועתקו")
+
+
+def cut_reasons(dfv: pd.DataFrame) -> pd.DataFrame:
+    """עצים שנכרתו לפי סיבה (רק שורות כריתה), מהגדול לקטן."""
+    return (
+        dfv[dfv["__is_cut__"]].groupby("סיבה BI", observed=True)[CUT_COUNT_COL]
+          .sum()
+          .reset_index()
+          .rename(columns={CUT_COUNT_COL: "עצים"})
+          .sort_values("עצים", ascending=False)
+    )
+
+
+def trend_by_year(dfv: pd.DataFrame) -> pd.DataFrame:
+    return (
+        dfv.assign(שנה=dfv["שנה"].astype("Int64"))
+           .groupby(["שנה", "פעולה BI"])[CUT_COUNT_COL]
+           .sum()
+           .reset_index()
+           .sort_values("שנה")
+    )
+
+
+def sum_by_action(dfv: pd.DataFrame) -> pd.DataFrame:
+    return (
+        dfv.groupby("פעולה BI")[CUT_COUNT_COL]
+           .sum()
+           .reset_index()
+           .rename(columns={CUT_COUNT_COL: "עצים"})
+    )
+
+
+def top_licenses(dfv: pd.DataFrame, city_col: str, n: int = 20) -> pd.DataFrame:
+    """הרישיונות הגדולים לפי מספר עצים, רק עם העמודות השימושיות להצגה."""
+    top = dfv.sort_values(CUT_COUNT_COL, ascending=False).head(n).copy()
+    cols = [c for c in ["אזור", "מספר רישיון", city_col, CUT_TREE_COL,
+                        CUT_COUNT_COL, "פעולה BI", "סיבה BI", "תאריך", "__source_sheet__"]
+            if c in top.columns]
+    return top[cols] if cols else top
+
+
+# צבירות הדף לפי סדר הופעתן (למדידה ב־bench_suite)
+CUT_AGGREGATIONS = {
+    "kpis": lambda dfv, top_n, city_col: cut_kpis(dfv),
+    "top_cities_cuts": lambda dfv, top_n, city_col: top_cities_cuts(dfv, top_n),
+    "top_species_cuts": lambda dfv, top_n, city_col: top_species_cuts(dfv, top_n),
+    "top_cities_moves": lambda dfv, top_n, city_col: top_cities_moves(dfv, top_n),
+    "cut_reasons": lambda dfv, top_n, city_col: cut_reasons(dfv),
+    "trend_by_year": lambda dfv, top_n, city_col: trend_by_year(dfv),
+    "sum_by_action": lambda dfv, top_n, city_col: sum_by_action(dfv),
+    "top_licenses": lambda dfv, top_n, city_col: top_licenses(dfv, city_col),
+}
+
+
+# ---------- טבלאות מסכמות (גליונות Pivot בקובץ המיזוג) ----------
+# גיליון → עמודות הקיבוץ (אחרי prepare_cuts) ושמן בגיליון. אותן הגדרות כמו בדף, כך שהמספרים זהים לדשבורד.
+PIVOT_SHEETS = {
+    "Pivot_YearCityAction": {"שנה": "שנה", "יישוב_cat": "יישוב", "פעולה BI": "פעולה"},
+    "Pivot_SpeciesAction": {CUT_TREE_COL: "מין עץ", "פעולה BI": "פעולה"},
+    "Pivot_Reason": {"סיבה BI": "סיבה", "פעולה BI": "פעולה"},
+}
+PIVOT_RECORDS = "רשומות"
+PIVOT_TREES = "עצים"
+
+
+def _order_pivots(pivots: dict[str, pd.DataFrame]) -> dict[str, pd.DataFrame]:
+    """שנה × יישוב לפי הסדר הטבעי; מין עץ / סיבה מהגדול לקטן."""
+    out = {}
+    for sheet, df in pivots.items():
+        if "שנה" in df.columns:
+            df = df.sort_values(["שנה", "יישוב", "פעולה"], kind="stable", na_position="last")
+        else:
+            df = df.sort_values(PIVOT_TREES, ascending=False, kind="stable")
+        out[sheet] = df.reset_index(drop=True)
+    return out
+
+
+def build_pivots(df_raw: pd.DataFrame) -> dict[str, pd.DataFrame]:
+    """
+    הטבלאות המסכמות שנכתבות לקובץ המיזוג (ראו PIVOT_SHEETS): מספר רשומות ועצים לכל צירוף.
+    רשומות שסומנו ככפולות לא נספרות (כמו בדף). מחזיר {שם גיליון: DataFrame}.
+    רץ על הטבלה הממוזגת המלאה, אז לא מעתיקים אותה (כמו prepare_cuts): רק עמודות המקור של השדות
+    נלקחות, ומהשדות נבנית טבלה צרה עם עמודות הקיבוץ ומספר העצים בלבד.
+    """
+    view = _drop_dups(df_raw[[c for c in df_raw.columns if c in CUT_SOURCE_COLS]])
+    fields, _ = cut_fields(view)
+    needed = {c for keys in PIVOT_SHEETS.values() for c in keys} | {CUT_COUNT_COL}
+    df = pd.DataFrame({c: v for c, v in fields.items() if c in needed}, index=view.index)
+    out = {}
+    for sheet, keys in PIVOT_SHEETS.items():
+        g = df.groupby(list(keys), observed=True, dropna=False)[CUT_COUNT_COL].agg(["size", "sum"])
+        out[sheet] = g.reset_index().rename(columns={**keys, "size": PIVOT_RECORDS, "sum": PIVOT_TREES})
+    return _order_pivots(out)
+
+
+def merge_pivots(parts: list[dict[str, pd.DataFrame]]) -> dict[str, pd.DataFrame]:
+    """מאחד טבלאות מסכמות שחושבו על מקטעים נפרדים (מיזוג out-of-core) — הספירות והסכומים מצטברים."""
+    out = {}
+    for sheet, keys in PIVOT_SHEETS.items():
+        frames = [p[sheet] for p in parts if sheet in p]
+        if not frames:
+            continue
+        by = list(keys.values())
+        # קטגוריות שונות בכל מקטע → object, כדי שהאיחוד לא יאבד ערכים
+        merged = pd.concat(
+            [f.astype({c: object for c in by if isinstance(f[c].dtype, pd.CategoricalDtype)}) for f in frames],
+            ignore_index=True,
+        )
+        out[sheet] = merged.groupby(by, dropna=False)[[PIVOT_RECORDS, PIVOT_TREES]].sum().reset_index()
+    return _order_pivots(out)
+
+
+def subtract_pivots(pivots: dict[str, pd.DataFrame], removed: dict[str, pd.DataFrame]) -> dict[str, pd.DataFrame]:
+    """
+    מוריד מטבלאות מסכמות מצטברות את התרומה של רשומות שהוצאו אחרי הצבירה (למשל כפילויות בין גליונות
+    שנמצאו רק בטבלה המאוחדת, במיזוג המצטבר). צירוף שלא נשארו בו רשומות — נמחק.
+    """
+    negated = {
+        sheet: t.assign(**{PIVOT_RECORDS: -t[PIVOT_RECORDS], PIVOT_TREES: -t[PIVOT_TREES]})
+        for sheet, t in removed.items()
+    }
+    out = merge_pivots([pivots, negated])
+    return _order_pivots({sheet: t[t[PIVOT_RECORDS] != 0] for sheet, t in out.items()})
+
+
+# ===================== דוחות ערעורים =====================
+
+def _clean_cat_value(v):
+    if pd.isna(v):
+        return None
+    s = _norm(v)
+    if re.fullmatch(r"-?\d+(\.\d+)?", s):
+        try:
+            f = float(s)
+            if f.is_integer():
+                s = str(int(f))
+        except Exception:
+            pass
+    return s or None
+
+
+def normalize_cat_col(series: pd.Series) -> pd.Series:
+    return series.map(_clean_cat_value) if series is not None else pd.Series([None])
+
+
+CITY_STOPWORDS = {
+    "רחוב", "רח", "שדרות", "שד", "דרך", "כיכר", "ככר", "סמטה", "שכונה", "שכ",
+    "מס", "בית", "בניין", "בנין", "דירה", "ד", "מס'", "מס’"
+}
+
+
+def extract_city(addr):
+    """מנסה לחלץ את העיר מהשדה 'ישוב/כתובת' (למשל 'הדף היומי 1 ירושלים' → 'ירושלים')."""
+    if pd.isna(addr):
+        return None
+    s = _norm(addr)
+    # הסר מספרים ותווי מפריד בסיסיים, ואחד רווחים
+    s = re.sub(r"[0-9\-_,./]+", " ", s)
+    s = re.sub(r"\s+", " ", s).strip()
+    if not s:
+        return None
+    toks = [t for t in s.split(" ") if t and t not in CITY_STOPWORDS]
+    if not toks:
+        return None
+    city = toks[-1]
+    # נירמולים נפוצים
+    city = (city.replace("ת\"א", "תל אביב")
+                .replace("תל-אביב", "תל אביב")
+                .replace("ירושלם", "ירושלים"))
+    return city
+
+
+def _city_key(s) -> str:
+    s = re.sub(r"[0-9\-_,./]+", " ", _norm(s))
+    return re.sub(r"\s+", " ", s).strip()
+
+
+def match_cities(addrs: pd.Series, names) -> pd.Series:
+    """
+    יישוב מתוך 'ישוב/כתובת' לפי רשימת היישובים הידועים (עמודת 'name' בטבלת הקודים של הערים):
+    הרצף הארוך ביותר של מילים שלמות בכתובת שהוא שם יישוב ('קרית שמונה' ולא רק 'שמונה');
+    כתובת בלי יישוב מוכר — extract_city. כל כתובת שונה נבדקת פעם אחת.
+    """
+    known = {}
+    for n in names:
+        k = _city_key(n)
+        if k:
+            known.setdefault(k, _norm(n))
+    max_words = max((k.count(" ") + 1 for k in known), default=0)
+
+    def one(addr):
+        toks = _city_key(addr).split(" ")
+        for n in range(min(max_words, len(toks)), 0, -1):
+            for i in range(len(toks) - n, -1, -1):
+                hit = known.get(" ".join(toks[i:i + n]))
+                if hit:
+                    return hit
+        return extract_city(addr)
+
+    uniq = addrs.dropna().unique()
+    return addrs.map(dict(zip(uniq, map(one, uniq))))
+
+
+def detect_appeals_header_row(df_headless: pd.DataFrame, scan_rows: int = 12) -> int:
+    """
+    בוחר את שורת הכותרת הסבירה ביותר מתוך השורות הראשונות.
+    נותן ניקוד למילים כמו תאריך/מועד/ישוב/יישוב/עיר/סיבה/החלטה/הערות/מס'.
+    """
+    kws = {
+        "תאריך", "מועד", "ישוב", "יישוב", "עיר", "כתובת", "סיבת", "סיבה", "החלטת פקיד",
+        "פקיד יערות אזורי", "אזורי", "פקיד יערות ממשלתי", "ממשלתי", "הערות", "מס'", "מספר"
+    }
+    best_row, best_score = 0, -1
+    for r in range(min(scan_rows, len(df_headless))):
+        row_vals = [_norm(v) for v in df_headless.iloc[r].tolist()]
+        non_empty = sum(1 for v in row_vals if v)
+        hits = sum(1 for v in row_vals if any(k in v for k in kws))
+        score = hits * 5 + non_empty
+        if score > best_score:
+            best_score, best_row = score, r
+    return best_row
+
+
+def build_col_map(df_cols) -> dict:
+    """מיפוי עמודות גמיש → מפתחות פנימיים: date, city, reason, regional, gov, notes, idx."""
+    col_map_local = {}
+    for c in df_cols:
+        n = _norm(c)
+        if any(k in n for k in ["מס'", "מספר"]):                 col_map_local.setdefault("idx", c)
+        if ("תאריך" in n) or ("מועד" in n):                      col_map_local.setdefault("date", c)
+        if any(k in n for k in ["ישוב", "יישוב", "עיר", "כתובת"]): col_map_local.setdefault("city", c)
+        if ("סיבת הגשת" in n) or ("סיבה" in n):                  col_map_local.setdefault("reason", c)
+        if ("פקיד יערות אזורי" in n) or ("אזורי" in n):          col_map_local.setdefault("regional", c)
+        if ("פקיד יערות ממשלתי" in n) or ("ממשלתי" in n):        col_map_local.setdefault("gov", c)
+        if "הערות" in n:                                          col_map_local.setdefault("notes", c)
+    return col_map_local
+
+
+def read_appeals(f) -> tuple[pd.DataFrame, dict]:
+    """
+    קריאת קובץ הערעורים ומיפוי העמודות, כולל איתור כותרת אם אינה בשורה הראשונה.
+    מחזיר (DataFrame, col_map). חסרות עמודות date/city — ValueError.
+    """
+    appeals_raw = read_excel(f, sheet_name=0)
+    col_map = build_col_map(appeals_raw.columns)
+
+    # אם חסר date/city — נסה איתור שורת כותרת אוטומטי
+    if not all(k in col_map for k in ("date", "city")):
+        if hasattr(f, "seek"):
+            f.seek(0)
+        appeals_h = read_excel(f, sheet_name=0, header=None)
+        hdr = detect_appeals_header_row(appeals_h, scan_rows=12)
+        # הגדר כותרות מתוך השורה שנמצאה, וקח את הטבלה מתחת
+        new_cols = [_norm(x) if x is not None else "" for x in appeals_h.iloc[hdr].tolist()]
+        appeals_h.columns = new_cols
+        appeals_h = appeals_h.iloc[hdr + 1:].reset_index(drop=True)
+        # הסר כפילויות שמות עמודות
+        appeals_h = appeals_h.loc[:, ~appeals_h.columns.duplicated()]
+        appeals_h = appeals_h.dropna(how="all")
+        appeals_raw = appeals_h
+        col_map = build_col_map(appeals_raw.columns)
+
+    missing = [k for k in ("date", "city") if k not in col_map]
+    if missing:
+        raise ValueError(
+            "חסרות עמודות חיוניות בקובץ: " + ", ".join(missing)
+            + "\nעמודות שנקראו בפועל:\n" + ", ".join(map(str, appeals_raw.columns))
+        )
+    return appeals_raw, col_map
+
+
+def map_reason(s):
+    """נירמול סיבת ערעור."""
+    s = str(s)
+    if re.search(r"בטיחות", s):     return "בטיחות"
+    if re.search(r"בריאות", s):     return "בריאות"
+    if re.search(r"מטרד", s):       return "מטרד"
+    if re.search(r"בניה|בנייה", s): return "בנייה"
+    return "אחר"
+
+
+def map_status(row):
+    """סטטוס ערעור מתוך החלטת הפקיד הממשלתי וההערות."""
+    t = f"{row['החלטה ממשלתי']} {row['הערות']}"
+    t = t.replace("\u200f", "").replace("\u200e", "")
+    if re.search(r"נכרתו.*טרם|נכרתו.*דיון|נכרת.*טרם", t): return "לא נדון (כבר נכרת)"
+    if re.search(r"ערר\s*התקבל\s*חלקית", t): return "התקבל חלקית"
+    if re.search(r"ערר\s*התקבל", t):         return "התקבל"
+    if re.search(r"ערר\s*נדחה", t):           return "נדחה"
+    # fallback
+    if re.search(r"התקבל\s*חלקית", t): return "התקבל חלקית"
+    if re.search(r"התקבל", t):         return "התקבל"
+    if re.search(r"נדחה", t):           return "נדחה"
+    return "לא ידוע"
+
+
+def extract_saved(t):
+    """עצים לשימור/שניצלו מתוך טקסט."""
+    t = str(t)
+    m = re.search(r"(\d+)\s*עצ(?:ים)?\s*לשימור", t)
+    if m: return int(m.group(1))
+    return 1 if re.search(r"\bעץ\s*לשימור\b", t) else 0
+
+
+def src_kind(s):
+    """סוג המקור (מה החלטת האזורי)."""
+    s = str(s)
+    if re.search(r" דחה .*בקשה |דחה בקשה", s): return "דחיית בקשה"
+    if re.search(r" אישר |אישר כרית", s):      return "רישיון שאושר"
+    return "אחר"
+
+
+def prepare_appeals(appeals_raw: pd.DataFrame, col_map: dict, city_names=None) -> pd.DataFrame:
+    """
+    הכנה וטיוב: תאריך/שנה, יישוב, סיבה, סטטוס, עצים לשימור וסוג מקור.
+    city_names — שמות היישובים מטבלת הקודים (אופציונלי); עם הרשימה היישוב מזוהה בעזרת match_cities.
+    """
+    ap = appeals_raw.copy()
+
+    ap["תאריך"] = parse_dates(ap[col_map["date"]])
+    ap["שנה"] = ap["תאריך"].dt.year.astype("Int64")
+
+    # יישוב (מנרמל מתוך ישוב/כתובת)
+    ap["יישוב_raw"] = ap[col_map["city"]]
+    if city_names is not None:
+        ap["יישוב_cat"] = match_cities(ap["יישוב_raw"], city_names)
+    else:
+        ap["יישוב_cat"] = ap["יישוב_raw"].map(extract_city)
+
+    # שדות תוכן
+    ap["סיבת ערעור גולמית"] = ap.get(col_map.get("reason")).astype(str) if "reason" in col_map else ""
+    ap["החלטה אזורי"] = ap.get(col_map.get("regional")).astype(str) if "regional" in col_map else ""
+    ap["החלטה ממשלתי"] = ap.get(col_map.get("gov")).astype(str) if "gov" in col_map else ""
+    ap["הערות"] = ap.get(col_map.get("notes")).astype(str) if "notes" in col_map else ""
+
+    ap["סיבת ערעור"] = ap["סיבת ערעור גולמית"].map(map_reason)
+    ap["סטטוס ערעור"] = ap.apply(map_status, axis=1)
+    ap["עצים לשימור"] = ap["החלטה ממשלתי"].map(extract_saved) + ap["הערות"].map(extract_saved)
+    ap["סוג מקור"] = ap["החלטה אזורי"].map(src_kind)
+    return ap
+
+
+def load_appeals(data: bytes, city_codes: bytes | None = None) -> pd.DataFrame:
+    """
+    read_appeals + prepare_appeals מתוך ה־bytes של הקובץ — עבודת הרקע של דף הערעורים (ראו job_pool).
+    city_codes — קובץ קודי הערים (אופציונלי); נטען כטבלה מקומפלת דרך lut_compiler.
+    """
+    report_progress(0.05, "קריאת הקובץ")
+    appeals_raw, col_map = read_appeals(io.BytesIO(data))
+    city_names = load_city_table(city_codes).frame["name"] if city_codes else None
+    report_progress(0.5, "הכנת הנתונים")
+    return prepare_appeals(appeals_raw, col_map, city_names)
+
+
+def filter_appeals(ap: pd.DataFrame, years=(), cities=(), reasons=(), statuses=(), exclude_cities=()) -> pd.DataFrame:
+    mask = pd.Series(True, index=ap.index)
+    if years:    mask &= ap["שנה"].isin(years)
+    if cities:   mask &= ap["יישוב_cat"].isin(cities)
+    if reasons:  mask &= ap["סיבת ערעור"].isin(reasons)
+    if statuses: mask &= ap["סטטוס ערעור"].isin(statuses)
+    apv = ap[mask].copy()
+    if exclude_cities:
+        apv = apv[~apv["יישוב_cat"].isin(exclude_cities)]
+    return apv
+
+
+def appeal_kpis(apv: pd.DataFrame) -> dict:
+    return {
+        "total": len(apv),
+        "success_pct": apv["סטטוס ערעור"].isin(SUCCESS_STATUSES).mean() * 100,
+        "saved_trees": int(apv["עצים לשימור"].sum()),
+        "unique_cities": apv["יישוב_cat"].nunique(dropna=True),
+    }
+
+
+def _top_count(df: pd.DataFrame, top_n: int, name: str) -> pd.DataFrame:
+    return (df.groupby("יישוב_cat").size()
+              .sort_values(ascending=False).head(top_n)
+              .reset_index(name=name).rename(columns={"יישוב_cat": "יישוב"}))
+
+
+def top_cities_appeals(apv: pd.DataFrame, top_n: int) -> pd.DataFrame:
+    return _top_count(apv, top_n, "ערעורים")
+
+
+def top_cities_accepted(apv: pd.DataFrame, top_n: int) -> pd.DataFrame:
+    return _top_count(apv[apv["סטטוס ערעור"].isin(SUCCESS_STATUSES)], top_n, "ערעורים שהתקבלו")
+
+
+def trees_saved_by_city(apv: pd.DataFrame, top_n: int) -> pd.DataFrame:
+    return (apv.groupby("יישוב_cat")["עצים לשימור"].sum()
+               .sort_values(ascending=False).head(top_n)
+               .reset_index().rename(columns={"יישוב_cat": "יישוב"}))
+
+
+def biggest_accepted(apv: pd.DataFrame, n: int = 15) -> pd.DataFrame:
+    return (apv[apv["סטטוס ערעור"].isin(SUCCESS_STATUSES)]
+            .sort_values("עצים לשימור", ascending=False).head(n)
+            [["תאריך", "יישוב_cat", "סיבת ערעור", "סטטוס ערעור", "עצים לשימור"]]
+            .rename(columns={"יישוב_cat": "יישוב"}))
+
+
+def appeals_by_source(apv: pd.DataFrame) -> pd.DataFrame:
+    """ערעורים לפי סוג מקור + אחוזי הצלחה."""
+    counts = apv.groupby("סוג מקור").size().reset_index(name="מספר ערעורים")
+    success = (apv.assign(הצלחה=apv["סטטוס ערעור"].isin(SUCCESS_STATUSES).astype(int))
+                  .groupby("סוג מקור")["הצלחה"].mean().mul(100).reset_index(name="אחוזי הצלחה"))
+    return counts.merge(success, on="סוג מקור", how="left")
+
+
+def success_by_reason(apv: pd.DataFrame) -> pd.DataFrame:
+    return (apv.assign(הצלחה=apv["סטטוס ערעור"].isin(SUCCESS_STATUSES).astype(int))
+               .groupby("סיבת ערעור")["הצלחה"].mean().mul(100).reset_index()
+               .sort_values("הצלחה", ascending=False))
+
+
+def not_discussed_by_city(apv: pd.DataFrame, top_n: int) -> pd.DataFrame:
+    return _top_count(apv[apv["סטטוס ערעור"] == "לא נדון (כבר נכרת)"], top_n, "ערעורים שלא נדונו")
+
+
+def status_breakdown(apv: pd.DataFrame) -> pd.DataFrame:
+    return apv.groupby("סטטוס ערעור").size().reset_index(name="מספר")
+
+
+APPEAL_AGGREGATIONS = {
+    "kpis": lambda apv, top_n: appeal_kpis(apv),
+    "top_cities_appeals": top_cities_appeals,
+    "top_cities_accepted": top_cities_accepted,
+    "trees_saved_by_city": trees_saved_by_city,
+    "biggest_accepted": lambda apv, top_n: biggest_accepted(apv),
+    "appeals_by_source": lambda apv, top_n: appeals_by_source(apv),
+    "success_by_reason": lambda apv, top_n: success_by_reason(apv),
+    "not_discussed_by_city": not_discussed_by_city,
+    "status_breakdown": lambda apv, top_n: status_breakdown(apv),
+}
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+csv_backend.py — קבצי CSV / TSV כ"חוברת" של גיליון אחד, באותו ממשק כמו excel_backend.open_workbook
+(sheetnames, wb[שם].iter_rows(values_only=True), close), כך שדוחות שיוצאו מהרשויות כ־CSV נכנסים למיזוג
+בלי המרה ל־xlsx, עם אותו זיהוי כותרת ואותו מיפוי עמודות (map_col / detect_header_row / מטמון הפריסות).
+הקריאה: pyarrow.csv — מפענח עמודתי מרובה threads (פי עשרות מקריאת xlsx); שורות באורך משתנה, או סביבה
+בלי pyarrow — מודול csv של פייתון.
+קידוד: BOM → utf-8-sig; טקסט שאינו UTF-8 תקין → cp1255 (ייצוא Excel "CSV" במחשבים בעברית).
+מפריד: טאב ל־‎.tsv, ואחרת הנפוץ מבין , ; טאב בשורות הראשונות.
+כל התאים נקראים כטקסט (שורת הכותרת לא בהכרח הראשונה); מספרים שלמים/עשרוניים מומרים ל־int/float
+כמו שהם מגיעים מ־xlsx, ותא ריק → None. תאריכים נשארים טקסט ומפוענחים ב־parse_dates כמו בכל גיליון.
+"""
+from __future__ import annotations
+
+import codecs
+import csv
+import io
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pacsv
+    HAVE_PYARROW = True
+except Exception:
+    HAVE_PYARROW = False
+
+CSV_EXTS = (".csv", ".tsv")
+DELIMITERS = (",", "\t", ";")
+SNIFF_BYTES = 1 << 20
+_NUMBER = r"-?(?:0|[1-9]\d*)(?:\.\d+)?"
+# מעבר לזה float64 כבר לא מייצג כל מספר שלם — המספר היה משתנה בשקט
+EXACT_LIMIT = 2 ** 53
+FALLBACK_ENCODING = "cp1255"
+_ZIP_MAGIC = b"PK\x03\x04"
+_OLE_MAGIC = b"\xd0\xcf\x11\xe0"  # xls ישן
+
+
+def _head_bytes(src, n: int = SNIFF_BYTES) -> bytes:
+    if isinstance(src, (str, Path)):
+        with open(src, "rb") as fh:
+            return fh.read(n)
+    if isinstance(src, (bytes, bytearray)):
+        return bytes(src[:n])
+    if hasattr(src, "getbuffer"):
+        return bytes(src.getbuffer()[:n])
+    pos = src.tell()
+    src.seek(0)
+    head = src.read(n)
+    src.seek(pos)
+    return head
+
+
+def is_csv(src) -> bool:
+    """
+    נתיב — לפי הסיומת; bytes / קובץ פתוח — כל מה שאינו חוברת Excel (zip של xlsx או OLE של xls),
+    כולל קובץ ריק (טבלה ריקה, בלי גליונות עם נתונים).
+    """
+    if isinstance(src, (str, Path)):
+        return Path(src).suffix.lower() in CSV_EXTS
+    name = getattr(src, "name", None)
+    if isinstance(name, str) and Path(name).suffix.lower() in CSV_EXTS:
+        return True
+    return not _head_bytes(src, 8).startswith((_ZIP_MAGIC, _OLE_MAGIC))
+
+
+def detect_encoding(head: bytes, complete: bool = False) -> str:
+    """utf-8-sig / utf-8 / cp1255. head — תחילת הקובץ; complete — head הוא הקובץ כולו."""
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    try:
+        # בלי final: תו רב־בתים שנחתך בסוף הדגימה אינו שגיאה
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=complete)
+    except UnicodeDecodeError:
+        return FALLBACK_ENCODING
+    return "utf-8"
+
+
+def detect_delimiter(text: str, name: str = "") -> str:
+    if Path(name).suffix.lower() == ".tsv":
+        return "\t"
+    lines = [ln for ln in text.splitlines()[:50] if ln.strip()]
+    counts = {d: sum(ln.count(d) for ln in lines) for d in DELIMITERS}
+    best = max(DELIMITERS, key=lambda d: counts[d])
+    return best if counts[best] else ","
+
+
+def _with_numbers(vals: np.ndarray, hit: np.ndarray, nums: np.ndarray) -> np.ndarray:
+    """
+    מציב במקום המחרוזות שסומנו ב־hit את הערכים המספריים: שלם → int (כמו תא מספרי ב־xlsx, גם '48.0'), אחרת float.
+    ערך שאינו נשמר במדויק ב־float64 (‎|x| ≥ 2**53, למשל מספר רישיון / ת"ז ארוכים) נשאר טקסט כפי שהוא.
+    """
+    if not len(nums):
+        return vals
+    exact = np.abs(nums) < EXACT_LIMIT
+    pos = np.flatnonzero(hit)[exact]
+    nums = nums[exact]
+    integral = nums == np.floor(nums)
+    out = nums.astype(object)
+    out[integral] = nums[integral].astype(np.int64).tolist()
+    vals = vals.copy()
+    vals[pos] = out
+    return vals
+
+
+def _used_columns(columns: list) -> list:
+    """
+    בלי עמודות ריקות לגמרי בסוף הטבלה (ייצוא שמרפד כל שורה לרוחב הגיליון כולו) —
+    כמו ב־xlsx, שבו תאים ריקים בסוף שורה לא נקראים.
+    """
+    n = len(columns)
+    while n and columns[n - 1].null_count == len(columns[n - 1]):
+        n -= 1
+    return columns[:n]
+
+
+def _arrow_column(col) -> np.ndarray:
+    """
+    עמודת טקסט של pyarrow → מערך object, עם מספרים במקום טקסט מספרי. ה־regex וההמרה רצים ב־C++
+    על כל העמודה בבת אחת, בלי לולאת פייתון על התאים.
+    """
+    vals = col.to_numpy(zero_copy_only=False)
+    hit = pc.match_substring_regex(col, f"^{_NUMBER}$")
+    if not pc.any(hit).as_py():
+        return vals
+    nums = pc.cast(pc.filter(col, hit), pa.float64()).to_numpy()
+    return _with_numbers(vals, hit.fill_null(False).to_numpy(zero_copy_only=False), nums)
+
+
+def _pandas_column(vals: np.ndarray) -> np.ndarray:
+    """כמו _arrow_column, בלי pyarrow."""
+    present = pd.notna(vals)
+    hit = present.copy()
+    hit[present] = pd.Series(vals[present], dtype=object).str.fullmatch(_NUMBER).to_numpy(dtype=bool)
+    return _with_numbers(vals, hit, pd.to_numeric(pd.Series(vals[hit], dtype=object)).to_numpy(dtype=np.float64))
+
+
+def _first_record_width(text: str, delimiter: str) -> int:
+    for row in csv.reader(io.StringIO(text), delimiter=delimiter):
+        return len(row)
+    return 0
+
+
+def _read_arrow(src, encoding: str, delimiter: str, width: int) -> "pa.Table":
+    table = pacsv.read_csv(
+        src if isinstance(src, str) else pa.BufferReader(_raw(src)),
+        read_options=pacsv.ReadOptions(
+            autogenerate_column_names=True,
+            # pyarrow מדלג על BOM בעצמו; קידוד אחר מתורגם ל־UTF-8 בזמן הקריאה
+            encoding="utf8" if encoding.startswith("utf-8") else encoding,
+            use_threads=True,
+        ),
+        parse_options=pacsv.ParseOptions(delimiter=delimiter),
+        convert_options=pacsv.ConvertOptions(
+            # טקסט בלבד: שורת הכותרת אינה בהכרח הראשונה, כך שאין ממה להסיק טיפוסים לעמודה
+            column_types={f"f{i}": pa.string() for i in range(width)},
+            strings_can_be_null=True,
+            null_values=[""],
+        ),
+    )
+    return table
+
+
+def _read_python(src, encoding: str, delimiter: str) -> pd.DataFrame:
+    raw = _raw(src) if not isinstance(src, str) else Path(src).read_bytes()
+    text = io.TextIOWrapper(io.BytesIO(raw), encoding=encoding, newline="")
+    rows = [[v if v != "" else None for v in row] for row in csv.reader(text, delimiter=delimiter) if row]
+    # שורות קצרות מרופדות ב־None — כמו תאים ריקים בסוף שורה ב־xlsx
+    return pd.DataFrame(rows, dtype=object) if rows else pd.DataFrame(dtype=object)
+
+
+def _raw(src) -> bytes:
+    if isinstance(src, (bytes, bytearray)):
+        return src
+    if hasattr(src, "getvalue"):
+        return src.getvalue()
+    src.seek(0)
+    return src.read()
+
+
+def _read_frame(src, encoding: str, delimiter: str, text: str) -> pd.DataFrame:
+    if not HAVE_PYARROW:
+        frame = _read_python(src, encoding, delimiter)
+        used = np.flatnonzero(frame.notna().any().to_numpy())
+        frame = frame.iloc[:, : used[-1] + 1 if len(used) else 0]
+        return pd.DataFrame({c: _pandas_column(frame[c].to_numpy(dtype=object)) for c in frame.columns},
+                            index=frame.index, dtype=object)
+    try:
+        columns = _read_arrow(src, encoding, delimiter, _first_record_width(text, delimiter)).columns
+    except pa.ArrowInvalid:
+        # שורות באורך משתנה (למשל שורת כותרת עליונה עם פחות שדות מהטבלה); טקסט שאינו בקידוד —
+        # UnicodeDecodeError מהקריאה בפייתון
+        frame = _read_python(src, encoding, delimiter)
+        columns = [pa.array(frame[c].to_numpy(dtype=object), type=pa.string()) for c in frame.columns]
+    return pd.DataFrame({i: _arrow_column(col) for i, col in enumerate(_used_columns(columns))}, dtype=object)
+
+
+def read_csv_frame(src, name: str = "") -> pd.DataFrame:
+    """
+    כל הקובץ כ־DataFrame גולמי: עמודות 0..n-1, ערכי object (טקסט / int / float / None), בלי שורת כותרת.
+    src — נתיב, bytes או אובייקט קובץ.
+    הקידוד נקבע לפי תחילת הקובץ; אם הקובץ ארוך מהדגימה ומתגלה בהמשכו טקסט שאינו UTF-8 — נקרא שוב כ־cp1255.
+    """
+    src = str(src) if isinstance(src, Path) else src
+    name = name or (src if isinstance(src, str) else getattr(src, "name", "") or "")
+    head = _head_bytes(src)
+    complete = len(head) < SNIFF_BYTES
+    encoding = detect_encoding(head, complete)
+    text = head.decode(encoding, errors="ignore")
+    delimiter = detect_delimiter(text, name)
+    try:
+        return _read_frame(src, encoding, delimiter, text)
+    except UnicodeDecodeError:
+        if encoding != "utf-8" or complete:
+            raise
+        return _read_frame(src, FALLBACK_ENCODING, delimiter, head.decode(FALLBACK_ENCODING, errors="ignore"))
+
+
+class CsvSheet:
+    """
+    גיליון CSV. frame — הטבלה הגולמית (ראו read_csv_frame); sheet_reader ממפה אותה באופן וקטורי.
+    iter_rows — אותן שורות כמו openpyxl, למי שקורא שורה־שורה (טביעות אצבע של גליונות וכו').
+    """
+
+    def __init__(self, frame: pd.DataFrame, title: str):
+        self.frame = frame
+        self.title = title
+
+    def iter_rows(self, values_only: bool = True):
+        for row in self.frame.itertuples(index=False, name=None):
+            yield row
+
+
+def _source_name(src) -> str:
+    return str(src) if isinstance(src, (str, Path)) else (getattr(src, "name", "") or "")
+
+
+def csv_sheet_name(src) -> str:
+    """שם הגיליון היחיד של קובץ CSV: שם הקובץ בלי סיומת, או 'csv' כשאין שם (bytes)."""
+    return Path(_source_name(src)).stem or "csv"
+
+
+class CsvBook:
+    """קובץ CSV כחוברת עם גיליון אחד (ראו csv_sheet_name)."""
+
+    def __init__(self, src):
+        self._sheet = CsvSheet(read_csv_frame(src, _source_name(src)), csv_sheet_name(src))
+        self.sheetnames = [self._sheet.title]
+
+    def __getitem__(self, name: str):
+        if name not in self.sheetnames:
+            raise KeyError(f"Worksheet {name} does not exist.")
+        return self._sheet
+
+    def close(self) -> None:
+        pass
+
+
+def open_csv(src) -> CsvBook:
+    return CsvBook(src)
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+date_engine.py — מנוע תאריכים משותף לצינור המיזוג ולדפי ה־BI.
+במקום לנחש פורמט לכל תא, כל ערך שונה מפוענח פעם אחת בלבד:
+- datetime / Timestamp נשארים כמו שהם
+- מספרים (וגם מחרוזות מספריות) → serial של אקסל (מקור 1899-12-30)
+- מחרוזות: מדגם מהערכים מזהה את הפורמט (למשל %d/%m/%Y), ואז כולן מפוענחות בפורמט המפורש במעבר וקטורי אחד;
+  מה שלא התאים לפורמט עובר לפענוח גמיש (dayfirst) ורק אז ל־serial.
+אפשר לזהות פורמט נפרד לכל קבוצה (למשל לכל גיליון מקור) בעזרת groups.
+"""
+from __future__ import annotations
+
+import datetime as _dt
+
+import numpy as np
+import pandas as pd
+
+EXCEL_ORIGIN = "1899-12-30"
+# טווח serial סביר: 1 = 1900-01-01 ... 2958465 = 9999-12-31
+SERIAL_MIN, SERIAL_MAX = 1, 2_958_465
+SAMPLE_SIZE = 200
+
+DAYFIRST_FORMATS = [
+    "%d/%m/%Y", "%d.%m.%Y", "%d-%m-%Y", "%d/%m/%y", "%d.%m.%y",
+    "%d/%m/%Y %H:%M", "%d/%m/%Y %H:%M:%S", "%d.%m.%Y %H:%M",
+]
+ISO_FORMATS = ["%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y/%m/%d"]
+MONTHFIRST_FORMATS = ["%m/%d/%Y", "%m/%d/%y", "%m-%d-%Y", "%m/%d/%Y %H:%M", "%m/%d/%Y %H:%M:%S"]
+
+
+def candidate_formats(dayfirst: bool = True) -> list[str]:
+    """סדר העדיפויות לזיהוי פורמט: בתיקו בין פורמטים — הראשון ברשימה גובר."""
+    if dayfirst:
+        return DAYFIRST_FORMATS + ISO_FORMATS + MONTHFIRST_FORMATS
+    return MONTHFIRST_FORMATS + ISO_FORMATS + DAYFIRST_FORMATS
+
+
+def _clean(values: np.ndarray) -> pd.Series:
+    return (
+        pd.Series(values, dtype=object)
+          .str.replace("\u200f", "", regex=False)
+          .str.replace("\u200e", "", regex=False)
+          .str.strip()
+    )
+
+
+def sniff_format(strings, dayfirst: bool = True, sample_size: int = SAMPLE_SIZE) -> str | None:
+    """מזהה את הפורמט שמפענח הכי הרבה ערכים מתוך מדגם; None אם אף פורמט לא מתאים."""
+    sample = pd.Series(strings, dtype=object).dropna()
+    if len(sample) > sample_size:
+        sample = sample.sample(sample_size, random_state=0)
+    if sample.empty:
+        return None
+    best, best_hits = None, 0
+    for fmt in candidate_formats(dayfirst):
+        hits = int(pd.to_datetime(sample, format=fmt, errors="coerce").notna().sum())
+        if hits > best_hits:
+            best, best_hits = fmt, hits
+            if hits == len(sample):
+                break
+    return best
+
+
+def from_excel_serial(num) -> pd.Series:
+    """מספרים → תאריכים לפי serial של אקסל; ערכים מחוץ לטווח → NaT."""
+    num = pd.Series(num, dtype="float64")
+    num = num.where((num >= SERIAL_MIN) & (num <= SERIAL_MAX))
+    return pd.to_datetime(num, unit="D", origin=EXCEL_ORIGIN, errors="coerce")
+
+
+def _parse_strings(strings: pd.Series, dayfirst: bool, fmt: str | None) -> np.ndarray:
+    out = pd.Series(pd.NaT, index=strings.index, dtype="datetime64[ns]")
+    if strings.empty:
+        return out.to_numpy()
+    if fmt:
+        out[:] = pd.to_datetime(strings, format=fmt, errors="coerce")
+    left = out.isna() & (strings != "")
+    if left.any():
+        rest = strings[left]
+        num = pd.to_numeric(rest, errors="coerce")
+        serial = num.notna().to_numpy()
+        if serial.any():
+            out[rest.index[serial]] = from_excel_serial(num[serial]).to_numpy()
+        rest = rest[~serial]
+        if not rest.empty:
+            out[rest.index] = pd.to_datetime(rest, format="mixed", dayfirst=dayfirst, errors="coerce").to_numpy()
+    return out.to_numpy()
+
+
+def _parse_uniques(uniques: np.ndarray, dayfirst: bool, fmt: str | None) -> np.ndarray:
+    """מפענח מערך ערכים ייחודיים (object) למערך datetime64[ns]."""
+    out = np.full(len(uniques), np.datetime64("NaT"), dtype="datetime64[ns]")
+    kinds = np.array([
+        "d" if isinstance(v, (_dt.datetime, _dt.date, np.datetime64))
+        else "n" if isinstance(v, (int, float, np.integer, np.floating)) and not isinstance(v, (bool, np.bool_))
+        else "s" if isinstance(v, str)
+        else ""
+        for v in uniques
+    ])
+    if (kinds == "d").any():
+        out[kinds == "d"] = pd.to_datetime(pd.Series(uniques[kinds == "d"], dtype=object), errors="coerce").to_numpy()
+    if (kinds == "n").any():
+        out[kinds == "n"] = from_excel_serial(uniques[kinds == "n"].astype("float64")).to_numpy()
+    if (kinds == "s").any():
+        strings = _clean(uniques[kinds == "s"])
+        if fmt is None:
+            fmt = sniff_format(strings[strings != ""], dayfirst=dayfirst)
+        out[kinds == "s"] = _parse_strings(strings.reset_index(drop=True), dayfirst, fmt)
+    return out
+
+
+def _parse_one(s: pd.Series, dayfirst: bool, fmt: str | None) -> np.ndarray:
+    if pd.api.types.is_datetime64_any_dtype(s.dtype):
+        return s.to_numpy(dtype="datetime64[ns]")
+    if pd.api.types.is_numeric_dtype(s.dtype) and not pd.api.types.is_bool_dtype(s.dtype):
+        return from_excel_serial(s.to_numpy(dtype="float64")).to_numpy()
+    codes, uniques = pd.factorize(s, use_na_sentinel=True)
+    parsed = _parse_uniques(np.asarray(uniques, dtype=object), dayfirst, fmt)
+    out = np.full(len(s), np.datetime64("NaT"), dtype="datetime64[ns]")
+    ok = codes >= 0
+    out[ok] = parsed[codes[ok]]
+    return out
+
+
+def parse_dates(
+    s: pd.Series,
+    dayfirst: bool = True,
+    groups: pd.Series | None = None,
+    fmt: str | None = None,
+) -> pd.Series:
+    """
+    מפענח עמודת תאריכים מעורבת (datetime / טקסט / serial של אקסל) ל־datetime64.
+    dayfirst — העדפה כשהפורמט דו־משמעי (02/01/2024 → 2 בינואר).
+    groups — עמודה מקבילה (למשל '__source_sheet__'): הפורמט מזוהה בנפרד לכל קבוצה.
+    fmt — פורמט ידוע מראש (מדלג על הזיהוי).
+    ערך שלא ניתן לפענוח → NaT.
+    """
+    if groups is None or s.empty:
+        return pd.Series(_parse_one(s, dayfirst, fmt), index=s.index, name=s.name)
+
+    out = np.full(len(s), np.datetime64("NaT"), dtype="datetime64[ns]")
+    gcodes, _ = pd.factorize(groups, use_na_sentinel=False)
+    # מיון יציב אחד ופיצול לפי גבולות הקבוצות — O(n log n), ולא סריקה של כל העמודה לכל קבוצה
+    order = np.argsort(gcodes, kind="stable")
+    bounds = np.flatnonzero(np.diff(gcodes[order])) + 1
+    for pos in np.split(order, bounds):
+        out[pos] = _parse_one(s.iloc[pos], dayfirst, fmt)
+    return pd.Series(out, index=s.index, name=s.name)
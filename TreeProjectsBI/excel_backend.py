@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+excel_backend.py — שכבת קריאה אחת לקבצי Excel, עם בחירת מנוע אוטומטית.
+  calamine  — python-calamine (מפענח native ב־Rust); מהיר פי כמה מ־openpyxl (ראו benchmarks/bench_reader.py).
+  openpyxl  — פייתון טהור; ברירת המחדל כש־calamine לא מותקן, ונפילה לאחור כש־calamine נכשל על קובץ.
+סדר הבחירה: הפרמטר backend → משתנה הסביבה FORESTRY_EXCEL_BACKEND (auto / calamine / openpyxl) → calamine אם מותקן.
+שני ממשקים:
+  open_workbook — חוברת לקריאה זורמת, באותו ממשק כמו openpyxl read_only
+                  (sheetnames, wb[שם].iter_rows(values_only=True), close) — משמש את sheet_reader;
+  read_excel    — pd.read_excel עם המנוע שנבחר (דפי ה־BI וטבלאות הקודים).
+open_workbook פותח גם קובצי CSV / TSV, כחוברת של גיליון אחד (ראו csv_backend).
+ערכי calamine מותאמים לאלה של openpyxl, כך שהמיפוי, מטמון הפריסות וה־hash של הכפילויות לא משתנים:
+מספר שלם → int (calamine מחזיר float), תאריך → datetime, תא ריק → None.
+הבדלים שנשארים: calamine מפענח רצפי _xHHHH_ בטקסט (למשל _x000D_ → ‎\\r) לפי תקן OOXML, ו־openpyxl משאיר אותם
+כמו שהם; ותא שכולו רווחים חוזר מ־calamine כתא ריק.
+"""
+from __future__ import annotations
+
+import io
+import os
+from datetime import date, datetime
+from pathlib import Path
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from csv_backend import is_csv, open_csv
+
+try:
+    from python_calamine import CalamineError, CalamineWorkbook
+    HAVE_CALAMINE = True
+except Exception:
+    HAVE_CALAMINE = False
+
+BACKENDS = ("calamine", "openpyxl")
+BACKEND_ENV = "FORESTRY_EXCEL_BACKEND"
+
+
+def pick_backend(backend: str | None = None) -> str:
+    """המנוע שבפועל ישמש לקריאה. 'calamine' כשהוא לא מותקן → 'openpyxl'."""
+    name = (backend or os.environ.get(BACKEND_ENV) or "auto").strip().lower()
+    if name == "auto":
+        return "calamine" if HAVE_CALAMINE else "openpyxl"
+    if name not in BACKENDS:
+        raise ValueError(f"מנוע קריאה לא מוכר: {name} (אפשר: auto, {', '.join(BACKENDS)})")
+    if name == "calamine" and not HAVE_CALAMINE:
+        return "openpyxl"
+    return name
+
+
+def _rewind(src):
+    """נתיב נשאר נתיב; bytes → BytesIO; קובץ פתוח (UploadedFile/BytesIO) חוזר להתחלה."""
+    if isinstance(src, (str, Path)):
+        return str(src)
+    if isinstance(src, (bytes, bytearray)):
+        return io.BytesIO(src)
+    if hasattr(src, "seek"):
+        src.seek(0)
+    return src
+
+
+# ---------- calamine בממשק של openpyxl read_only ----------
+
+def _cell(v):
+    t = type(v)
+    if t is str:
+        return v or None
+    if t is float:
+        return int(v) if v.is_integer() else v
+    if t is date:
+        return datetime(v.year, v.month, v.day)
+    return v
+
+
+class CalamineSheet:
+    """גיליון calamine עם iter_rows(values_only=True) כמו ב־openpyxl."""
+
+    def __init__(self, sheet):
+        self._sheet = sheet
+        self.title = sheet.name
+
+    def iter_rows(self, values_only: bool = True):
+        for row in self._sheet.iter_rows():
+            yield tuple(map(_cell, row))
+
+
+class CalamineBook:
+    """
+    חוברת calamine עם sheetnames / wb[שם] / close. גיליון ש־calamine נכשל בפענוחו נקרא מאותו מקור
+    דרך openpyxl (החוברת של openpyxl נפתחת רק כשצריך).
+    """
+
+    def __init__(self, src):
+        self._src = src
+        src = _rewind(src)
+        self._wb = CalamineWorkbook.from_path(src) if isinstance(src, str) else CalamineWorkbook.from_filelike(src)
+        self.sheetnames = list(self._wb.sheet_names)
+        self._fallback = None
+
+    def __getitem__(self, name: str):
+        if name not in self.sheetnames:
+            raise KeyError(f"Worksheet {name} does not exist.")
+        try:
+            return CalamineSheet(self._wb.get_sheet_by_name(name))
+        except CalamineError:
+            if self._fallback is None:
+                self._fallback = _open_openpyxl(self._src)
+            return self._fallback[name]
+
+    def close(self) -> None:
+        self._wb.close()
+        if self._fallback is not None:
+            self._fallback.close()
+
+
+def _open_openpyxl(src):
+    return load_workbook(_rewind(src), read_only=True, data_only=True, keep_links=False)
+
+
+# ---------- ממשק ציבורי ----------
+
+def open_workbook(src, backend: str | None = None):
+    """
+    פותח חוברת לקריאה זורמת. src — נתיב, bytes או אובייקט קובץ.
+    קובץ ש־calamine לא מצליח לפתוח נפתח ב־openpyxl (שיעלה את השגיאה המוכרת אם גם הוא נכשל).
+    קובץ CSV / TSV (לפי הסיומת, ובלי סיומת — כל מה שאינו חוברת Excel) נקרא דרך csv_backend בכל מנוע.
+    """
+    if is_csv(src):
+        return open_csv(src)
+    if pick_backend(backend) == "calamine":
+        try:
+            return CalamineBook(src)
+        except CalamineError:
+            pass
+    return _open_openpyxl(src)
+
+
+def read_excel(src, sheet_name=0, header=0, backend: str | None = None, **kwargs) -> pd.DataFrame:
+    """pd.read_excel עם המנוע שנבחר; שגיאת פענוח של calamine → קריאה חוזרת ב־openpyxl."""
+    if pick_backend(backend) == "calamine":
+        try:
+            return pd.read_excel(_rewind(src), sheet_name=sheet_name, header=header, engine="calamine", **kwargs)
+        except CalamineError:
+            pass
+    return pd.read_excel(_rewind(src), sheet_name=sheet_name, header=header, engine="openpyxl", **kwargs)
@@ -0,0 +1,388 @@
+# -*- coding: utf-8 -*-
+"""
+incremental_merge.py — מיזוג מצטבר: מעבד מחדש רק גליונות חדשים או שהשתנו.
+לכל גיליון נשמרת רשומה ב־manifest.json (שם, hash של התוכן, שורת הכותרת שזוהתה ומיפוי העמודות),
+והגיליון הממופה והמפוענח נשמר בתיקיית המאגר. בהרצה הבאה גליונות שלא השתנו נטענים מהמאגר,
+ורק גליונות חדשים/ששונו עוברים קריאה, מיפוי, פיענוח, סיווג והמרת סכמה. הפלט הסופי (xlsx) נכתב מחדש מכל
+הגליונות — אלא אם אף גיליון לא השתנה, ואז מוחזרת התוצאה השמורה מההרצה הקודמת.
+שימוש:
+  python merge_engine.py <קובץ דוחות.xlsx> --cities ... --trees ... --incremental <תיקיית מאגר>
+"""
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import pickle
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from openpyxl.reader.strings import read_string_table
+
+from bi_aggregations import build_pivots, merge_pivots, subtract_pivots
+from csv_backend import csv_sheet_name, is_csv
+from lut_compiler import file_digest
+from utils_he import TARGET_COLS
+from sheet_reader import iter_sheet_chunks, open_workbook
+from merge_stats import MergeStats, stage
+from upload_sources import list_workbooks, open_ref, source_refs
+from merge_engine import (
+    INT_COLS,
+    PIPELINE_VERSION,
+    MergeResult,
+    _default_layouts,
+    _open_source,
+    apply_schema,
+    dedupe,
+    frame_mb,
+    load_luts,
+    postprocess,
+    to_parquet_bytes,
+    write_excel,
+)
+
+MANIFEST_NAME = "manifest.json"
+# גרסת המאגר: מאגר ישן יותר (למשל גליונות שנשמרו לפני apply_schema ובלי טבלאות מסכמות) לא נטען,
+# והגליונות מעובדים מחדש
+STORE_VERSION = 3
+
+_SST_REF = re.compile(rb'<c\b[^>]*\bt="s"[^>]*>\s*<v>(\d+)</v>')
+_STYLE_REF = re.compile(rb'<c\b[^>]*\bs="(\d+)"')
+
+
+# ---------- טביעת אצבע לגיליון ----------
+
+def sheet_fingerprints(src) -> dict[str, str]:
+    """
+    מחזיר {שם גיליון: hash}. ה־hash מחושב מהתאים בלבד (<sheetData> ב־XML של הגיליון), מהמחרוזות
+    המשותפות שהם מפנים אליהן (לפי הסדר) ומסגנונות התאריך שבשימוש — כך ששינויי תצוגה (רוחב עמודות וכו')
+    והוספת גיליון חדש (שמוסיפה מחרוזות לטבלה המשותפת) לא משנים את ה־hash של הגליונות הקיימים.
+    קובץ CSV הוא גיליון אחד, וה־hash שלו הוא של הקובץ כולו.
+    """
+    src = io.BytesIO(src) if isinstance(src, bytes) else src
+    if is_csv(src):
+        name = csv_sheet_name(src)
+        return {name: hashlib.sha256(f"{name}|{file_digest(src)}".encode()).hexdigest()}
+    # ה־hash נבנה מה־XML הגולמי שבתוך ה־zip, ולכן תמיד דרך openpyxl
+    wb = _open_source(src, backend="openpyxl")
+    try:
+        zf = wb._archive
+        sst_name = next((n for n in zf.namelist() if n.lower().endswith("sharedstrings.xml")), None)
+        strings = []
+        if sst_name:
+            with zf.open(sst_name) as fh:
+                strings = [str(x) for x in read_string_table(fh)]
+        date_styles = set(getattr(wb, "_date_formats", ()))
+
+        out: dict[str, str] = {}
+        for sname in wb.sheetnames:
+            ws = wb[sname]
+            h = hashlib.sha256(sname.encode())
+            path = getattr(ws, "_worksheet_path", None)
+            if path:
+                xml = zf.read(path)
+                start, end = xml.find(b"<sheetData"), xml.rfind(b"</sheetData>")
+                if start != -1 and end != -1:
+                    xml = xml[start:end]
+                h.update(xml)
+                for m in _SST_REF.finditer(xml):
+                    i = int(m.group(1))
+                    h.update(strings[i].encode() if i < len(strings) else b"")
+                    h.update(b"\0")
+                used = {int(i) for i in _STYLE_REF.findall(xml)} & date_styles
+                h.update(repr(sorted(used)).encode())
+            out[sname] = h.hexdigest()
+        return out
+    finally:
+        wb.close()
+
+
+def _lut_digest(city_lut: dict, tree_lut: dict) -> str:
+    h = hashlib.sha256(PIPELINE_VERSION.encode())
+    h.update(repr(sorted(city_lut.items())).encode())
+    h.update(repr(sorted(tree_lut.items())).encode())
+    return h.hexdigest()
+
+
+# ---------- מאגר גליונות ----------
+
+class SheetStore:
+    """
+    תיקייה עם manifest.json וקובץ pickle לכל גיליון מעובד (לפי ה־hash שלו): הגיליון אחרי apply_schema,
+    יומן המיפוי והטבלאות המסכמות שלו. בנוסף נשמרת תוצאת ההרצה האחרונה (xlsx, Parquet והטבלאות),
+    לפי מפתח של כל הגליונות, טבלאות הקודים ומצב הכפילויות (ראו output_key).
+    """
+
+    def __init__(self, root: str | Path):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.manifest_path = self.root / MANIFEST_NAME
+        try:
+            self.manifest = json.loads(self.manifest_path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.manifest = {}
+
+    def lookup(self, sname: str, digest: str, lut_digest: str) -> dict | None:
+        """רשומת המניפסט של הגיליון אם התוכן וטבלאות הקודים לא השתנו; אחרת None."""
+        if self.manifest.get("store_version") != STORE_VERSION or self.manifest.get("lut_digest") != lut_digest:
+            return None
+        entry = self.manifest.get("sheets", {}).get(sname)
+        if not entry or entry.get("hash") != digest:
+            return None
+        if entry.get("file") and not (self.root / entry["file"]).is_file():
+            return None
+        return entry
+
+    def load(self, entry: dict) -> tuple[pd.DataFrame | None, list[dict], dict]:
+        if not entry.get("file"):
+            return None, entry.get("log_rows", []), {}
+        with open(self.root / entry["file"], "rb") as fh:
+            data = pickle.load(fh)
+        return data["frame"], data["log_rows"], data["pivots"]
+
+    def _dump(self, name: str, data: dict) -> str:
+        tmp = self.root / f"{name}.tmp"
+        with open(tmp, "wb") as fh:
+            pickle.dump(data, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp.replace(self.root / name)
+        return name
+
+    def save(self, digest: str, frame: pd.DataFrame | None, log_rows: list[dict], pivots: dict) -> str | None:
+        if frame is None:
+            return None
+        return self._dump(f"{digest}.pkl", {"frame": frame, "log_rows": log_rows, "pivots": pivots})
+
+    def load_output(self, key: str) -> dict | None:
+        """תוצאת ההרצה הקודמת, אם נשמרה עם אותו מפתח; אחרת None."""
+        out = self.manifest.get("output") or {}
+        if self.manifest.get("store_version") != STORE_VERSION or out.get("key") != key:
+            return None
+        try:
+            with open(self.root / out["file"], "rb") as fh:
+                return pickle.load(fh)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def save_output(self, key: str, result: dict) -> dict:
+        return {"key": key, "file": self._dump(f"output-{key[:16]}.pkl", result)}
+
+    def commit(self, sheets: dict[str, dict], lut_digest: str, reprocessed: list[str], output: dict | None) -> None:
+        """כותב מניפסט חדש ומוחק קבצי גליונות ותוצאות שכבר לא בשימוש."""
+        self.manifest = {
+            "pipeline_version": PIPELINE_VERSION,
+            "store_version": STORE_VERSION,
+            "lut_digest": lut_digest,
+            "reprocessed": reprocessed,
+            "sheets": sheets,
+            "output": output,
+        }
+        tmp = self.manifest_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.manifest, ensure_ascii=False, indent=1), encoding="utf-8")
+        tmp.replace(self.manifest_path)
+        keep = {e["file"] for e in sheets.values() if e.get("file")}
+        if output:
+            keep.add(output["file"])
+        for p in self.root.glob("*.pkl"):
+            if p.name not in keep:
+                p.unlink()
+
+
+def output_key(digests: dict[str, str], lut_digest: str, dedupe_mode: str) -> str:
+    """מפתח התוצאה המלאה: כל הגליונות לפי הסדר (שם + hash), טבלאות הקודים ומצב הכפילויות."""
+    payload = json.dumps([PIPELINE_VERSION, STORE_VERSION, lut_digest, dedupe_mode, list(digests.items())],
+                         ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+# ---------- הרצה ----------
+
+def _map_sheet_with_info(ref: tuple, sname: str, layouts=None) -> tuple[pd.DataFrame | None, list[dict], int]:
+    """
+    משימת worker: כמו merge_engine._map_sheet_task, ומחזירה גם את שורת הכותרת שזוהתה.
+    ref — הפניה לחוברת (ראו upload_sources.open_ref); החוברת נפתחת בתוך ה־worker.
+    layouts — אותו LayoutCache כמו ב־run_merge, כך שה־MappingLog זהה (כולל layout / new_layout).
+    """
+    log_rows: list[dict] = []
+    info: dict = {}
+    wb = open_workbook(open_ref(ref))
+    try:
+        parts = list(iter_sheet_chunks(wb[sname], sname, log_rows, info=info, layouts=layouts))
+    finally:
+        wb.close()
+    if layouts is not None:
+        layouts.save()
+    frame = pd.concat(parts, ignore_index=True) if parts else None
+    return frame, log_rows, info.get("header_row", 0)
+
+
+def _sheet_schema(frame: pd.DataFrame) -> tuple[pd.DataFrame, dict]:
+    """
+    apply_schema לגיליון בודד, בלי עמודות INT_COLS: אם הן יהיו מספר שלם או category תלוי בכל הגליונות,
+    וההמרה לשלם מאבדת את הערך המקורי ('49' מול 49) — לכן הן נשמרות כמו שהן ומומרות רק אחרי האיחוד.
+    """
+    out, report = apply_schema(frame)
+    for c in INT_COLS:
+        if c in frame.columns:
+            out[c] = frame[c]
+    return out, report
+
+
+def _concat_sheets(parts: list[pd.DataFrame]) -> pd.DataFrame:
+    """
+    איחוד גליונות שכל אחד מהם כבר עבר _sheet_schema, לאותם טיפוסים כמו apply_schema על הטבלה המאוחדת.
+    לעמודת category בכל הגליונות נקבעות מראש כל הקטגוריות, בסדר ש־pandas בוחר לעמודה המאוחדת, כדי
+    ש־concat לא יהפוך אותה ל־object; מה שעדיין לא תואם (למשל מספר שלם בגיליון אחד וטקסט באחר) מומר
+    ב־apply_schema על התוצאה, כמו במיזוג המלא.
+    """
+    parts = [p.copy(deep=False) for p in parts]
+    for c in parts[0].columns:
+        cols = [p[c] for p in parts if c in p.columns]
+        if len(parts) < 2 or len(cols) < len(parts) or not all(isinstance(s.dtype, pd.CategoricalDtype) for s in cols):
+            continue
+        cats = pd.Index(np.concatenate([s.cat.categories.to_numpy(dtype=object) for s in cols])).unique()
+        order = pd.Series(cats, dtype=object).astype("category").cat.categories
+        for p in parts:
+            p[c] = p[c].cat.set_categories(order)
+    return apply_schema(pd.concat(parts, ignore_index=True))[0]
+
+
+def run_incremental_merge(
+    main_file,
+    city_file,
+    tree_file,
+    store_dir,
+    workers: int = 1,
+    dedupe_mode: str = "flag",
+) -> MergeResult:
+    """
+    מיזוג מצטבר של חוברת דוחות אחת מול מאגר גליונות ב־store_dir.
+    גליונות שלא השתנו (אותו hash ואותן טבלאות קודים) נטענים מהמאגר — כבר אחרי apply_schema ועם הטבלאות
+    המסכמות שלהם; השאר מעובדים ונשמרים. אם אף גיליון לא השתנה ויש תוצאה שמורה לאותו מפתח (ראו output_key),
+    היא מוחזרת כמו שהיא, בלי איחוד ובלי כתיבת xlsx.
+    result.log_rows כולל את MappingLog של כל הגליונות; ב־manifest.json נשמרת גם רשימת הגליונות שעובדו בהרצה האחרונה.
+    הכפילויות בין גליונות (dedupe_mode) נבדקות תמיד על הטבלה המאוחדת, כי גיליון שהשתנה משפיע על האחרים;
+    הרשומות הכפולות מופחתות מסכום הטבלאות המסכמות של הגליונות.
+    """
+    stats = MergeStats()
+    with stats.track_peak(), stage(stats, "total") as total:
+        store = SheetStore(store_dir)
+        city_lut, tree_lut = load_luts(city_file, tree_file, stats=stats)
+        lut_digest = _lut_digest(city_lut, tree_lut)
+
+        book = list_workbooks(main_file)[0]
+        ref = (book.data, book.member, book.name)
+        with stage(stats, "fingerprint") as rec:
+            digests = sheet_fingerprints(book.open())
+            rec["rows_out"] = len(digests)
+
+        cached: dict[str, dict] = {}
+        changed: list[str] = []
+        for sname, digest in digests.items():
+            entry = store.lookup(sname, digest, lut_digest)
+            if entry is None:
+                changed.append(sname)
+            else:
+                cached[sname] = entry
+
+        key = output_key(digests, lut_digest, dedupe_mode)
+        if not changed:
+            with stage(stats, "load_output") as rec:
+                previous = store.load_output(key)
+                rec["rows_out"] = None if previous is None else len(previous["merged"])
+            if previous is not None:
+                store.commit(cached, lut_digest, reprocessed=[], output=store.manifest["output"])
+                total["rows_out"] = len(previous["merged"])
+                return MergeResult(**previous, stats=stats.rows)
+
+        fresh: dict[str, tuple] = {}
+        layouts = _default_layouts()
+        if workers > 1 and len(changed) > 1:
+            # לתהליכים נשלחת רק הפניה (ראו upload_sources.source_refs): קובץ שהועלה נכתב פעם אחת לתיקייה זמנית
+            with tempfile.TemporaryDirectory(prefix="merge_src_") as tmp, \
+                    ProcessPoolExecutor(max_workers=workers) as ex:
+                worker_ref = source_refs([book], tmp)[0]
+                tasks = ex.map(_map_sheet_with_info, [worker_ref] * len(changed), changed, [layouts] * len(changed))
+                for sname, res in zip(changed, tasks):
+                    fresh[sname] = res
+        else:
+            for sname in changed:
+                fresh[sname] = _map_sheet_with_info(ref, sname, layouts)
+
+        parts: list[pd.DataFrame] = []
+        sheet_pivots: list[dict] = []
+        log_rows: list[dict] = []
+        sheets: dict[str, dict] = {}
+        frame_mb_before = 0.0
+        for sname, digest in digests.items():
+            if sname in cached:
+                entry = cached[sname]
+                with stage(stats, "load_cached_sheet", sheet=sname) as rec:
+                    frame, sheet_log, pivots = store.load(entry)
+                    rec["rows_out"] = 0 if frame is None else len(frame)
+            else:
+                frame, sheet_log, hdr = fresh[sname]
+                pivots, sheet_mb = {}, 0.0
+                if frame is not None:
+                    frame = postprocess(frame, city_lut, tree_lut, stats=stats, sheet=sname)
+                    with stage(stats, "schema", sheet=sname, rows_in=len(frame)):
+                        frame, report = _sheet_schema(frame)
+                        sheet_mb = report["frame_mb_before"]
+                    with stage(stats, "pivots", sheet=sname, rows_in=len(frame)):
+                        pivots = build_pivots(frame)
+                entry = {
+                    "hash": digest,
+                    "header_row": hdr,
+                    "mapping": {r["source_column"]: r["mapped_to"] for r in sheet_log if r["mapped_to"]},
+                    "rows": 0 if frame is None else len(frame),
+                    "frame_mb": sheet_mb,
+                    "file": store.save(digest, frame, sheet_log, pivots),
+                }
+                if frame is None:
+                    entry["log_rows"] = sheet_log
+            sheets[sname] = entry
+            if frame is not None:
+                parts.append(frame)
+                sheet_pivots.append(pivots)
+            frame_mb_before += entry.get("frame_mb", 0.0)
+            log_rows.extend(sheet_log)
+
+        with stage(stats, "schema", rows_in=sum(len(p) for p in parts)) as rec:
+            merged = (
+                _concat_sheets(parts) if parts
+                else apply_schema(postprocess(pd.DataFrame(columns=TARGET_COLS), city_lut, tree_lut))[0]
+            )
+            rec.update(rows_out=len(merged), frame_mb_before=frame_mb_before, frame_mb_after=frame_mb(merged))
+        with stage(stats, "dedupe", rows_in=len(merged)) as rec:
+            # תמיד עם סימון, כדי שהרשומות הכפולות יהיו זמינות להפחתה מהטבלאות המסכמות
+            removed = None
+            if dedupe_mode != "off":
+                merged, duplicates = dedupe(merged, "flag")
+                dup = merged["__is_dup__"].to_numpy()
+                if dup.any():
+                    removed = merged.loc[dup].drop(columns="__is_dup__")
+                if dedupe_mode == "drop":
+                    merged = merged.loc[~dup].drop(columns="__is_dup__").reset_index(drop=True)
+            else:
+                merged, duplicates = dedupe(merged, dedupe_mode)
+            rec["rows_out"] = len(merged)
+        with stage(stats, "pivots", rows_in=len(merged)) as rec:
+            pivots = merge_pivots(sheet_pivots) if sheet_pivots else build_pivots(merged)
+            if removed is not None:
+                pivots = subtract_pivots(pivots, build_pivots(removed))
+            rec["rows_out"] = sum(len(p) for p in pivots.values())
+        with stage(stats, "write_excel", rows_in=len(merged)):
+            xlsx = write_excel(merged, log_rows, duplicates, pivots)
+        with stage(stats, "write_parquet", rows_in=len(merged)):
+            parquet = to_parquet_bytes(merged)
+
+        result = {
+            "merged": merged, "log_rows": log_rows, "xlsx": xlsx, "parquet": parquet,
+            "duplicates": duplicates, "pivots": pivots,
+        }
+        store.commit(sheets, lut_digest, reprocessed=changed, output=store.save_output(key, result))
+        total["rows_out"] = len(merged)
+    return MergeResult(**result, stats=stats.rows)
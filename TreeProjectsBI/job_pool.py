@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""
+job_pool.py — מאגר תהליכים חסום לעבודות כבדות (מיזוג, קריאת קבצים והכנת הנתונים בדפי ה־BI), משותף לכל הסשנים.
+העבודה רצה בתהליך נפרד, כך שהיא לא תופסת את ה־GIL של שרת Streamlit ולא מקפיאה את הדף או סשנים אחרים.
+  מזהה עבודה — המפתח שנמסר (למשל hash התוכן), כך שהרצה חוזרת של הדף מצטרפת לאותה עבודה; בלי מפתח — מזהה אקראי.
+  הגבלת מקביליות — לכל היותר max_jobs עבודות רצות בבת אחת, ולכל היותר per_owner מאותו סשן; השאר ממתינות בתור,
+                   והמקום הפנוי הבא עובר לסשן עם הכי מעט עבודות רצות (ובתוכו — לפי סדר ההגשה),
+                   כך שהעלאה גדולה של משתמש אחד לא חוסמת את כולם.
+  התקדמות — העבודה מדווחת דרך merge_stats.report_progress (למשל לכל גיליון); הדיווח נכתב לקובץ קטן בתיקיית
+            העבודה ונקרא מהדף (Job.progress).
+  ביטול — עבודה בתור פשוט יוצאת מהתור; עבודה רצה מקבלת סימון, ובנקודת הדיווח הבאה נזרקת בה JobCancelled.
+  תהליך שנפל — (קריסה, OOM killer) שובר את כל ה־ProcessPoolExecutor: העבודות שרצו בו באותו רגע נכשלות
+                ב־BrokenProcessPool, ה־executor נבנה מחדש, והעבודות שבתור ממשיכות כרגיל.
+התהליכים נוצרים ב־spawn (בלי fork של שרת עם threads); פונקציית העבודה והארגומנטים חייבים להיות ניתנים ל־pickle,
+ולכן היא צריכה להיות פונקציה ברמת מודול (לא מתוך דף).
+הגדרות: FORESTRY_MAX_JOBS (ברירת מחדל: מספר הליבות, בין 2 ל־4), FORESTRY_MAX_JOBS_PER_SESSION (ברירת מחדל: חצי).
+"""
+from __future__ import annotations
+
+import json
+import multiprocessing as mp
+import os
+import shutil
+import sys
+import tempfile
+import types
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from merge_stats import set_progress_listener
+
+MAX_JOBS_ENV = "FORESTRY_MAX_JOBS"
+PER_OWNER_ENV = "FORESTRY_MAX_JOBS_PER_SESSION"
+DEFAULT_MAX_JOBS = max(2, min(4, os.cpu_count() or 1))
+# כמה עבודות שהסתיימו נשמרות (עם התוצאה שלהן) לפני שהישנות משתחררות
+DEFAULT_MAX_RESULTS = 8
+
+_PROGRESS = "progress.json"
+_CANCEL = "cancel"
+
+
+class JobCancelled(Exception):
+    """העבודה בוטלה (נזרקת בתהליך העבודה בנקודת הדיווח הבאה אחרי בקשת הביטול)."""
+
+
+# ---------- צד התהליך ----------
+
+def _write_progress(job_dir: Path, fraction: float, text: str) -> None:
+    tmp = job_dir / f"{_PROGRESS}.tmp"
+    tmp.write_text(json.dumps({"fraction": round(fraction, 4), "text": text}, ensure_ascii=False),
+                   encoding="utf-8")
+    tmp.replace(job_dir / _PROGRESS)
+
+
+class _Reporter:
+    """מאזין ההתקדמות בתהליך העבודה: כותב את הדיווח לקובץ, ובודק אם התבקש ביטול."""
+
+    def __init__(self, job_dir: str):
+        self.job_dir = Path(job_dir)
+
+    def __call__(self, fraction: float, text: str) -> None:
+        if (self.job_dir / _CANCEL).exists():
+            raise JobCancelled(text)
+        _write_progress(self.job_dir, fraction, text)
+
+
+def _run_job(job_dir: str, fn, args: tuple, kwargs: dict):
+    reporter = _Reporter(job_dir)
+    reporter(0.0, "")
+    previous = set_progress_listener(reporter)
+    try:
+        result = fn(*args, **kwargs)
+        reporter(1.0, "")
+        return result
+    finally:
+        set_progress_listener(previous)
+
+
+# ---------- צד השרת ----------
+
+@contextmanager
+def _plain_main():
+    """
+    Streamlit מתקין את סקריפט הדף כ־__main__, ותהליך spawn חדש מריץ את __main__ מחדש — כלומר את הדף כולו.
+    בזמן יצירת התהליכים (בתוך submit של ה־executor) __main__ מוחלף במודול ריק, כך שהתהליך מייבא רק את מה
+    שהעבודה צריכה.
+    """
+    main = sys.modules.get("__main__")
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = main
+
+
+@dataclass
+class Job:
+    """עבודה אחת: מזהה, שם לתצוגה, הסשן שהגיש אותה, ה־Future (של התוצאה) וזמני הגשה/התחלה/סיום."""
+    id: str
+    name: str
+    owner: str
+    dir: Path
+    call: tuple = field(repr=False, default=())
+    future: Future = field(default_factory=Future)
+    submitted: float = field(default_factory=time.perf_counter)
+    started: float | None = None
+    finished: float | None = None
+    cancel_requested: bool = False
+
+    @property
+    def state(self) -> str:
+        """queued / running / done / error / cancelled."""
+        if not self.future.done():
+            return "running" if self.started is not None else "queued"
+        if self.future.cancelled() or isinstance(self.future.exception(), JobCancelled):
+            return "cancelled"
+        return "error" if self.future.exception() is not None else "done"
+
+    @property
+    def active(self) -> bool:
+        return not self.future.done()
+
+    @property
+    def seconds(self) -> float:
+        start = self.started if self.started is not None else self.submitted
+        return (self.finished or time.perf_counter()) - start
+
+    @property
+    def progress(self) -> tuple[float, str]:
+        """(חלק שהושלם 0–1, תיאור השלב הנוכחי) לפי הדיווח האחרון של העבודה."""
+        if self.state == "done":
+            return 1.0, ""
+        try:
+            data = json.loads((self.dir / _PROGRESS).read_text(encoding="utf-8"))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return 0.0, ""
+        return float(data.get("fraction", 0.0)), data.get("text", "")
+
+
+class JobPool:
+    """
+    תור עבודות משותף (מחזיקים מופע אחד לתהליך השרת, למשל ב־st.cache_resource).
+    submit מחזיר מזהה עבודה; state / progress / result / cancel לפי המזהה.
+    """
+
+    def __init__(self, max_jobs: int | None = None, per_owner: int | None = None,
+                 max_results: int = DEFAULT_MAX_RESULTS):
+        self.max_jobs = max(1, max_jobs or int(os.environ.get(MAX_JOBS_ENV) or DEFAULT_MAX_JOBS))
+        self.per_owner = max(1, min(self.max_jobs, per_owner or int(
+            os.environ.get(PER_OWNER_ENV) or max(1, self.max_jobs // 2))))
+        self.max_results = max_results
+        self._executor = self._new_executor()
+        self._root = Path(tempfile.mkdtemp(prefix="forestry-jobs-"))
+        self._lock = threading.RLock()
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._pending: list[Job] = []
+        self._closed = False
+
+    # ----- הגשה ותזמון -----
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.max_jobs, mp_context=mp.get_context("spawn"))
+
+    def _replace_executor(self, broken: ProcessPoolExecutor) -> None:
+        """executor שבור (תהליך שנפל) מוחלף בחדש — פעם אחת, גם כשכמה עבודות מדווחות עליו."""
+        with self._lock:
+            if self._closed or self._executor is not broken:
+                return
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._executor = self._new_executor()
+
+    def submit(self, fn, *args, name: str = "", owner: str = "", key: str | None = None, **kwargs) -> str:
+        """
+        מגיש עבודה: fn(*args, **kwargs) בתהליך נפרד. key — מזהה קבוע (למשל hash התוכן): אם כבר קיימת עבודה
+        עם אותו מזהה שלא נכשלה ולא בוטלה — מוחזר המזהה שלה בלי להריץ שוב.
+        """
+        job_id = key or uuid.uuid4().hex
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.state not in ("error", "cancelled"):
+                self._jobs.move_to_end(job_id)
+                return job_id
+            job_dir = self._root / job_id
+            shutil.rmtree(job_dir, ignore_errors=True)
+            job_dir.mkdir(parents=True)
+            job = Job(id=job_id, name=name or getattr(fn, "__name__", "job"), owner=owner, dir=job_dir,
+                      call=(fn, args, kwargs))
+            self._jobs[job_id] = job
+            self._pending.append(job)
+            self._dispatch()
+            self._evict()
+        return job_id
+
+    def _running(self) -> dict[str, int]:
+        counts: dict[str, int] = {}
+        for job in self._jobs.values():
+            if job.started is not None and job.active:
+                counts[job.owner] = counts.get(job.owner, 0) + 1
+        return counts
+
+    def _dispatch(self) -> None:
+        """מעביר עבודות מהתור לתהליכים כל עוד יש מקום: הסשן עם הכי מעט עבודות רצות קודם, ובתוכו לפי סדר ההגשה."""
+        with self._lock:
+            if self._closed:
+                return
+            running = self._running()
+            while self._pending and sum(running.values()) < self.max_jobs:
+                ready = [j for j in self._pending if running.get(j.owner, 0) < self.per_owner]
+                if not ready:
+                    return
+                job = min(ready, key=lambda j: (running.get(j.owner, 0), j.submitted))
+                self._pending.remove(job)
+                fn, args, kwargs = job.call
+                job.call = ()
+                job.started = time.perf_counter()
+                running[job.owner] = running.get(job.owner, 0) + 1
+                executor = self._executor
+                try:
+                    with _plain_main():
+                        inner = executor.submit(_run_job, str(job.dir), fn, args, kwargs)
+                except BrokenProcessPool:
+                    # נשבר לפני שהספקנו לקבל על כך הודעה — העבודה עוברת ל־executor חדש
+                    self._replace_executor(executor)
+                    executor = self._executor
+                    with _plain_main():
+                        inner = executor.submit(_run_job, str(job.dir), fn, args, kwargs)
+                inner.add_done_callback(lambda f, job=job, ex=executor: self._finish(job, f, ex))
+
+    def _finish(self, job: Job, inner: Future, executor: ProcessPoolExecutor) -> None:
+        job.finished = time.perf_counter()
+        exc = inner.exception()
+        if isinstance(exc, BrokenProcessPool):
+            self._replace_executor(executor)
+        if exc is not None:
+            job.future.set_exception(exc)
+        else:
+            job.future.set_result(inner.result())
+        self._dispatch()
+
+    def _evict(self) -> None:
+        """משחרר את התוצאות של העבודות הישנות ביותר שהסתיימו, מעבר ל־max_results."""
+        done = [k for k, j in self._jobs.items() if not j.active]
+        for k in done[:max(0, len(done) - self.max_results)]:
+            shutil.rmtree(self._jobs.pop(k).dir, ignore_errors=True)
+
+    # ----- מצב, תוצאה וביטול -----
+
+    def job(self, job_id: str | None) -> Job | None:
+        return self._jobs.get(job_id) if job_id else None
+
+    def state(self, job_id: str | None) -> str:
+        job = self.job(job_id)
+        return job.state if job is not None else "missing"
+
+    def result(self, job_id: str, timeout: float | None = None):
+        """ממתין לסיום העבודה ומחזיר את תוצאתה (או מעלה את השגיאה שלה / JobCancelled)."""
+        return self._jobs[job_id].future.result(timeout)
+
+    def cancel(self, job_id: str) -> bool:
+        """מבטל עבודה: מהתור — מיד; רצה — בנקודת הדיווח הבאה שלה. מחזיר False אם העבודה כבר הסתיימה."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or not job.active:
+                return False
+            job.cancel_requested = True
+            if job in self._pending:
+                self._pending.remove(job)
+                job.finished = time.perf_counter()
+                job.future.set_exception(JobCancelled(job.name))
+                return True
+            (job.dir / _CANCEL).touch()
+            return True
+
+    def jobs(self, owner: str | None = None) -> list[Job]:
+        """העבודות הידועות (לפי סדר השימוש), אופציונלית רק של סשן אחד."""
+        return [j for j in self._jobs.values() if owner is None or j.owner == owner]
+
+    def shutdown(self) -> None:
+        """עוצר את המאגר: עבודות שבתור מבוטלות, ועבודות רצות מסתיימות בלי שתתחלנה חדשות."""
+        with self._lock:
+            self._closed = True
+            for job in self._pending:
+                job.future.set_exception(JobCancelled(job.name))
+            self._pending.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        shutil.rmtree(self._root, ignore_errors=True)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+job_ui.py — חיבור הדפים למאגר העבודות (job_pool): מופע אחד לשרת, מזהה לכל סשן, ותצוגת התקדמות עם ביטול.
+עבודה שעדיין רצה מוצגת כ־st.progress שמתרענן (fragment) עם כפתור ביטול, והדף נעצר באותה נקודה;
+כשהעבודה מסתיימת הדף רץ מחדש ומקבל את התוצאה מהמאגר.
+"""
+from __future__ import annotations
+
+import uuid
+
+import streamlit as st
+
+from job_pool import JobCancelled, JobPool
+
+STATE_LABELS = {
+    "queued": "⏳ ממתין",
+    "running": "⚙️ בעיבוד",
+    "done": "✅ מוכן",
+    "error": "❌ שגיאה",
+    "cancelled": "⏹️ בוטל",
+}
+
+
+@st.cache_resource
+def shared_pool() -> JobPool:
+    return JobPool()
+
+
+def session_owner() -> str:
+    """מזהה הסשן בתור העבודות (ההגבלה לכל סשן והחלוקה ההוגנת בין סשנים — לפיו)."""
+    if "job_owner" not in st.session_state:
+        st.session_state["job_owner"] = uuid.uuid4().hex
+    return st.session_state["job_owner"]
+
+
+def job_progress(pool: JobPool, job_id: str, title: str, poll: float = 0.5) -> None:
+    """
+    פס התקדמות וכפתור ביטול לעבודה שעדיין רצה; הדף נעצר כאן (st.stop), והפס מתרענן כל poll שניות
+    עד שהעבודה מסתיימת — ואז הדף כולו רץ מחדש. עבודה שהסתיימה — לא מוצג דבר.
+    """
+    job = pool.job(job_id)
+    if job is None or not job.active:
+        return
+
+    def _watch():
+        job = pool.job(job_id)
+        if job is None or not job.active:
+            st.rerun()
+        fraction, text = job.progress
+        label = f"{title} · {STATE_LABELS[job.state]} · {job.seconds:.0f} שנ'"
+        if job.state == "queued":
+            label += " · ממתין למקום פנוי בתור העבודות"
+        elif text:
+            label += f" · {text}"
+        st.progress(min(max(fraction, 0.0), 1.0), text=label)
+        if job.cancel_requested:
+            st.caption("הביטול יתבצע בסיום השלב הנוכחי…")
+        elif st.button("⏹️ ביטול", key=f"cancel-{job_id}"):
+            pool.cancel(job_id)
+
+    st.fragment(_watch, run_every=poll)()
+    st.stop()
+
+
+def run_job(fn, *args, key: str, title: str, **kwargs):
+    """
+    מגיש את fn(*args, **kwargs) למאגר המשותף (או מצטרף לעבודה עם אותו key) ומחזיר את התוצאה כשהיא מוכנה;
+    עד אז — פס התקדמות (ראו job_progress). עבודה שבוטלה לא מוגשת מחדש מעצמה בהרצות הבאות של הדף —
+    רק בלחיצה על "הפעל שוב". שגיאה של העבודה עולה כמו שהיא.
+    """
+    pool = shared_pool()
+    cancelled = st.session_state.setdefault("cancelled_jobs", set())
+    if key in cancelled:
+        st.warning(f"{title}: העבודה בוטלה.")
+        if not st.button("🔄 הפעל שוב", key=f"restart-{key}"):
+            st.stop()
+        cancelled.discard(key)
+    pool.submit(fn, *args, name=title, owner=session_owner(), key=key, **kwargs)
+    job_progress(pool, key, title)
+    try:
+        return pool.result(key)
+    except JobCancelled:
+        cancelled.add(key)
+        st.rerun()
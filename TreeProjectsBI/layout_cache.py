@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+layout_cache.py — מטמון של "פריסות" גיליון: שורת הכותרת שזוהתה ותוכנית מיפוי העמודות.
+גליונות מאותו משרד/מחוז כמעט תמיד באותה פריסה, ולכן במקום להריץ detect_header_row ו־map_col על כל גיליון,
+מחשבים טביעת אצבע לכל אחת מהשורות הראשונות (הערכים הגולמיים) ומחפשים אותה במטמון של שורות כותרת מוכרות.
+שורות הכותרת הגדולה מעליה (שם היישוב, תאריך הדוח) לא נכללות, כך שאותה פריסה מזוהה גם בגליונות של ערים שונות.
+פריסה מוכרת — מדלגים על הזיהוי לגמרי; פריסה חדשה — מזהים כרגיל, לומדים אותה ושומרים לדיסק.
+המטמון נפסל אוטומטית כשמשנים את ALIASES / TARGET_COLS (או את LAYOUT_VERSION).
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from lut_compiler import DEFAULT_CACHE_DIR
+from utils_he import ALIASES, TARGET_COLS
+
+# להעלות כשמשנים את אופן זיהוי הכותרת או בניית תוכנית המיפוי
+LAYOUT_VERSION = "1"
+
+
+def _signature() -> str:
+    h = hashlib.sha256(LAYOUT_VERSION.encode())
+    h.update(repr(sorted(ALIASES.items())).encode())
+    h.update(repr(TARGET_COLS).encode())
+    return h.hexdigest()
+
+
+def fingerprint(row: list) -> str:
+    """טביעת אצבע לשורה גולמית (אחרי _trim_row): hash של ערכי התאים כפי שהם."""
+    return hashlib.sha256(repr(row).encode()).hexdigest()[:20]
+
+
+class LayoutCache:
+    """
+    קובץ JSON אחד: {טביעת אצבע: {header_row, plan, columns, first_sheet}}.
+    new — טביעות האצבע של פריסות שנלמדו בתהליך הנוכחי (מסומנות ב־MappingLog כחדשות).
+    """
+
+    def __init__(self, path: str | Path | None = None):
+        self.path = Path(path) if path else DEFAULT_CACHE_DIR / "layouts.json"
+        self.signature = _signature()
+        self.layouts: dict[str, dict] = self._read()
+        self.new: set[str] = set()
+
+    def _read(self) -> dict[str, dict]:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        if data.get("signature") != self.signature:
+            return {}
+        return data.get("layouts", {})
+
+    def match(self, head: list[list]) -> tuple[str, dict, int] | None:
+        """מחפש שורת כותרת מוכרת בין השורות הראשונות. מחזיר (מפתח, רשומה, אינדקס השורה) או None."""
+        if not self.layouts:
+            return None
+        for r, row in enumerate(head):
+            if not row:
+                continue
+            key = fingerprint(row)
+            entry = self.layouts.get(key)
+            if entry is not None:
+                return key, entry, r
+        return None
+
+    def learn(self, head: list[list], header_row: int, plan: dict, sheet_log: list[dict], sname: str) -> str:
+        """שומר פריסה חדשה (בזיכרון; save() כותב לדיסק). מחזיר את טביעת האצבע."""
+        key = fingerprint(head[header_row])
+        self.layouts[key] = {
+            "header_row": header_row,
+            "plan": {tgt: list(idxs) for tgt, idxs in plan.items()},
+            "columns": [[r["source_column"], r["mapped_to"]] for r in sheet_log],
+            "first_sheet": sname,
+        }
+        self.new.add(key)
+        return key
+
+    def save(self) -> None:
+        """כותב את הפריסות שנלמדו, בנוסף למה שכבר בדיסק (גם אם תהליך אחר הוסיף בינתיים)."""
+        if not self.new:
+            return
+        merged = self._read()
+        merged.update({k: self.layouts[k] for k in self.new})
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(
+            json.dumps({"signature": self.signature, "layouts": merged}, ensure_ascii=False, indent=1),
+            encoding="utf-8",
+        )
+        os.replace(tmp, self.path)
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+lut_compiler.py — "קומפילציה" של קבצי הקודים (ערים / עצים) לטבלת חיפוש מוכנה.
+כל קובץ קודים נקרא פעם אחת בלבד: מאתרים את שורת הכותרת, בונים טבלה לפי קוד (כולל העמודות הנוספות —
+'סוג עץ', 'שם באנגלית', 'growth_form' וכו') ושומרים אותה בדיסק לפי hash של תוכן הקובץ.
+הרצות הבאות (מיזוג, CLI, דפים) טוענות את הטבלה המוכנה — מהזיכרון אם כבר נטענה בתהליך, אחרת מהדיסק.
+"""
+from __future__ import annotations
+
+import hashlib
+import io
+import os
+import pickle
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from excel_backend import read_excel
+
+DEFAULT_CACHE_DIR = Path(os.environ.get("FORESTRY_CACHE_DIR", Path.home() / ".cache" / "forestry_trees"))
+
+# להעלות כשמשנים את אופן בניית הטבלאות (כדי לפסול טבלאות ישנות בדיסק)
+LUT_VERSION = "1"
+
+# טבלאות שנטענו בתהליך הנוכחי (LRU): תהליך Streamlit חי זמן רב ומקבל קובצי קודים חדשים,
+# אז שומרים רק את האחרונות; מה שנפלט נטען שוב מהדיסק
+MEMO_ENTRIES = 8
+_MEMO: OrderedDict[str, "CodeTable"] = OrderedDict()
+
+
+def file_digest(f) -> str:
+    """sha256 של תוכן קובץ — נתיב, bytes או אובייקט קובץ (UploadedFile/BytesIO)."""
+    h = hashlib.sha256()
+    if isinstance(f, bytes):
+        h.update(f)
+    elif isinstance(f, (str, Path)):
+        with open(f, "rb") as fh:
+            for block in iter(lambda: fh.read(1 << 20), b""):
+                h.update(block)
+    elif hasattr(f, "getvalue"):
+        h.update(f.getvalue())
+    else:
+        pos = f.tell()
+        f.seek(0)
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+        f.seek(pos)
+    return h.hexdigest()
+
+
+# ---------- טבלת קודים ----------
+
+@dataclass
+class CodeTable:
+    """
+    טבלת קודים מקומפלת. frame — אינדקס לפי קוד (int64), עמודת 'name' ועמודות נוספות מהקובץ.
+    lut — מילון קוד→שם מוכן (זה מה שצינור המיזוג צריך).
+    """
+    kind: str
+    frame: pd.DataFrame
+    lut: dict[int, str] = field(default_factory=dict)
+
+    @property
+    def extra_columns(self) -> list[str]:
+        return [c for c in self.frame.columns if c != "name"]
+
+    def column(self, col: str) -> dict[int, object]:
+        """מילון קוד→ערך לעמודה נוספת (למשל 'סוג עץ' או 'growth_form')."""
+        s = self.frame[col].dropna()
+        return dict(zip(s.index.tolist(), s.tolist()))
+
+
+def lookup_codes(s: pd.Series, lut: dict[int, str]) -> np.ndarray | None:
+    """
+    ערכים שהם קוד מספרי שמופיע ב־lut מוחלפים בשם; כל השאר נשאר כמו שהוא.
+    ההמרה למספר נעשית פעם אחת לכל ערך ייחודי. מחזיר None אם אין מה להחליף (העמודה לא משתנה).
+    """
+    codes, uniques = pd.factorize(s, use_na_sentinel=True)
+    if not len(uniques):
+        return None
+    num = pd.to_numeric(pd.Series(uniques, dtype=object), errors="coerce")
+    ok = num.notna().to_numpy()
+    if not ok.any():
+        return None
+    mapped = np.full(len(uniques), None, dtype=object)
+    mapped[ok] = num[ok].astype(int).map(lut).to_numpy(dtype=object)
+    hit_u = pd.notna(mapped)
+    hit = (codes >= 0) & hit_u[codes]
+    if not hit.any():
+        return None
+    out = s.to_numpy(dtype=object, copy=True)
+    out[hit] = mapped[codes[hit]]
+    return out
+
+
+def _cells(raw: pd.DataFrame) -> list[pd.Series]:
+    return [raw[c].astype(str) for c in raw.columns]
+
+
+def _first(mask: np.ndarray) -> int | None:
+    return int(mask.argmax()) if mask.any() else None
+
+
+def _compile(kind: str, raw: pd.DataFrame, header_row: int, code_pos: int, name_pos: int) -> CodeTable:
+    headers = ["" if pd.isna(v) else str(v).strip() for v in raw.iloc[header_row].tolist()]
+    body = raw.iloc[header_row + 1:]
+
+    codes = pd.to_numeric(body.iloc[:, code_pos], errors="coerce").to_numpy(dtype="float64")
+    keep = np.isfinite(codes) & (np.abs(codes) < 2**63)
+    # כמו בקריאה הקודמת: שם חסר נשמר כ־'nan', וקוד כפול — הערך האחרון גובר
+    data = {"name": body.iloc[:, name_pos].astype(str).str.strip().to_numpy()[keep]}
+    for j, h in enumerate(headers):
+        if h and j not in (code_pos, name_pos) and h not in data:
+            data[h] = body.iloc[:, j].to_numpy()[keep]
+
+    frame = pd.DataFrame(data, index=pd.Index(codes[keep].astype("int64"), name="code"))
+    frame = frame[~frame.index.duplicated(keep="last")]
+    lut = dict(zip(frame.index.tolist(), frame["name"].tolist()))
+    return CodeTable(kind=kind, frame=frame, lut=lut)
+
+
+def compile_city_table(raw: pd.DataFrame) -> CodeTable:
+    """
+    טבלת ערים מגיליון גולמי (header=None). שורת הכותרת — הראשונה שיש בה גם 'ישוב' וגם 'סמל',
+    גם אם לפניה כותרת גדולה או שורות ריקות.
+    """
+    cells = _cells(raw)
+    joined = cells[0] if cells else pd.Series([], dtype=object)
+    for s in cells[1:]:
+        joined = joined + " " + s
+    header_row = _first(
+        (joined.str.contains("ישוב", regex=False) & joined.str.contains("סמל", regex=False)).to_numpy()
+    )
+    if header_row is None:
+        raise ValueError("❌ בקובץ הערים לא נמצאה שורת כותרת עם 'ישוב' ו-'סמל ישוב'.")
+
+    headers = ["" if pd.isna(v) else str(v).strip() for v in raw.iloc[header_row].tolist()]
+    name_pos = next((j for j, h in enumerate(headers) if "ישוב" in h and "סמל" not in h), None)
+    code_pos = next((j for j, h in enumerate(headers) if "סמל" in h), None)
+    if name_pos is None or code_pos is None:
+        raise ValueError("❌ בקובץ הערים חייבות להיות עמודות 'ישוב' ו-'סמל ישוב' (או שמות דומים).")
+    return _compile("city", raw, header_row, code_pos, name_pos)
+
+
+def compile_tree_table(raw: pd.DataFrame) -> CodeTable:
+    """
+    טבלת עצים מגיליון גולמי (header=None). שורת הכותרת — הראשונה שיש בה תא עם 'tree',
+    ואם אין — השורה הלא־ריקה הראשונה. העמודות הנוספות (סוג עץ, שם באנגלית, growth_form) נשמרות בטבלה.
+    """
+    cells = [raw[c].fillna("").astype(str).str.lower() for c in raw.columns]
+    hits = np.zeros(len(raw), dtype=bool)
+    for s in cells:
+        hits |= s.str.contains("tree", regex=False).to_numpy()
+    header_row = _first(hits)
+    if header_row is None:
+        header_row = _first(raw.notna().any(axis=1).to_numpy())
+    if header_row is None:
+        raise ValueError("❌ בקובץ העצים לא נמצאה שורת כותרת מתאימה (עם עמודת Tree).")
+
+    headers = ["" if pd.isna(v) else str(v).strip() for v in raw.iloc[header_row].tolist()]
+    code_pos = next((j for j, h in enumerate(headers) if "tree" in h.lower()), None)
+    name_pos = next((j for j, h in enumerate(headers) if "שם" in h and "עץ" in h), None)
+    if code_pos is None or name_pos is None:
+        raise ValueError("❌ בקובץ העצים חייבות להיות עמודות 'Tree' ו-'שם עץ' (או שמות דומים).")
+    return _compile("tree", raw, header_row, code_pos, name_pos)
+
+
+_COMPILERS = {"city": compile_city_table, "tree": compile_tree_table}
+
+
+def _read_raw(src) -> pd.DataFrame:
+    if isinstance(src, bytes):
+        src = io.BytesIO(src)
+    elif hasattr(src, "seek"):
+        src.seek(0)
+    return read_excel(src, sheet_name=0, header=None)
+
+
+# ---------- מטמון ----------
+
+class LutCache:
+    """טבלאות מקומפלות בתיקייה מקומית; קובץ pickle אחד לכל (סוג, hash של קובץ הקודים, LUT_VERSION)."""
+
+    def __init__(self, root: str | Path | None = None):
+        self.root = Path(root) if root else DEFAULT_CACHE_DIR / "luts"
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self.root / f"{key}.pkl"
+
+    def get(self, key: str) -> CodeTable | None:
+        try:
+            with open(self._path(key), "rb") as fh:
+                return CodeTable(**pickle.load(fh))
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError, TypeError):
+            return None
+
+    def put(self, key: str, table: CodeTable) -> None:
+        p = self._path(key)
+        tmp = p.with_suffix(".tmp")
+        with open(tmp, "wb") as fh:
+            pickle.dump(dict(vars(table)), fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, p)
+
+
+def load_table(kind: str, src, cache: LutCache | None = None) -> CodeTable:
+    """
+    טבלת קודים מקומפלת עבור קובץ (נתיב / bytes / UploadedFile). kind — 'city' או 'tree'.
+    סדר החיפוש: זיכרון התהליך → מטמון הדיסק → קריאה וקומפילציה (ושמירה לשניהם).
+    cache=None משתמש במטמון ברירת המחדל; אם לא ניתן ליצור אותו — מקמפלים בלי לשמור לדיסק.
+    """
+    key = f"{kind}-{LUT_VERSION}-{file_digest(src)}"
+    table = _MEMO.get(key)
+    if table is not None:
+        _MEMO.move_to_end(key)
+        return table
+
+    if cache is None:
+        try:
+            cache = LutCache()
+        except OSError:
+            cache = None
+    table = cache.get(key) if cache is not None else None
+    if table is None:
+        table = _COMPILERS[kind](_read_raw(src))
+        if cache is not None:
+            try:
+                cache.put(key, table)
+            except OSError:
+                pass
+    _MEMO[key] = table
+    while len(_MEMO) > MEMO_ENTRIES:
+        _MEMO.popitem(last=False)
+    return table
+
+
+def load_city_table(src, cache: LutCache | None = None) -> CodeTable:
+    return load_table("city", src, cache)
+
+
+def load_tree_table(src, cache: LutCache | None = None) -> CodeTable:
+    return load_table("tree", src, cache)
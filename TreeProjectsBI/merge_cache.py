@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+merge_cache.py — מטמון דיסק לתוצאות מיזוג, לפי תוכן קבצי הקלט.
+המפתח הוא hash של שלושת הקבצים (דוחות, ערים, עצים) + גרסת הצינור (PIPELINE_VERSION) + אפשרויות ההרצה
+(כולל שמות החוברות, ראו merge_engine.merge_cache_key),
+כך שהרצה חוזרת על אותם קבצים מחזירה מיד את הדאטה הממוזג ואת קובץ ה־xlsx.
+כשהמטמון עובר את מגבלת הגודל — נמחקות הרשומות שלא נעשה בהן שימוש הכי הרבה זמן (LRU).
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import pickle
+from pathlib import Path
+
+from lut_compiler import DEFAULT_CACHE_DIR, file_digest  # noqa: F401  (file_digest מיוצא גם מכאן)
+from merge_engine import PIPELINE_VERSION, MergeResult
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+class MergeCache:
+    """מטמון תוצאות מיזוג בתיקייה מקומית; כל רשומה היא קובץ pickle אחד בשם המפתח."""
+
+    def __init__(self, root: str | Path | None = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.root = Path(root) if root else DEFAULT_CACHE_DIR / "merge"
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+    def key(self, *files, options: str = "", digests: list | None = None) -> str:
+        """
+        מפתח לפי hash של כל קבצי הקלט (בסדר הנתון), גרסת הצינור ואפשרויות ההרצה (options).
+        digests — file_digest שכבר חושבו, באותו מבנה כמו files (רשימה לרשימת קבצים), כדי לא לקרוא שוב את התוכן.
+        """
+        if digests is None:
+            digests = [[file_digest(sub) for sub in f] if isinstance(f, (list, tuple)) else file_digest(f)
+                       for f in files]
+        h = hashlib.sha256(f"v{PIPELINE_VERSION}|{options}".encode())
+        for d in digests:
+            if isinstance(d, (list, tuple)):
+                for sub in d:
+                    h.update(sub.encode())
+                h.update(b"|")
+            else:
+                h.update(d.encode())
+        return h.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.root / f"{key}.pkl"
+
+    def get(self, key: str) -> MergeResult | None:
+        p = self._path(key)
+        try:
+            with open(p, "rb") as fh:
+                fields = pickle.load(fh)
+            result = MergeResult(**fields)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError, TypeError):
+            return None
+        # עדכון זמן השימוש האחרון (לצורך LRU)
+        os.utime(p)
+        return result
+
+    def put(self, key: str, result: MergeResult) -> None:
+        p = self._path(key)
+        tmp = p.with_suffix(".tmp")
+        with open(tmp, "wb") as fh:
+            # נשמרים השדות בלבד (dict) ולא המחלקה, כדי שהרשומה תיקרא גם מה־CLI וגם מהדף
+            pickle.dump(dict(vars(result)), fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, p)
+        self._evict()
+
+    def _evict(self) -> None:
+        entries = sorted(
+            ((e.stat().st_mtime, e.stat().st_size, e) for e in self.root.glob("*.pkl")),
+            key=lambda t: t[0],
+        )
+        total = sum(size for _, size, _ in entries)
+        for _, size, e in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                e.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
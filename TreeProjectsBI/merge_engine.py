@@ -0,0 +1,1016 @@
+# -*- coding: utf-8 -*-
+"""
+merge_engine.py — מנוע המיזוג של דוחות הכריתה, ללא תלות ב־Streamlit.
+משמש גם את דף 🧩 Merge & Export וגם הרצה משורת הפקודה (cron / שרת).
+שימוש:
+  python merge_engine.py <קובץ דוחות.xlsx|.csv|ארכיון.zip> [עוד קבצים...] --cities <רשימת ערים.xlsx> --trees <רשימת עצים.xlsx> [-o פלט.xlsx] [--workers N]
+  ארכיון גדול (out-of-core, ראו out_of_core.py): ... --dataset <תיקייה> [--xlsx sample|full]
+  גרסה שמורה של כל הרצה, להשוואה בין הרצות (ראו merge_snapshots.py): ... --snapshots <תיקייה>
+"""
+from __future__ import annotations
+
+import argparse
+import io
+import json
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils import get_column_letter
+from openpyxl.styles import Alignment, Border, Font, Side
+
+try:
+    import pyarrow  # noqa
+    HAVE_PYARROW = True
+except Exception:
+    HAVE_PYARROW = False
+
+from utils_he import (
+    TARGET_COLS,
+    norm_key,
+)
+from sheet_reader import iter_sheet_chunks, open_workbook
+from merge_stats import MergeStats, frame_memory, peak_mb, progress_span, report_progress, stage
+from lut_compiler import load_city_table, load_tree_table, lookup_codes
+from bi_aggregations import build_pivots
+from date_engine import parse_dates
+from excel_backend import BACKEND_ENV, BACKENDS
+from layout_cache import LayoutCache
+from upload_sources import is_archive, list_workbooks, open_ref, sheet_label, source_refs
+
+OUTPUT_NAME = "merged_forest_reports_FINAL_dates_fixed.xlsx"
+PARQUET_NAME = "merged_forest_reports_FINAL.parquet"
+
+# יש להעלות בכל שינוי שמשנה את תוצאת המיזוג (חלק ממפתח המטמון ב־merge_cache)
+PIPELINE_VERSION = "8"
+
+
+# ---------- פיענוח קודים: פעולה + סיבה ----------
+
+ACTION_MAP = {1: "כריתה", 2: "העתקה"}
+
+REASON_MAP = {
+    1: "אחר",
+    2: "בטיחות",
+    3: "מחלת עץ",
+    4: "סכנה בריאותית",
+    5: "בנייה",
+    6: "הכשרה חקלאית",
+    7: "עץ מת",
+    8: "דילול יער",
+    9: "קריאה",
+    10: "סניטציה",
+}
+
+
+def _decode_codes(s: pd.Series, mapping: dict[int, str]) -> np.ndarray:
+    """
+    פיענוח וקטורי של עמודת קודים: ערך שהוא מספר שלם שמופיע ב־mapping מוחלף בטקסט,
+    כל ערך אחר (טקסט חופשי, קוד לא מוכר, חסר) נשאר כמחרוזת — בדיוק כמו astype(str).
+    ההמרה למספר נעשית פעם אחת לכל ערך ייחודי, והתוצאה נפרסת חזרה בעזרת אינדקסים.
+    """
+    codes, uniques = pd.factorize(s.astype(str).to_numpy(dtype=object))
+    uniq = pd.Index(uniques, dtype=object)
+    num = pd.to_numeric(uniq.str.strip(), errors="coerce").to_numpy(dtype=float)
+
+    max_key = max(mapping)
+    lut = np.full(max_key + 1, None, dtype=object)
+    for k, v in mapping.items():
+        lut[k] = v
+
+    with np.errstate(invalid="ignore"):
+        ok = np.isfinite(num) & (num == np.floor(num)) & (num >= 0) & (num <= max_key)
+    decoded = uniq.to_numpy(dtype=object).copy()
+    hit = lut[num[ok].astype(int)]
+    decoded[ok] = np.where(pd.isna(hit), decoded[ok], hit)
+    return decoded[codes]
+
+
+def decode_action_reason(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    מייצר:
+    - פעולה_מפוענחת
+    - פעולה_מפוענחת (2)
+    - סיבה_מפוענחת
+    רק כאשר מדובר בקוד מספרי; טקסט חופשי נשאר כמו שהוא.
+    העמודות נוספות לטבלה עצמה (בלי להעתיק אותה), והיא מוחזרת.
+    """
+    out = df
+
+    # פעולה ראשית
+    if "פעולה" in out.columns:
+        out["פעולה_מפוענחת"] = _decode_codes(out["פעולה"], ACTION_MAP)
+
+    # פעולה שנייה
+    if "פעולה (2)" in out.columns:
+        out["פעולה_מפוענחת (2)"] = _decode_codes(out["פעולה (2)"], ACTION_MAP)
+
+    # סיבה
+    if "סיבה" in out.columns:
+        out["סיבה_מפוענחת"] = _decode_codes(out["סיבה"], REASON_MAP)
+    elif "סיבה  מילולית" in out.columns:
+        out["סיבה_מפוענחת"] = out["סיבה  מילולית"].astype(str)
+
+    return out
+
+
+def reorder_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    מסדר את העמודות כך ש:
+    - 'פעולה' ליד 'פעולה_מפוענחת'
+    - 'פעולה (2)' ליד 'פעולה_מפוענחת (2)'
+    - 'סיבה' / 'סיבה  מילולית' ליד 'סיבה_מפוענחת'
+    ושאר העמודות נשארות באותו סדר יחסי.
+    הסידור נעשה במקום — רק העמודות שזזות מוצאות ומוכנסות מחדש, בלי להעתיק את כל הטבלה.
+    """
+    cols = list(df.columns)
+    new_order: list[str] = []
+
+    # פעולה 1
+    if "פעולה" in cols:
+        new_order.append("פעולה")
+    if "פעולה_מפוענחת" in cols:
+        new_order.append("פעולה_מפוענחת")
+
+    # פעולה 2
+    if "פעולה (2)" in cols:
+        new_order.append("פעולה (2)")
+    if "פעולה_מפוענחת (2)" in cols:
+        new_order.append("פעולה_מפוענחת (2)")
+
+    # סיבות
+    if "סיבה" in cols:
+        new_order.append("סיבה")
+    if "סיבה_מפוענחת" in cols:
+        new_order.append("סיבה_מפוענחת")
+    if "סיבה  מילולית" in cols:
+        new_order.append("סיבה  מילולית")
+
+    # שאר העמודות בסדר המקורי
+    for c in cols:
+        if c not in new_order:
+            new_order.append(c)
+
+    for i, c in enumerate(new_order):
+        if df.columns[i] != c:
+            df.insert(i, c, df.pop(c))
+    return df
+
+
+# ---------- לוקאפ ערים / עצים מקבצי המפתח ----------
+
+def _load_city_lut(city_file) -> dict[int, str]:
+    """
+    קוד יישוב → שם, מקובץ 'רשימת ערים לפי קודים' (גם עם כותרת גדולה / שורות ריקות לפני שורת הכותרות).
+    הטבלה מקומפלת פעם אחת לכל קובץ ונשמרת במטמון (ראו lut_compiler).
+    """
+    return load_city_table(city_file).lut
+
+
+def _load_tree_lut(tree_file) -> dict[int, str]:
+    """
+    קוד עץ (Tree) → 'שם עץ', מקובץ 'רשימת עצים לפי קודים' (גם עם כותרת גדולה / שורות ריקות).
+    הטבלה המלאה (כולל 'סוג עץ', 'שם באנגלית', 'growth_form') זמינה דרך lut_compiler.load_tree_table.
+    """
+    return load_tree_table(tree_file).lut
+
+
+def apply_city_tree_lookups(
+    merged: pd.DataFrame,
+    city_lut: dict[int, str],
+    tree_lut: dict[int, str],
+) -> pd.DataFrame:
+    """
+    ממיר קודים → שמות בתוך הדוח הממוזג:
+    - בעמודת 'יישוב' (אם יש קודים מספריים)
+    - בעמודות מין עץ (אם לפעמים יש שם קוד מספרי במקום שם)
+    העמודות מוחלפות אחת־אחת בטבלה עצמה (בלי העתקה של כל הטבלה), והיא מוחזרת.
+    """
+    df = merged
+
+    # ---- ישובים ----
+    if "יישוב" in df.columns:
+        out = lookup_codes(df["יישוב"], city_lut)
+        if out is not None:
+            df["יישוב"] = out
+
+    # ---- מיני עץ ----
+    tree_cols = [
+        c for c in df.columns
+        if ("שם   מין עץ" in c) or ("שם מין עץ" in c) or (c == "מין עץ")
+    ]
+    for col in tree_cols:
+        out = lookup_codes(df[col], tree_lut)
+        if out is not None:
+            df[col] = out
+
+    return df
+
+
+# ---------- סיווג פעולה: כריתה / העתקה ----------
+
+EXCLUDE_PRUNE = r"(דילול|גיזום|תחזוקה|טיפול|חידוש\s*צמרת|עיצוב\s*נוף)"
+INCLUDE_CUT = r"(כרית(?:ה|ות)?|כרת|כרות|כריתת)"
+INCLUDE_MOVE = r"(העתק(?:ה)?|שימור|transplant|preserv)"
+
+
+def classify_actions(
+    df: pd.DataFrame,
+    col_act1: str | None,
+    col_act2: str | None,
+    col_reason: str | None,
+):
+    """
+    יוצר דגלים בוליאניים:
+    - __is_cut__  → שורת כריתה
+    - __is_move__ → שורת העתקה/שימור
+    """
+    pieces = []
+    for c in (col_act1, col_act2, col_reason):
+        if c and c in df.columns:
+            pieces.append(df[c].astype(str))
+
+    if not pieces:
+        txt = pd.Series([""] * len(df), index=df.index)
+    else:
+        txt = pieces[0]
+        for p in pieces[1:]:
+            txt = txt.str.cat(p, sep=" ", na_rep="")
+
+    txt = (
+        txt.str.replace("\u200f", "", regex=False)
+           .str.replace("\u200e", "", regex=False)
+           .str.strip()
+    )
+
+    prune = txt.str.contains(EXCLUDE_PRUNE, case=False, regex=True, na=False)
+    cut = txt.str.contains(INCLUDE_CUT, case=False, regex=True, na=False) & ~prune
+    move = txt.str.contains(INCLUDE_MOVE, case=False, regex=True, na=False)
+
+    return cut.fillna(False), move.fillna(False)
+
+
+# ===================== שלבי הצינור =====================
+
+def load_luts(city_file, tree_file, stats: MergeStats | None = None) -> tuple[dict[int, str], dict[int, str]]:
+    """שלב 1: טעינת לוקאפ ערים / עצים מקבצי המפתח."""
+    with stage(stats, "load_city_lut") as rec:
+        city_lut = _load_city_lut(city_file)
+        rec["rows_out"] = len(city_lut)
+    with stage(stats, "load_tree_lut") as rec:
+        tree_lut = _load_tree_lut(tree_file)
+        rec["rows_out"] = len(tree_lut)
+    return city_lut, tree_lut
+
+
+def _as_source(f):
+    """נתיב נשאר נתיב; קובץ שהועלה (UploadedFile/BytesIO) הופך ל־bytes כדי שאפשר יהיה להעבירו לתהליך אחר."""
+    if isinstance(f, (str, Path)):
+        return str(f)
+    if isinstance(f, bytes):
+        return f
+    if hasattr(f, "getvalue"):
+        return f.getvalue()
+    f.seek(0)
+    return f.read()
+
+
+def _open_source(src, backend: str | None = None):
+    return open_workbook(io.BytesIO(src) if isinstance(src, bytes) else src, backend=backend)
+
+
+def _read_sheet(
+    wb, sname: str, log_rows: list[dict], stats: MergeStats | None, layouts=None, label: str | None = None,
+) -> list[pd.DataFrame]:
+    """label — השם שנרשם ב־__source_sheet__ וב־MappingLog (ברירת מחדל: שם הגיליון; ראו upload_sources.sheet_label)."""
+    label = label or sname
+    with stage(stats, "read_sheet", sheet=label) as rec:
+        parts = list(iter_sheet_chunks(wb[sname], label, log_rows, layouts=layouts))
+        rec["rows_out"] = sum(len(p) for p in parts)
+    return parts
+
+
+def _map_sheet_task(
+    ref: tuple, sname: str, layouts=None, label: str | None = None,
+) -> tuple[pd.DataFrame | None, list[dict], list[dict]]:
+    """
+    משימת worker: קורא וממפה גיליון בודד מתוך חוברת. ref — הפניה לחוברת (ראו upload_sources.open_ref):
+    החוברת, או החבר בארכיון, נפתחים בתוך ה־worker.
+    מחזיר (DataFrame או None, שורות MappingLog, רשומות מדידה). פריסות חדשות נשמרות למטמון מה־worker עצמו.
+    """
+    log_rows: list[dict] = []
+    stats = MergeStats()
+    wb = open_workbook(open_ref(ref))
+    try:
+        parts = _read_sheet(wb, sname, log_rows, stats, layouts, label)
+    finally:
+        wb.close()
+    if layouts is not None:
+        layouts.save()
+    return (pd.concat(parts, ignore_index=True) if parts else None), log_rows, stats.rows
+
+
+def read_and_map(
+    main_files,
+    workers: int = 1,
+    stats: MergeStats | None = None,
+    layouts=None,
+) -> tuple[pd.DataFrame, list[dict]]:
+    """
+    שלב 2: קריאה זורמת של כל הגליונות בקובץ/קבצי הדוחות, מיפוי ואיחוד ל־DataFrame אחד.
+    main_files — קובץ בודד או רשימת קבצים (נתיבים או קבצים שהועלו), כולל קובצי CSV / TSV
+    (גיליון אחד בשם הקובץ, ראו csv_backend) וארכיוני zip של חוברות
+    (ראו upload_sources: כל חבר בארכיון נפרס רק כשמגיעים אליו). עם יותר מחוברת אחת שם הגיליון
+    ב־__source_sheet__ הוא '<חוברת>/<גיליון>'.
+    workers > 1 — כל גיליון (מכל החוברות) נקרא וממופה בתהליך נפרד; הסדר הסופי
+    נשמר לפי סדר החוברות והגליונות, כך שהתוצאה זהה להרצה הסדרתית.
+    לתהליכים נשלחות רק הפניות (נתיב ושם חבר, ראו upload_sources.source_refs): קובץ שהועלה נכתב פעם אחת
+    לתיקייה זמנית, וכל worker פורס מהארכיון רק את החבר שלו.
+    layouts — LayoutCache אופציונלי (ראו layout_cache): פריסות גיליון מוכרות מדלגות על זיהוי הכותרת.
+    ההתקדמות מדווחת אחרי כל גיליון (report_progress — בעבודת רקע, ראו job_pool).
+    """
+    books = list_workbooks(main_files)
+    multi = len(books) > 1
+
+    merged_parts: list[pd.DataFrame] = []
+    log_rows: list[dict] = []
+
+    if workers <= 1:
+        for b, book in enumerate(books):
+            wb = open_workbook(book.open())
+            try:
+                for s, sname in enumerate(wb.sheetnames):
+                    label = sheet_label(book, sname, multi)
+                    merged_parts.extend(_read_sheet(wb, sname, log_rows, stats, layouts, label))
+                    report_progress((b + (s + 1) / len(wb.sheetnames)) / len(books), f"גיליון {label}")
+            finally:
+                wb.close()
+        if layouts is not None:
+            layouts.save()
+    else:
+        with tempfile.TemporaryDirectory(prefix="merge_src_") as tmp:
+            refs: list[tuple] = []
+            names: list[str] = []
+            labels: list[str] = []
+            for book, ref in zip(books, source_refs(books, tmp)):
+                wb = open_workbook(open_ref(ref))
+                try:
+                    sheetnames = wb.sheetnames
+                finally:
+                    wb.close()
+                refs += [ref] * len(sheetnames)
+                names += sheetnames
+                labels += [sheet_label(book, s, multi) for s in sheetnames]
+
+            with ProcessPoolExecutor(max_workers=workers) as ex:
+                tasks = ex.map(_map_sheet_task, refs, names, [layouts] * len(refs), labels)
+                for i, (part, sheet_log, sheet_stats) in enumerate(tasks):
+                    if part is not None:
+                        merged_parts.append(part)
+                    log_rows.extend(sheet_log)
+                    if stats is not None:
+                        stats.extend(sheet_stats)
+                    report_progress((i + 1) / len(refs), f"גיליון {labels[i]}")
+
+    with stage(stats, "concat", rows_in=sum(len(p) for p in merged_parts)) as rec:
+        merged = (
+            pd.concat(merged_parts, ignore_index=True)
+            if merged_parts else pd.DataFrame(columns=TARGET_COLS)
+        )
+        rec["rows_out"] = len(merged)
+    return merged, log_rows
+
+
+# ---------- כפילויות רישיונות בין גליונות ----------
+
+DEDUPE_KEY = ("מספר רישיון", "מ-תאריך", "גוש", "חלקה", "שם   מין עץ", "מספר עצים")
+DEDUPE_MODES = ("drop", "flag", "off")
+DUPLICATES_SHEET = "Duplicates"
+
+
+def _normalized(s: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    """
+    (קוד לכל שורה — ‎-1 לערך חסר, הערכים הייחודיים אחרי נירמול): norm_key (‎'48.0' / 48 / ' 48 ' → '48'),
+    ותאריכים — מספר ה־ns. הנירמול מחושב פעם אחת לכל ערך ייחודי (העלות לינארית).
+    """
+    codes, uniques = pd.factorize(s, use_na_sentinel=True)
+    if pd.api.types.is_datetime64_any_dtype(uniques.dtype):
+        return codes, np.asarray(uniques).view("int64")
+    return codes, np.array([norm_key(u) for u in uniques], dtype=object)
+
+
+def _value_hashes(s: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    """
+    hash של 64 ביט לכל שורה לפי הערך המנורמל (ראו _normalized), ומסכת ערכים קיימים.
+    ה־hash תלוי רק בתוכן — כך שאפשר להשוות בין מקטעים שונים (למשל במיזוג out-of-core).
+    """
+    codes, norm = _normalized(s)
+    present = codes >= 0
+    out = np.zeros(len(codes), dtype=np.uint64)
+    if not len(norm):
+        return out, present
+    out[present] = pd.util.hash_array(norm)[codes[present]]
+    return out, present
+
+
+def key_values(df: pd.DataFrame, key=DEDUPE_KEY) -> pd.DataFrame:
+    """
+    ערכי המפתח המנורמלים של כל שורה (באותו נירמול של ה־hash), כמחרוזות; ערך חסר — None.
+    משמש לאימות: שתי רשומות נחשבות כפולות רק אם הערכים עצמם זהים, ולא רק ה־hash.
+    עמודת מפתח שאינה בטבלה — None בכל השורות.
+    """
+    out = {}
+    for c in key:
+        if c not in df.columns:
+            out[c] = np.full(len(df), None, dtype=object)
+            continue
+        codes, norm = _normalized(df[c])
+        out[c] = np.append(norm.astype(str).astype(object), None)[codes]
+    return pd.DataFrame(out, index=df.index)
+
+
+def find_duplicates(df: pd.DataFrame, key=DEDUPE_KEY) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    מאתר רשומות כפולות לפי וקטור מפתח (עמודות שחסרות בטבלה מדולגות).
+    לכל שורה מחושב hash של 64 ביט מהערכים המנורמלים של עמודות המפתח, והמועמדות נמצאות בטבלת hash — O(n);
+    hash זהה הוא רק מועמד: השורות שה־hash שלהן חוזר (מעטות) נבדקות שוב לפי הערכים עצמם (key_values),
+    כך שהתנגשות hash לא מסירה רשומה. שורה בלי ערך בעמודת המפתח הראשונה (מספר רישיון) לעולם לא נחשבת כפולה.
+    מחזיר (hash לכל שורה, מסכה של שורות כפולות — כל מופע מלבד הראשון, מסכת שורות שנבדקו).
+    """
+    cols = [c for c in key if c in df.columns]
+    if not cols or df.empty:
+        none = np.zeros(len(df), dtype=bool)
+        return np.zeros(len(df), dtype=np.uint64), none, none
+    per_col = [_value_hashes(df[c]) for c in cols]
+    hashes = pd.util.hash_pandas_object(
+        pd.DataFrame({i: h for i, (h, _) in enumerate(per_col)}), index=False
+    ).to_numpy()
+    eligible = per_col[0][1]
+    dup = np.zeros(len(df), dtype=bool)
+    cand = np.flatnonzero(pd.Series(hashes).duplicated(keep=False).to_numpy() & eligible)
+    if len(cand):
+        dup[cand] = key_values(df.iloc[cand], cols).duplicated(keep="first").to_numpy()
+    return hashes, dup, eligible
+
+
+def dedupe(
+    merged: pd.DataFrame,
+    mode: str = "flag",
+    key=DEDUPE_KEY,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    שלב 6.5: טיפול בכפילויות רישיונות שמופיעים ביותר מגיליון אחד.
+    mode: 'drop' — המופעים החוזרים מוסרים (הראשון לפי סדר הגליונות נשמר);
+          'flag' — כל השורות נשארות ומסומנות בעמודה __is_dup__; 'off' — בלי בדיקה.
+    מחזיר (הטבלה, דוח כפילויות: כל המופעים של כל מפתח כפול, מקובצים לפי __dup_group__).
+    """
+    if mode not in DEDUPE_MODES:
+        raise ValueError(f"מצב כפילויות לא מוכר: {mode} (אפשר: {', '.join(DEDUPE_MODES)})")
+    if mode == "off":
+        return merged, pd.DataFrame()
+
+    hashes, dup, _ = find_duplicates(merged, key)
+    # כל המופעים (כולל הראשון) של מפתחות שיש להם כפילות; הקבוצות לפי הערכים עצמם, לא לפי ה־hash
+    rows = np.flatnonzero(pd.Series(hashes).isin(hashes[dup]).to_numpy())
+    cols = [c for c in key if c in merged.columns]
+    vals = key_values(merged.iloc[rows], cols)
+    groups = pd.factorize(pd.Series(list(vals.itertuples(index=False, name=None)), dtype=object))[0]
+    keep = np.isin(groups, groups[dup[rows]])
+    rows, groups = rows[keep], groups[keep]
+    report_cols = [c for c in cols + ["__source_sheet__"] if c in merged.columns]
+    report = merged.iloc[rows, merged.columns.get_indexer(report_cols)].copy()
+    report.insert(0, "__dup_group__", pd.factorize(groups)[0] + 1)
+    report["__kept__"] = ~dup[rows]
+    report = report.sort_values("__dup_group__", kind="stable")
+
+    if mode == "drop":
+        merged = merged.loc[~dup].reset_index(drop=True)
+    else:
+        merged["__is_dup__"] = dup
+    return merged, report
+
+
+def pick_flag_columns(merged: pd.DataFrame) -> tuple[str | None, str | None, str | None]:
+    """בוחר את העמודות שמהן נגזרים דגלי כריתה/העתקה (עדיפות לעמודות המפוענחות)."""
+    col_act1 = (
+        "פעולה_מפוענחת"
+        if "פעולה_מפוענחת" in merged.columns
+        else ("פעולה" if "פעולה" in merged.columns else None)
+    )
+    col_act2 = (
+        "פעולה_מפוענחת (2)"
+        if "פעולה_מפוענחת (2)" in merged.columns
+        else ("פעולה (2)" if "פעולה (2)" in merged.columns else None)
+    )
+    col_reason = (
+        "סיבה_מפוענחת"
+        if "סיבה_מפוענחת" in merged.columns
+        else (
+            "סיבה"
+            if "סיבה" in merged.columns
+            else ("סיבה  מילולית" if "סיבה  מילולית" in merged.columns else None)
+        )
+    )
+    return col_act1, col_act2, col_reason
+
+
+def postprocess(
+    merged: pd.DataFrame,
+    city_lut: dict[int, str],
+    tree_lut: dict[int, str],
+    stats: MergeStats | None = None,
+    sheet: str = "",
+) -> pd.DataFrame:
+    """שלבים 3–6: המרת קודים, פיענוח פעולה/סיבה, סידור עמודות, תאריכים ודגלים."""
+    n = len(merged)
+
+    # 3) המרת קודים → שמות (יישוב + מין עץ)
+    with stage(stats, "lookups", sheet=sheet, rows_in=n) as rec:
+        merged = apply_city_tree_lookups(merged, city_lut, tree_lut)
+        rec["rows_out"] = len(merged)
+
+    # 4) פיענוח פעולה/סיבה למלל
+    with stage(stats, "decode", sheet=sheet, rows_in=n) as rec:
+        merged = decode_action_reason(merged)
+        rec["rows_out"] = len(merged)
+
+    # 4.5) סידור העמודות כך שהקודים והטקסט יהיו אחד ליד השני
+    with stage(stats, "reorder", sheet=sheet, rows_in=n) as rec:
+        merged = reorder_columns(merged)
+        rec["rows_out"] = len(merged)
+
+    # 5) תאריכים
+    with stage(stats, "dates", sheet=sheet, rows_in=n) as rec:
+        for c in ("מ-תאריך", "עד-תאריך"):
+            if c in merged.columns:
+                # הפורמט מזוהה בנפרד לכל גיליון מקור
+                merged[c] = parse_dates(merged[c], groups=merged.get("__source_sheet__"))
+        rec["rows_out"] = len(merged)
+
+    # 6) דגלי כריתה/העתקה
+    with stage(stats, "classify", sheet=sheet, rows_in=n) as rec:
+        is_cut, is_move = classify_actions(merged, *pick_flag_columns(merged))
+        merged["__is_cut__"] = is_cut
+        merged["__is_move__"] = is_move
+        rec["rows_out"] = len(merged)
+    return merged
+
+
+# כל כמה שורות נכתב דיווח התקדמות בזמן כתיבת גיליון
+PROGRESS_ROWS = 5000
+
+# עיצוב שורת הכותרת — זהה לברירת המחדל של pandas.to_excel
+_HEADER_FONT = Font(bold=True)
+_HEADER_BORDER = Border(left=Side(style="thin"), right=Side(style="thin"),
+                        top=Side(style="thin"), bottom=Side(style="thin"))
+_HEADER_ALIGN = Alignment(horizontal="center", vertical="top")
+_DATE_ALIGN = Alignment(horizontal="right")
+
+DATE_COLS = ("מ-תאריך", "עד-תאריך")
+COL_WIDTHS = {
+    "מ-תאריך": 16,
+    "עד-תאריך": 16,
+    "יישוב": 22,
+    "שם   מין עץ": 22,
+    "הערות": 26,
+    "פעולה_מפוענחת": 14,
+    "פעולה_מפוענחת (2)": 16,
+    "סיבה_מפוענחת": 16,
+}
+PIVOT_WIDTHS = {"שנה": 8, "יישוב": 22, "מין עץ": 22, "סיבה": 24, "פעולה": 14}
+
+
+def _column_values(s: pd.Series) -> list:
+    """ממיר עמודה לרשימת ערכי פייתון; ערכים חסרים → None (תא ריק)."""
+    if pd.api.types.is_datetime64_any_dtype(s):
+        # datetime של פייתון (לא Timestamp); Series.dt.to_pydatetime מוצא משימוש — דרך DatetimeIndex
+        vals = pd.DatetimeIndex(s).to_pydatetime()
+    else:
+        vals = s.to_numpy(dtype=object)
+    na = pd.isna(vals)
+    if na.any():
+        vals = vals.copy()
+        vals[na] = None
+    return vals.tolist()
+
+
+def _write_frame(wb, title: str, df: pd.DataFrame, date_cols=(), widths=None) -> None:
+    """
+    כותב DataFrame לגיליון write-only במעבר אחד, כולל רוחב עמודות ועיצוב תאריכים.
+    ההתקדמות מדווחת כל PROGRESS_ROWS שורות (report_progress).
+    """
+    ws = wb.create_sheet(title)
+    cols = [str(c) for c in df.columns]
+    for name, width in (widths or {}).items():
+        if name in cols:
+            ws.column_dimensions[get_column_letter(cols.index(name) + 1)].width = width
+
+    header = []
+    for name in cols:
+        cell = WriteOnlyCell(ws, value=name)
+        cell.font = _HEADER_FONT
+        cell.border = _HEADER_BORDER
+        cell.alignment = _HEADER_ALIGN
+        header.append(cell)
+    ws.append(header)
+
+    columns = [_column_values(df.iloc[:, i]) for i in range(df.shape[1])]
+    date_idx = [i for i, name in enumerate(cols) if name in date_cols]
+    text = f"כתיבת Excel · גיליון {title}"
+    if not date_idx:
+        for n, row in enumerate(zip(*columns), 1):
+            ws.append(row)
+            if n % PROGRESS_ROWS == 0:
+                report_progress(n / len(df), text)
+        return
+
+    for n, row in enumerate(zip(*columns), 1):
+        row = list(row)
+        for i in date_idx:
+            cell = WriteOnlyCell(ws, value=row[i])
+            cell.number_format = "yyyy-mm-dd"
+            cell.alignment = _DATE_ALIGN
+            row[i] = cell
+        ws.append(row)
+        if n % PROGRESS_ROWS == 0:
+            report_progress(n / len(df), text)
+
+
+def write_excel(
+    merged: pd.DataFrame,
+    log_rows: list[dict],
+    duplicates: pd.DataFrame | None = None,
+    pivots: dict[str, pd.DataFrame] | None = None,
+) -> bytes:
+    """
+    שלב 7: כתיבה ל־Excel + עיצוב עמודות. מחזיר את תוכן קובץ ה־xlsx.
+    הכתיבה במצב write-only: רוחב עמודות, פורמט תאריכים ויישור נקבעים בזמן הכתיבה,
+    בלי לטעון את הקובץ מחדש ובלי לולאה נוספת על התאים.
+    duplicates — דוח הכפילויות (ראו dedupe); נכתב לגיליון Duplicates אם אינו ריק.
+    pivots — טבלאות מסכמות ({שם גיליון: DataFrame}, ראו bi_aggregations.build_pivots); נכתבות מיד אחרי Merged,
+             כדי שדוחות קטנים ב־Excel / Power BI לא יצטרכו לבנות Pivot על השורות הגולמיות.
+    """
+    sheets = [("Merged", merged, {"date_cols": DATE_COLS, "widths": COL_WIDTHS})]
+    sheets += [(title, table, {"widths": PIVOT_WIDTHS}) for title, table in (pivots or {}).items()]
+    sheets += [
+        ("TargetHeaders", pd.DataFrame({"TargetColumns": TARGET_COLS}), {}),
+        ("MappingLog", pd.DataFrame(log_rows), {}),
+    ]
+    if duplicates is not None and not duplicates.empty:
+        sheets.append((DUPLICATES_SHEET, duplicates, {"date_cols": DATE_COLS, "widths": COL_WIDTHS}))
+
+    wb = Workbook(write_only=True)
+    # ההתקדמות לפי מספר השורות שנכתבו מכל הגליונות; השמירה (דחיסת ה־zip) — 10% האחרונים
+    total = sum(len(df) for _, df, _ in sheets) or 1
+    done = 0
+    for title, df, options in sheets:
+        with progress_span(0.9 * done / total, 0.9 * (done + len(df)) / total):
+            _write_frame(wb, title, df, **options)
+        done += len(df)
+
+    report_progress(0.9, "כתיבת Excel · שמירת הקובץ")
+    final = io.BytesIO()
+    wb.save(final)
+    return final.getvalue()
+
+
+# ---------- סכמה קומפקטית לטבלה הממוזגת ----------
+# הטבלה נבנית כ־object בכל העמודות (ראו sheet_reader.assemble_chunk); בסוף הצינור כל עמודה מוכרת מקבלת טיפוס צפוף:
+# ערכים חוזרים → category, מונים וקודי קרקע → מספר שלם nullable קטן, דגלים → bool, תאריכים → datetime.
+
+CATEGORY_COLS = ("יישוב", "שם   מין עץ", "אזור", "פעולה_מפוענחת", "סיבה_מפוענחת", "__source_sheet__")
+INT_COLS = ("מספר עצים", "גוש", "חלקה")
+BOOL_COLS = ("__is_cut__", "__is_move__", "__is_dup__")
+_INT_DTYPES = ("Int8", "Int16", "Int32", "Int64")
+
+
+def frame_mb(df: pd.DataFrame) -> float:
+    """הזיכרון שהטבלה תופסת (כולל תוכן המחרוזות) ב־MB."""
+    return round(df.memory_usage(deep=True).sum() / 2**20, 2)
+
+
+def _to_small_int(s: pd.Series) -> pd.Series | None:
+    """
+    המרה ל־Int8/16/32/64 (הקטן שמכיל את הטווח) — רק אם כל ערך קיים הוא מספר שלם.
+    ערך כמו '11607-11606' או '29, 19' (כמה גושים/חלקות בתא אחד) מחזיר None, כדי לא לאבד מידע.
+    """
+    if pd.api.types.is_integer_dtype(s.dtype):
+        num = s
+    else:
+        num = pd.to_numeric(s, errors="coerce")
+        present = s.notna().to_numpy()
+        if (num.isna().to_numpy() & present).any():
+            return None
+        vals = num.to_numpy(dtype=float, na_value=np.nan)
+        if not np.array_equal(vals[present], np.round(vals[present])):
+            return None
+    if not num.notna().any():
+        return num.astype("Int8")
+    lo, hi = num.min(), num.max()
+    for dtype in _INT_DTYPES:
+        info = np.iinfo(dtype.lower())
+        if info.min <= lo and hi <= info.max:
+            return num.astype(dtype)
+    return None
+
+
+def apply_schema(merged: pd.DataFrame) -> tuple[pd.DataFrame, dict]:
+    """
+    ממיר את הטבלה הממוזגת לסכמה הקומפקטית (CATEGORY_COLS / INT_COLS / BOOL_COLS / DATE_COLS).
+    ההמרה שומרת את הערכים: category שומר את הערך המקורי (גם קוד מספרי שלא נמצא בטבלת הקודים),
+    ועמודה ב־INT_COLS שיש בה ערך שאינו מספר שלם נשמרת כ־category במקום להיחתך.
+    מחזיר (הטבלה, דוח): זיכרון לפני/אחרי ב־MB ומיפוי עמודה → הטיפוס שנבחר.
+    """
+    before = frame_mb(merged)
+    out = merged.copy(deep=False)
+    dtypes: dict[str, str] = {}
+    for c in merged.columns:
+        s = merged[c]
+        if c in INT_COLS:
+            conv = _to_small_int(s)
+            out[c] = conv if conv is not None else s.astype("category")
+        elif c in CATEGORY_COLS:
+            out[c] = s if isinstance(s.dtype, pd.CategoricalDtype) else s.astype("category")
+        elif c in BOOL_COLS:
+            out[c] = s.fillna(False).astype(bool) if s.dtype != bool else s
+        elif c in DATE_COLS:
+            out[c] = s if pd.api.types.is_datetime64_any_dtype(s) else pd.to_datetime(s, errors="coerce")
+        else:
+            continue
+        dtypes[c] = str(out[c].dtype)
+    return out, {"frame_mb_before": before, "frame_mb_after": frame_mb(out), "dtypes": dtypes}
+
+
+# ---------- ייצוא עמודתי (Parquet) ----------
+
+
+def to_parquet_frame(merged: pd.DataFrame) -> pd.DataFrame:
+    """
+    מכין את הדאטה הממוזג לשמירה עמודתית: יישוב/מין עץ/סיבה וכו' כ־category,
+    עמודות מספריות כמספרים, ועמודות עם ערכים מעורבים (קוד/טקסט) כמחרוזות.
+    דגלים, תאריכים ועמודות שכבר הומרו ב־apply_schema נשמרים בטיפוס שלהם.
+    """
+    out = {}
+    for c in merged.columns:
+        s = merged[c]
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            # אחרי apply_schema: קטגוריות מעורבות (קוד מספרי / טקסט) → קטגוריות מחרוזת אחידות ל־Parquet
+            if pd.api.types.infer_dtype(s.cat.categories, skipna=True) != "string":
+                s = s.astype("string").astype("category")
+            out[c] = s
+            continue
+        if s.dtype != object:
+            out[c] = s
+            continue
+        kind = pd.api.types.infer_dtype(s, skipna=True)
+        if c in CATEGORY_COLS:
+            out[c] = s.astype("string").astype("category")
+        elif kind in ("integer", "floating", "mixed-integer-float"):
+            out[c] = pd.to_numeric(s, errors="coerce")
+        elif kind in ("string", "empty"):
+            out[c] = s
+        else:
+            out[c] = s.astype("string")
+    return pd.DataFrame(out, index=merged.index)
+
+
+def to_parquet_bytes(merged: pd.DataFrame) -> bytes:
+    """קובץ Parquet דחוס (zstd) של הדאטה הממוזג; מחרוזת ריקה אם pyarrow לא מותקן."""
+    if not HAVE_PYARROW:
+        return b""
+    buf = io.BytesIO()
+    to_parquet_frame(merged).to_parquet(buf, engine="pyarrow", compression="zstd", index=False)
+    return buf.getvalue()
+
+
+@dataclass
+class MergeResult:
+    """
+    תוצאת מיזוג מלאה: הדאטה הממוזג, יומן המיפוי, קובץ ה־xlsx המוכן, Parquet (אם pyarrow מותקן)
+    ורשומות המדידה לכל שלב/גיליון (ראו merge_stats), דוח הכפילויות (ראו dedupe) והטבלאות המסכמות (גליונות Pivot).
+    """
+    merged: pd.DataFrame
+    log_rows: list[dict] = field(default_factory=list)
+    xlsx: bytes = b""
+    parquet: bytes = b""
+    stats: list[dict] = field(default_factory=list)
+    duplicates: pd.DataFrame | None = None
+    pivots: dict[str, pd.DataFrame] = field(default_factory=dict)
+
+
+def _default_layouts() -> LayoutCache | None:
+    try:
+        return LayoutCache()
+    except OSError:
+        return None
+
+
+def merge_cache_key(
+    cache, main_file, city_file, tree_file, dedupe_mode: str = "flag", digests: dict | None = None,
+) -> str:
+    """
+    מפתח המטמון של הרצה: תוכן הקבצים + האפשרויות שמשנות את התוצאה, וגם שמות החוברות —
+    מהם נגזרים שמות הגליונות ב־__source_sheet__ וב־MappingLog (ראו sheet_label), כך שקובץ ששמו שונה
+    לא מקבל תוצאה ישנה עם התוויות הקודמות.
+    digests — file_digest שכבר חושבו לפי סוג ({'main': [...], 'city': ..., 'tree': ...}).
+    """
+    if not isinstance(main_file, (list, tuple)):
+        main_file = [main_file]
+    names = json.dumps([b.name for b in list_workbooks(main_file)], ensure_ascii=False)
+    return cache.key(main_file, city_file, tree_file, options=f"dedupe={dedupe_mode}|sources={names}",
+                     digests=[digests[k] for k in ("main", "city", "tree")] if digests else None)
+
+
+def _save_snapshot(snapshots, merged: pd.DataFrame, main_files, dedupe_mode: str) -> str:
+    return snapshots.save(merged, label=f"dedupe={dedupe_mode}",
+                          sources=[b.name for b in list_workbooks(main_files)])
+
+
+def run_merge(
+    main_file,
+    city_file,
+    tree_file,
+    workers: int = 1,
+    cache=None,
+    layouts=None,
+    dedupe_mode: str = "flag",
+    mapped: tuple[pd.DataFrame, list[dict], list[dict]] | None = None,
+    snapshots=None,
+) -> MergeResult:
+    """
+    מריץ את כל צינור המיזוג. הקבצים יכולים להיות נתיבים או אובייקטי קובץ (UploadedFile/BytesIO);
+    main_file יכול להיות גם רשימת חוברות. workers > 1 — קריאת הגליונות במקביל (ראו read_and_map).
+    cache — MergeCache אופציונלי: אם אותם קבצים כבר מוזגו, התוצאה מוחזרת מהדיסק.
+    layouts — LayoutCache; ברירת המחדל היא מטמון הפריסות הקבוע בתיקיית המטמון.
+    dedupe_mode — 'drop' / 'flag' / 'off' (ראו dedupe).
+    mapped — תוצאת read_and_map שכבר חושבה (DataFrame, MappingLog, רשומות מדידה), למשל ברקע עם ההעלאה
+             (ראו upload_prefetch); במקרה כזה הקובץ לא נקרא שוב. ה־DataFrame לא משתנה (נעשה עותק).
+    snapshots — SnapshotStore אופציונלי (ראו merge_snapshots): התוצאה נשמרת בו כגרסה להשוואה בין הרצות
+                (גם כשהיא מגיעה מהמטמון; תוכן זהה לגרסה האחרונה לא נשמר שוב).
+    ההתקדמות מדווחת לכל גיליון ולכל שלב (report_progress), כשהמיזוג רץ כעבודת רקע (ראו job_pool).
+    """
+    if not isinstance(main_file, (list, tuple)):
+        main_file = [main_file]
+
+    if cache is not None:
+        key = merge_cache_key(cache, main_file, city_file, tree_file, dedupe_mode)
+        hit = cache.get(key)
+        if hit is not None:
+            if snapshots is not None:
+                _save_snapshot(snapshots, hit.merged, main_file, dedupe_mode)
+            return hit
+
+    stats = MergeStats()
+    with stats.track_peak(), stage(stats, "total") as total:
+        report_progress(0.0, "טבלאות קודים")
+        city_lut, tree_lut = load_luts(city_file, tree_file, stats=stats)
+        if layouts is None:
+            layouts = _default_layouts()
+        if mapped is not None:
+            merged, log_rows, read_stats = mapped
+            merged, log_rows = merged.copy(), list(log_rows)
+            stats.extend(read_stats)
+        else:
+            with progress_span(0.05, 0.6):
+                merged, log_rows = read_and_map(main_file, workers=workers, stats=stats, layouts=layouts)
+        report_progress(0.6, "פיענוח קודים ותאריכים")
+        merged = postprocess(merged, city_lut, tree_lut, stats=stats)
+        report_progress(0.7, "סכמה וכפילויות")
+        with stage(stats, "schema", rows_in=len(merged)) as rec:
+            merged, report = apply_schema(merged)
+            rec.update(rows_out=len(merged), frame_mb_before=report["frame_mb_before"],
+                       frame_mb_after=report["frame_mb_after"])
+        with stage(stats, "dedupe", rows_in=len(merged)) as rec:
+            merged, duplicates = dedupe(merged, dedupe_mode)
+            rec["rows_out"] = len(merged)
+        report_progress(0.75, "טבלאות מסכמות")
+        with stage(stats, "pivots", rows_in=len(merged)) as rec:
+            pivots = build_pivots(merged)
+            rec["rows_out"] = sum(len(p) for p in pivots.values())
+        report_progress(0.8, "כתיבת Excel")
+        with stage(stats, "write_excel", rows_in=len(merged)), progress_span(0.8, 0.95):
+            xlsx = write_excel(merged, log_rows, duplicates, pivots)
+        report_progress(0.95, "כתיבת Parquet")
+        with stage(stats, "write_parquet", rows_in=len(merged)):
+            parquet = to_parquet_bytes(merged)
+        if snapshots is not None:
+            report_progress(0.98, "שמירת גרסה")
+            with stage(stats, "snapshot", rows_in=len(merged)):
+                _save_snapshot(snapshots, merged, main_file, dedupe_mode)
+        total["rows_out"] = len(merged)
+    result = MergeResult(
+        merged=merged, log_rows=log_rows, xlsx=xlsx, parquet=parquet,
+        stats=stats.rows, duplicates=duplicates, pivots=pivots,
+    )
+
+    if cache is not None:
+        cache.put(key, result)
+    return result
+
+
+# ===================== CLI =====================
+
+def main():
+    ap = argparse.ArgumentParser(description="מיזוג דוחות כריתה לקובץ BI אחד (ללא דפדפן)")
+    ap.add_argument("main_files", nargs="+", help="קובץ/קבצי דוחות כריתה (xlsx / csv / tsv, ללא גליונות רשימות), או ארכיוני zip שלהם")
+    ap.add_argument("--cities", required=True, help="קובץ 'רשימת ערים לפי קודים'")
+    ap.add_argument("--trees", required=True, help="קובץ 'רשימת עצים לפי קודים'")
+    ap.add_argument("-o", "--output", default=OUTPUT_NAME, help=f"נתיב קובץ הפלט (ברירת מחדל: {OUTPUT_NAME})")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="מספר תהליכים לקריאת גליונות במקביל (0 = כל הליבות; ברירת מחדל: 1 — סדרתי)")
+    ap.add_argument("--parquet", default=None, help=f"נתיב לקובץ Parquet נוסף (למשל {PARQUET_NAME}; דורש pyarrow)")
+    ap.add_argument("--incremental", default=None, metavar="STORE_DIR",
+                    help="מיזוג מצטבר: רק גליונות חדשים/ששונו מעובדים, השאר נטענים מתיקיית המאגר")
+    ap.add_argument("--dataset", default=None, metavar="DATASET_DIR",
+                    help="מיזוג out-of-core לארכיון גדול: כתיבה ישירה למאגר Parquet מחולק לפי שנה/אזור בתיקייה זו")
+    ap.add_argument("--xlsx", choices=("none", "sample", "full"), default="none",
+                    help="עם --dataset: האם להפיק גם קובץ Excel — none (ברירת מחדל), sample (מדגם) או full")
+    ap.add_argument("--dedupe", choices=DEDUPE_MODES, default="flag",
+                    help="רישיונות כפולים בין גליונות: flag — סימון ב־__is_dup__ (ברירת מחדל), drop — הסרה, off — בלי בדיקה")
+    ap.add_argument("--timings", default=None,
+                    help="נתיב לקובץ JSON עם זמני השלבים (ברירת מחדל: <פלט>.timings.json; '-' לביטול)")
+    ap.add_argument("--cache-dir", default=None, help="תיקיית מטמון לתוצאות מיזוג (ללא — בלי מטמון)")
+    ap.add_argument("--snapshots", default=None, metavar="SNAPSHOT_DIR",
+                    help="שמירת התוצאה כגרסה בתיקייה זו, להשוואה בין הרצות (python merge_snapshots.py <תיקייה>)")
+    ap.add_argument("--reader", choices=("auto", *BACKENDS), default=None,
+                    help=f"מנוע קריאת Excel (ברירת מחדל: {BACKEND_ENV} או auto — calamine אם מותקן)")
+    args = ap.parse_args()
+    if args.reader:
+        # דרך משתנה הסביבה, כדי שגם תהליכי ה־workers יקראו באותו מנוע
+        os.environ[BACKEND_ENV] = args.reader
+
+    for p in (*args.main_files, args.cities, args.trees):
+        if not Path(p).is_file():
+            raise SystemExit(f"שגיאה: הקובץ לא קיים: {p}")
+
+    workers = args.workers or os.cpu_count() or 1
+    snapshots = None
+    if args.snapshots:
+        from merge_snapshots import SnapshotStore
+        snapshots = SnapshotStore(args.snapshots)
+    if args.dataset:
+        from out_of_core import run_partitioned_merge
+        result = run_partitioned_merge(args.main_files, args.cities, args.trees, args.dataset,
+                                       xlsx=None if args.xlsx == "none" else args.xlsx,
+                                       dedupe_mode=args.dedupe, snapshots=snapshots)
+        manifest = result.manifest
+        print(f"{manifest['rows']:,} שורות נכתבו אל {args.dataset} ({manifest['files']:,} קבצים)")
+        if manifest.get("snapshot"):
+            print(f"גרסה {manifest['snapshot']} נשמרה ב־{args.snapshots}")
+        if result.xlsx:
+            Path(args.output).write_bytes(result.xlsx)
+            print(f"{len(result.sample):,} שורות נכתבו אל {args.output}")
+        if manifest["duplicates"]:
+            mark, verb = ("⚠️ ", "הוסרו") if args.dedupe == "drop" else ("", "סומנו")
+            print(f"{mark}{manifest['duplicates']:,} רשומות כפולות {verb}")
+        peak = peak_mb(result.stats)
+        if peak is not None:
+            print(f"שיא זיכרון: {peak:,.0f} MB")
+        return
+    if args.incremental:
+        if len(args.main_files) != 1 or is_archive(args.main_files[0]):
+            raise SystemExit("שגיאה: מיזוג מצטבר תומך בקובץ דוחות אחד (לא ארכיון)")
+        from incremental_merge import run_incremental_merge
+        result = run_incremental_merge(args.main_files[0], args.cities, args.trees,
+                                       store_dir=args.incremental, workers=workers,
+                                       dedupe_mode=args.dedupe)
+        if snapshots is not None:
+            _save_snapshot(snapshots, result.merged, args.main_files, args.dedupe)
+    else:
+        cache = None
+        if args.cache_dir:
+            from merge_cache import MergeCache
+            cache = MergeCache(args.cache_dir)
+        result = run_merge(args.main_files, args.cities, args.trees, workers=workers, cache=cache,
+                           dedupe_mode=args.dedupe, snapshots=snapshots)
+    Path(args.output).write_bytes(result.xlsx)
+    if args.timings != "-":
+        timings = Path(args.timings) if args.timings else Path(args.output).with_suffix(".timings.json")
+        timings.write_text(json.dumps(result.stats, ensure_ascii=False, indent=1), encoding="utf-8")
+    if args.parquet:
+        if not result.parquet:
+            raise SystemExit("שגיאה: לייצוא Parquet יש להתקין את pyarrow")
+        Path(args.parquet).write_bytes(result.parquet)
+    print(f"{len(result.merged):,} שורות נכתבו אל {args.output}")
+    if snapshots is not None:
+        print(f"גרסה {snapshots.resolve('latest')['id']} נשמרה ב־{args.snapshots}")
+    if result.duplicates is not None and not result.duplicates.empty:
+        n_dup = int((~result.duplicates["__kept__"]).sum())
+        mark, verb = ("⚠️ ", "הוסרו") if args.dedupe == "drop" else ("", "סומנו")
+        print(f"{mark}{n_dup:,} רשומות כפולות {verb} (פירוט בגיליון {DUPLICATES_SHEET})")
+    mem = frame_memory(result.stats)
+    if mem is not None:
+        print(f"זיכרון הטבלה: {mem[0]:,.1f} MB → {mem[1]:,.1f} MB אחרי המרת הסכמה")
+    peak = peak_mb(result.stats)
+    if peak is not None:
+        print(f"שיא זיכרון: {peak:,.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
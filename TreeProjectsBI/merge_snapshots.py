@@ -0,0 +1,560 @@
+# -*- coding: utf-8 -*-
+"""
+merge_snapshots.py — גרסאות של תוצאת המיזוג והשוואה ברמת השורה בין שתי הרצות
+("אילו רישיונות נוספו, הוסרו או השתנו מאז ההרצה של החודש שעבר").
+כל מיזוג נשמר כגרסה בתיקיית מאגר: קובץ Parquet דחוס אחד לגרסה (vNNNN.parquet) ו־manifest.json עם רשימת
+הגרסאות (מזהה, זמן, מספר שורות, קבצי המקור). גרסה שזהה בתוכנה לאחרונה לא נשמרת שוב.
+לכל שורה נשמרים גם שלושה hash של 64 ביט, מחושבים בזמן השמירה מהערכים המנורמלים (‎'48.0' / ' 48' → '48',
+כמו norm_key בכפילויות, אבל וקטורית ב־pyarrow.compute):
+  __row_key__  — זהות השורה: מספר רישיון + יישוב + מין עץ (ROW_KEY);
+  __row_site__ — המיקום והמועד: גוש, חלקה, רחוב, מספר בית ותאריך ההתחלה (SITE_KEY);
+  __row_hash__ — התוכן: כל עמודות התבנית (DIFF_COLS).
+ההשוואה קוראת מכל גרסה רק את עמודות ה־hash, היישוב ומספר העצים, ומצמידה שורות בטבלאות hash — O(n):
+קודם שורות זהות בתוכנן, מהנותרות — לפי מפתח + מיקום, ואז לפי המפתח בלבד (שורה ששונתה; ברוב הדוחות אין
+מספר רישיון, כך שהמיקום מונע הצמדה של שורות זרות מאותו יישוב ומין); מה שנשאר לבד נוסף או הוסר.
+שורות מלאות נטענות רק לשורות ששונו, נוספו או הוסרו, כך שההשוואה מהירה גם בארכיון של מיליוני שורות.
+שימוש:
+  python merge_engine.py <קבצי דוחות...> --cities ... --trees ... --snapshots <תיקיית גרסאות>
+  python merge_snapshots.py <תיקיית גרסאות> --list
+  python merge_snapshots.py <תיקיית גרסאות> [--old v0001] [--new v0002] [-o snapshot_diff.xlsx]
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    HAVE_PYARROW = True
+except Exception:
+    HAVE_PYARROW = False
+
+try:
+    import fcntl
+except ImportError:  # Windows — בלי נעילה בין תהליכים
+    fcntl = None
+
+from lut_compiler import DEFAULT_CACHE_DIR
+from utils_he import TARGET_COLS
+from merge_engine import BOOL_COLS, COL_WIDTHS, DATE_COLS, PIPELINE_VERSION, _value_hashes, _write_frame
+
+MANIFEST_NAME = "manifest.json"
+DEFAULT_SNAPSHOT_DIR = DEFAULT_CACHE_DIR / "snapshots"
+DIFF_NAME = "snapshot_diff.xlsx"
+
+ROW_KEY = ("מספר רישיון", "יישוב", "שם   מין עץ")
+SITE_KEY = ("גוש", "חלקה", "רחוב", "מס'", "מ-תאריך")
+DIFF_COLS = tuple(c for c in TARGET_COLS if c != "__source_sheet__")
+CITY_COL = "יישוב"
+TREES_COL = "מספר עצים"
+KEY_COL = "__row_key__"
+SITE_COL = "__row_site__"
+HASH_COL = "__row_hash__"
+NO_CITY = "(ללא יישוב)"
+# עמודות עזר של המיזוג שלא נשמרות בגרסה (מספר שורה ושנה של מאגר out-of-core)
+SKIP_COLS = ("__row__", "שנה")
+# מגבלת השורות של גיליון Excel (פחות שורת הכותרת)
+EXCEL_MAX_ROWS = 1_048_575
+# גודל קבוצת שורות ב־Parquet: ההשוואה קוראת שורות מלאות רק מהקבוצות שיש בהן שורות שהשתנו
+ROW_GROUP_ROWS = 65_536
+_NUMBER = r"^-?\d+(\.\d+)?$"
+
+
+def _require_pyarrow() -> None:
+    if not HAVE_PYARROW:
+        raise RuntimeError("❌ גרסאות מיזוג דורשות את pyarrow (pip install pyarrow).")
+
+
+# ---------- hash לשורות ----------
+
+def _combine(parts: list[np.ndarray]) -> np.ndarray:
+    """hash אחד של 64 ביט לכל שורה מכמה וקטורי hash / מספרים באותו אורך."""
+    return pd.util.hash_pandas_object(pd.DataFrame(dict(enumerate(parts))), index=False).to_numpy()
+
+
+def _text_array(s: pd.Series):
+    """עמודת טקסט כמערך pyarrow, או None אם יש בה ערכים שאינם מחרוזות (תאריכים, דגלים, מספרים)."""
+    if s.dtype == "string":
+        return pa.array(s)
+    if s.dtype != object:
+        return None
+    try:
+        return pa.array(s, type=pa.string(), from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return None
+
+
+def _array_hashes(arr: "pa.Array") -> tuple[np.ndarray, np.ndarray]:
+    """
+    כמו merge_engine._value_hashes (hash לפי הערך המנורמל, ומסכת ערכים קיימים), אבל לעמודות טקסט
+    הנירמול רץ ב־pyarrow.compute על הערכים הייחודיים — בלי לולאת פייתון, גם כשכמעט כל ערך ייחודי
+    (מספרי רישיון, הערות). שאר הטיפוסים (תאריכים, דגלים) — דרך merge_engine._value_hashes.
+    """
+    if not pa.types.is_string(arr.type):
+        return _value_hashes(arr.to_pandas())
+    encoded = pc.dictionary_encode(arr)
+    text = pc.utf8_trim_whitespace(pc.replace_substring_regex(encoded.dictionary, "[\u200e\u200f]", ""))
+    values = text.to_numpy(zero_copy_only=False)
+    hit = pc.match_substring_regex(text, _NUMBER).to_numpy(zero_copy_only=False)
+    if hit.any():
+        nums = pc.cast(text.filter(pa.array(hit)), pa.float64()).to_numpy()
+        integral = (nums == np.floor(nums)) & (np.abs(nums) < 2 ** 53)
+        values[np.flatnonzero(hit)[integral]] = nums[integral].astype(np.int64).astype(str)
+    codes = encoded.indices.fill_null(-1).to_numpy()
+    present = codes >= 0
+    out = np.zeros(len(codes), dtype=np.uint64)
+    if len(values):
+        out[present] = pd.util.hash_array(values)[codes[present]]
+    return out, present
+
+
+def value_hashes(s: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    """_array_hashes לעמודת pandas (למשל שורות שנקראו מגרסה שמורה)."""
+    arr = _text_array(s)
+    return _value_hashes(s) if arr is None else _array_hashes(arr)
+
+
+HASH_COLS = {KEY_COL: ROW_KEY, SITE_COL: SITE_KEY, HASH_COL: DIFF_COLS}
+
+
+def row_hashes(table: "pa.Table") -> dict[str, np.ndarray]:
+    """
+    וקטור uint64 לכל עמודת hash (ראו HASH_COLS): מפתח השורה, המיקום והתוכן.
+    כל עמודה עוברת נירמול פעם אחת; עמודה שחסרה בטבלה — כמו עמודה ריקה.
+    """
+    empty = np.zeros(table.num_rows, dtype=np.uint64)
+    names = set(table.column_names)
+    per_col = {c: _array_hashes(table[c].combine_chunks())[0] if c in names else empty
+               for c in dict.fromkeys(c for cols in HASH_COLS.values() for c in cols)}
+    return {name: _combine([per_col[c] for c in cols]) for name, cols in HASH_COLS.items()}
+
+
+def _occurrence(ids: np.ndarray) -> np.ndarray:
+    """מספר המופע של כל ערך (0, 1, …) לפי הסדר — כדי שגם מפתחות שחוזרים יהיו ייחודיים."""
+    return pd.Series(ids).groupby(ids, sort=False).cumcount().to_numpy()
+
+
+def _unique_ids(ids: np.ndarray) -> np.ndarray:
+    return _combine([ids, _occurrence(ids)])
+
+
+# ---------- כתיבת גרסה ----------
+
+def _schema(frame: pd.DataFrame) -> "pa.Schema":
+    """סכמה קבועה לכל המקטעים: תאריכים ודגלים בטיפוס שלהם, ה־hash כ־uint64, וכל השאר מחרוזות."""
+    fields = []
+    for c in frame.columns:
+        if c in SKIP_COLS:
+            continue
+        if c in DATE_COLS and pd.api.types.is_datetime64_any_dtype(frame[c].dtype):
+            fields.append(pa.field(c, pa.timestamp("ns")))
+        elif c in BOOL_COLS:
+            fields.append(pa.field(c, pa.bool_()))
+        else:
+            fields.append(pa.field(c, pa.string()))
+    return pa.schema(fields + [pa.field(c, pa.uint64()) for c in HASH_COLS])
+
+
+def _string_array(s: pd.Series) -> "pa.Array":
+    """עמודה כמחרוזות: קטגוריות ומספרים — המרה של pyarrow; עמודה מעורבת (טקסט ומספרים) — דרך pandas."""
+    try:
+        arr = pa.array(s, from_pandas=True)
+        if pa.types.is_dictionary(arr.type):
+            arr = arr.dictionary_decode()
+        return arr if pa.types.is_string(arr.type) else pc.cast(arr, pa.string())
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        return pa.array(s.astype("string"))
+
+
+def _stored_table(frame: pd.DataFrame, schema: "pa.Schema") -> "pa.Table":
+    """המקטע כפי שיישמר, בלי עמודות ה־hash (שמחושבות ממנו — כך שהן תואמות את מה שנקרא בהשוואה)."""
+    arrays = []
+    for f in schema:
+        if f.name in HASH_COLS:
+            continue
+        if f.name not in frame.columns:
+            arrays.append(pa.nulls(len(frame), f.type))
+            continue
+        s = frame[f.name]
+        if pa.types.is_timestamp(f.type):
+            arrays.append(pa.array(pd.to_datetime(s, errors="coerce"), type=f.type, from_pandas=True))
+        elif pa.types.is_boolean(f.type):
+            arrays.append(pa.array(s.astype("boolean"), type=f.type))
+        else:
+            arrays.append(_string_array(s))
+    return pa.Table.from_arrays(arrays, schema=pa.schema([f for f in schema if f.name not in HASH_COLS]))
+
+
+class SnapshotWriter:
+    """
+    כתיבת גרסה במקטעים (למשל ממיזוג out-of-core): add לכל מקטע, close בסוף — מחזיר את מזהה הגרסה.
+    הקובץ נכתב לקובץ זמני ונרשם במניפסט רק ב־close; יציאה עם שגיאה (with) מוחקת אותו.
+    """
+
+    def __init__(self, store: "SnapshotStore", label: str = "", sources=()):
+        _require_pyarrow()
+        self.store = store
+        self.label = label
+        self.sources = list(sources)
+        self.rows = 0
+        self._tmp = store.root / f".tmp-{os.getpid()}-{time.time_ns()}.parquet"
+        self._writer = None
+        self._schema = None
+        self._digest = hashlib.sha256()
+
+    def add(self, frame: pd.DataFrame) -> None:
+        if self._schema is None:
+            self._schema = _schema(frame)
+            self._writer = pq.ParquetWriter(self._tmp, self._schema, compression="zstd")
+        table = _stored_table(frame, self._schema)
+        for name, values in row_hashes(table).items():
+            table = table.append_column(self._schema.field(name), pa.array(values))
+            self._digest.update(values.tobytes())
+        self._writer.write_table(table, row_group_size=ROW_GROUP_ROWS)
+        self.rows += len(frame)
+
+    def close(self) -> str:
+        if self._writer is None:
+            self.add(pd.DataFrame(columns=TARGET_COLS))
+        self._writer.close()
+        return self.store._commit(self._tmp, self.rows, self._digest.hexdigest(), self.label, self.sources)
+
+    def abort(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        self._tmp.unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+
+
+class SnapshotStore:
+    """
+    תיקיית גרסאות: manifest.json (רשימת הגרסאות לפי הסדר) וקובץ Parquet לכל גרסה.
+    מזהה גרסה — 'v0001', 'v0002', …; בכל מקום שמקבל מזהה אפשר גם 'latest' / 'previous'.
+    """
+
+    def __init__(self, root: str | Path | None = None):
+        self.root = Path(root) if root else DEFAULT_SNAPSHOT_DIR
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.manifest_path = self.root / MANIFEST_NAME
+
+    def versions(self) -> list[dict]:
+        try:
+            return json.loads(self.manifest_path.read_text(encoding="utf-8")).get("versions", [])
+        except (FileNotFoundError, json.JSONDecodeError):
+            return []
+
+    def resolve(self, ref: str | None = "latest") -> dict:
+        """רשומת המניפסט של גרסה לפי מזהה / 'latest' / 'previous'. גרסה שלא קיימת — ValueError."""
+        versions = self.versions()
+        ref = ref or "latest"
+        if ref in ("latest", "previous"):
+            need = 1 if ref == "latest" else 2
+            if len(versions) < need:
+                raise ValueError(f"אין מספיק גרסאות שמורות ב־{self.root} ({len(versions)})")
+            return versions[-need]
+        for v in versions:
+            if v["id"] == ref:
+                return v
+        raise ValueError(f"גרסה לא קיימת: {ref} (קיימות: {', '.join(v['id'] for v in versions) or 'אין'})")
+
+    def path(self, ref: str | None = "latest") -> Path:
+        return self.root / self.resolve(ref)["file"]
+
+    def load(self, ref: str | None = "latest", columns: list[str] | None = None) -> pd.DataFrame:
+        """הטבלה של גרסה (בלי עמודות ה־hash, אלא אם ביקשו אותן ב־columns)."""
+        _require_pyarrow()
+        table = pq.read_table(self.path(ref), columns=columns)
+        if columns is None:
+            table = table.drop(list(HASH_COLS))
+        return table.to_pandas()
+
+    def writer(self, label: str = "", sources=()) -> SnapshotWriter:
+        return SnapshotWriter(self, label, sources)
+
+    def save(self, frame: pd.DataFrame, label: str = "", sources=()) -> str:
+        """שומר את תוצאת המיזוג כגרסה חדשה ומחזיר את המזהה (אם התוכן זהה לגרסה האחרונה — את המזהה שלה)."""
+        with self.writer(label, sources) as w:
+            w.add(frame)
+            return w.close()
+
+    @contextmanager
+    def _locked(self):
+        """נעילה בין תהליכים (כמה מיזוגים שמסתיימים יחד) סביב הקצאת המזהה ועדכון המניפסט."""
+        with open(self.root / ".lock", "w") as fh:
+            if fcntl is not None:
+                fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def _commit(self, tmp: Path, rows: int, digest: str, label: str, sources: list[str]) -> str:
+        with self._locked():
+            versions = self.versions()
+            if versions and versions[-1]["digest"] == digest:
+                tmp.unlink(missing_ok=True)
+                return versions[-1]["id"]
+            n = int(versions[-1]["id"][1:]) + 1 if versions else 1
+            entry = {
+                "id": f"v{n:04d}",
+                "file": f"v{n:04d}.parquet",
+                "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "rows": rows,
+                "digest": digest,
+                "label": label,
+                "sources": sources,
+                "pipeline_version": PIPELINE_VERSION,
+            }
+            tmp.replace(self.root / entry["file"])
+            manifest_tmp = self.manifest_path.with_suffix(".tmp")
+            manifest_tmp.write_text(json.dumps({"versions": versions + [entry]}, ensure_ascii=False, indent=1),
+                                    encoding="utf-8")
+            manifest_tmp.replace(self.manifest_path)
+        return entry["id"]
+
+
+# ---------- השוואה ----------
+
+@dataclass
+class SnapshotDiff:
+    """
+    הבדלים בין שתי גרסאות. added / removed — השורות המלאות; modified — שורה לכל תא ששונה
+    (מפתח השורה, העמודה, הערך הקודם והחדש); by_city — לכל יישוב שהשתנה: שורות ועצים לפני/אחרי ומה השתנה.
+    """
+    old: str
+    new: str
+    summary: dict
+    added: pd.DataFrame = field(default_factory=pd.DataFrame)
+    removed: pd.DataFrame = field(default_factory=pd.DataFrame)
+    modified: pd.DataFrame = field(default_factory=pd.DataFrame)
+    by_city: pd.DataFrame = field(default_factory=pd.DataFrame)
+
+
+MATCH_TIERS = ((KEY_COL, SITE_COL, HASH_COL), (KEY_COL, SITE_COL), (KEY_COL,))
+
+
+def match_rows(old: pd.DataFrame, new: pd.DataFrame, tiers=MATCH_TIERS) -> dict[str, np.ndarray]:
+    """
+    מצמיד שורות של שתי גרסאות לפי עמודות ה־hash, בשלבים (tiers) — בכל שלב טבלת hash על השורות שעוד לא
+    הוצמדו, כך שהכול O(n). השלב הראשון (כולל hash התוכן) — שורות ללא שינוי; האחרים — שורות ששונו.
+    מפתח שחוזר כמה פעמים מוצמד לפי סדר ההופעה.
+    מחזיר אינדקסים (מיקומים): unchanged_old / unchanged_new, modified_old / modified_new (זוגות לפי הסדר),
+    removed (בגרסה הישנה) ו־added (בחדשה).
+    """
+    rest_old, rest_new = np.arange(len(old)), np.arange(len(new))
+    pairs = []
+    for cols in tiers:
+        ids_old = _unique_ids(_combine([old[c].to_numpy()[rest_old] for c in cols]))
+        ids_new = _unique_ids(_combine([new[c].to_numpy()[rest_new] for c in cols]))
+        pos = pd.Index(ids_new).get_indexer(ids_old)
+        hit = pos >= 0
+        pairs.append((rest_old[hit], rest_new[pos[hit]]))
+        new_left = np.ones(len(rest_new), dtype=bool)
+        new_left[pos[hit]] = False
+        rest_old, rest_new = rest_old[~hit], rest_new[new_left]
+    modified = [np.concatenate(side) for side in zip(*pairs[1:])] or [rest_old[:0], rest_new[:0]]
+    order = np.argsort(modified[1], kind="stable")
+    return {
+        "unchanged_old": pairs[0][0],
+        "unchanged_new": pairs[0][1],
+        "modified_old": modified[0][order],
+        "modified_new": modified[1][order],
+        "removed": rest_old,
+        "added": rest_new,
+    }
+
+
+def read_rows(path: Path, *idx: np.ndarray) -> list[pd.DataFrame]:
+    """
+    השורות במיקומים של כל אחד ממערכי idx (לפי הסדר שלו), בלי עמודות ה־hash — טבלה לכל מערך.
+    הקובץ נקרא פעם אחת, ורק קבוצות השורות (row groups) שמכילות את השורות המבוקשות — שינוי קטן
+    בארכיון גדול לא מחייב לקרוא את כולו.
+    """
+    pf = pq.ParquetFile(path)
+    columns = [c for c in pf.schema_arrow.names if c not in HASH_COLS]
+    wanted = np.concatenate(idx).astype(np.int64)
+    if not len(wanted):
+        return [pf.schema_arrow.empty_table().select(columns).to_pandas() for _ in idx]
+    sizes = np.array([pf.metadata.row_group(i).num_rows for i in range(pf.num_row_groups)])
+    starts = np.concatenate([[0], np.cumsum(sizes)])
+    group = np.searchsorted(starts, wanted, side="right") - 1
+    groups = np.unique(group)
+    offsets = np.concatenate([[0], np.cumsum(sizes[groups])])
+    local = wanted - starts[group] + offsets[np.searchsorted(groups, group)]
+    rows = pf.read_row_groups(groups.tolist(), columns=columns).take(pa.array(local)).to_pandas()
+    bounds = np.cumsum([0] + [len(i) for i in idx])
+    return [rows.iloc[a:b].reset_index(drop=True) for a, b in zip(bounds[:-1], bounds[1:])]
+
+
+def _numbers(arr: "pa.ChunkedArray") -> "pa.ChunkedArray":
+    """עמודת טקסט → float (טקסט שאינו מספר → ריק), ב־pyarrow.compute."""
+    text = pc.utf8_trim_whitespace(arr)
+    return pc.cast(pc.if_else(pc.match_substring_regex(text, _NUMBER), text, pa.scalar(None, pa.string())),
+                   pa.float64())
+
+
+def _changed_cells(old_rows: pd.DataFrame, new_rows: pd.DataFrame) -> pd.DataFrame:
+    """שורה לכל תא ששונה בין זוגות השורות (באותו סדר), עם מפתח השורה מהגרסה החדשה."""
+    keys = [c for c in ROW_KEY if c in new_rows.columns]
+    parts = []
+    for c in DIFF_COLS:
+        if c not in old_rows.columns and c not in new_rows.columns:
+            continue
+        h_old, p_old = value_hashes(old_rows[c]) if c in old_rows.columns else (None, None)
+        h_new, p_new = value_hashes(new_rows[c]) if c in new_rows.columns else (None, None)
+        if h_old is None or h_new is None:
+            changed = (p_new if h_old is None else p_old).copy()
+        else:
+            changed = (h_old != h_new) | (p_old != p_new)
+        if not changed.any():
+            continue
+        part = new_rows.loc[changed, keys].copy()
+        part["עמודה"] = c
+        part["ערך קודם"] = old_rows[c].to_numpy(dtype=object)[changed] if c in old_rows.columns else None
+        part["ערך חדש"] = new_rows[c].to_numpy(dtype=object)[changed] if c in new_rows.columns else None
+        part.insert(0, "__pair__", np.flatnonzero(changed))
+        parts.append(part)
+    if not parts:
+        return pd.DataFrame(columns=keys + ["עמודה", "ערך קודם", "ערך חדש"])
+    out = pd.concat(parts, ignore_index=True).sort_values("__pair__", kind="stable")
+    return out.drop(columns="__pair__").reset_index(drop=True)
+
+
+def _city_deltas(old_meta: pd.DataFrame, new_meta: pd.DataFrame, m: dict[str, np.ndarray]) -> pd.DataFrame:
+    def cities(meta):
+        return meta[CITY_COL].fillna(NO_CITY) if CITY_COL in meta.columns else pd.Series(NO_CITY, index=meta.index)
+
+    def trees(meta):
+        if TREES_COL not in meta.columns:
+            return pd.Series(0.0, index=meta.index)
+        return pd.to_numeric(meta[TREES_COL], errors="coerce").fillna(0)
+
+    c_old, c_new = cities(old_meta), cities(new_meta)
+    t_old, t_new = trees(old_meta), trees(new_meta)
+    out = pd.DataFrame({
+        "שורות קודם": c_old.value_counts(),
+        "שורות חדש": c_new.value_counts(),
+        "נוספו": c_new.iloc[m["added"]].value_counts(),
+        "הוסרו": c_old.iloc[m["removed"]].value_counts(),
+        "שונו": c_new.iloc[m["modified_new"]].value_counts(),
+        "עצים קודם": t_old.groupby(c_old.to_numpy()).sum(),
+        "עצים חדש": t_new.groupby(c_new.to_numpy()).sum(),
+    }).fillna(0)
+    out = out.astype({c: "int64" for c in ("שורות קודם", "שורות חדש", "נוספו", "הוסרו", "שונו")})
+    out["שינוי שורות"] = out["שורות חדש"] - out["שורות קודם"]
+    out["שינוי עצים"] = out["עצים חדש"] - out["עצים קודם"]
+    out = out[(out["נוספו"] + out["הוסרו"] + out["שונו"]) > 0]
+    out = out.assign(_abs=out["שינוי עצים"].abs(), _n=out["נוספו"] + out["הוסרו"] + out["שונו"])
+    out = out.sort_values(["_abs", "_n"], ascending=False, kind="stable").drop(columns=["_abs", "_n"])
+    return out.rename_axis(CITY_COL).reset_index()
+
+
+def diff_snapshots(store: SnapshotStore | str | Path | None = None, old: str | None = "previous",
+                   new: str | None = "latest") -> SnapshotDiff:
+    """
+    משווה שתי גרסאות במאגר (ברירת מחדל: האחרונה מול זו שלפניה).
+    store — SnapshotStore או נתיב התיקייה (נתיב — כדי שאפשר יהיה להריץ כעבודת רקע, ראו job_pool).
+    """
+    _require_pyarrow()
+    store = store if isinstance(store, SnapshotStore) else SnapshotStore(store)
+    v_old, v_new = store.resolve(old), store.resolve(new)
+    paths = store.root / v_old["file"], store.root / v_new["file"]
+
+    def meta(path):
+        names = set(pq.read_schema(path).names)
+        table = pq.read_table(path, columns=[*HASH_COLS, *(c for c in (CITY_COL, TREES_COL) if c in names)])
+        if TREES_COL in names and pa.types.is_string(table.schema.field(TREES_COL).type):
+            table = table.set_column(table.schema.get_field_index(TREES_COL), TREES_COL, _numbers(table[TREES_COL]))
+        return table.to_pandas()
+
+    old_meta, new_meta = (meta(p) for p in paths)
+    m = match_rows(old_meta, new_meta)
+    modified_old, removed = read_rows(paths[0], m["modified_old"], m["removed"])
+    modified_new, added = read_rows(paths[1], m["modified_new"], m["added"])
+    summary = {
+        "גרסה קודמת": v_old["id"],
+        "גרסה חדשה": v_new["id"],
+        "שורות קודם": len(old_meta),
+        "שורות חדש": len(new_meta),
+        "נוספו": len(m["added"]),
+        "הוסרו": len(m["removed"]),
+        "שונו": len(m["modified_new"]),
+        "ללא שינוי": len(m["unchanged_new"]),
+    }
+    return SnapshotDiff(
+        old=v_old["id"], new=v_new["id"], summary=summary,
+        added=added,
+        removed=removed,
+        modified=_changed_cells(modified_old, modified_new),
+        by_city=_city_deltas(old_meta, new_meta, m),
+    )
+
+
+def diff_to_excel(diff: SnapshotDiff) -> bytes:
+    """קובץ Excel של ההשוואה: Summary, ByCity, Added, Removed, Modified (כל גיליון עד מגבלת השורות של Excel)."""
+    summary = pd.DataFrame({"מדד": list(diff.summary), "ערך": list(diff.summary.values())})
+    wb = Workbook(write_only=True)
+    _write_frame(wb, "Summary", summary, widths={"מדד": 16, "ערך": 12})
+    _write_frame(wb, "ByCity", diff.by_city, widths={CITY_COL: 22})
+    for title, frame in (("Added", diff.added), ("Removed", diff.removed), ("Modified", diff.modified)):
+        _write_frame(wb, title, frame.head(EXCEL_MAX_ROWS), date_cols=DATE_COLS, widths=COL_WIDTHS)
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+# ===================== CLI =====================
+
+def main():
+    ap = argparse.ArgumentParser(description="גרסאות מיזוג שמורות והשוואה ביניהן (מה נוסף / הוסר / השתנה)")
+    ap.add_argument("store", nargs="?", default=None,
+                    help=f"תיקיית הגרסאות (ברירת מחדל: {DEFAULT_SNAPSHOT_DIR})")
+    ap.add_argument("--list", action="store_true", help="הצגת הגרסאות השמורות בלבד")
+    ap.add_argument("--old", default="previous", help="הגרסה הקודמת להשוואה (ברירת מחדל: previous)")
+    ap.add_argument("--new", default="latest", help="הגרסה החדשה להשוואה (ברירת מחדל: latest)")
+    ap.add_argument("-o", "--output", default=None, help=f"נתיב לקובץ Excel של ההשוואה (למשל {DIFF_NAME})")
+    ap.add_argument("--top", type=int, default=10, help="כמה יישובים להציג בסיכום (ברירת מחדל: 10)")
+    args = ap.parse_args()
+
+    store = SnapshotStore(args.store)
+    if args.list:
+        for v in store.versions():
+            print(f"{v['id']}  {v['created']}  {v['rows']:>10,} שורות  {v.get('label') or ''}")
+        return
+    try:
+        t0 = time.perf_counter()
+        diff = diff_snapshots(store, args.old, args.new)
+    except ValueError as e:
+        raise SystemExit(f"שגיאה: {e}")
+    s = diff.summary
+    print(f"{diff.old} → {diff.new}: {s['שורות קודם']:,} → {s['שורות חדש']:,} שורות  "
+          f"(נוספו {s['נוספו']:,}, הוסרו {s['הוסרו']:,}, שונו {s['שונו']:,}; {time.perf_counter() - t0:.2f} שנ')")
+    if not diff.by_city.empty:
+        print(diff.by_city.head(args.top).to_string(index=False))
+    if args.output:
+        Path(args.output).write_bytes(diff_to_excel(diff))
+        print(f"ההשוואה נכתבה אל {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+merge_stats.py — מדידת זמנים לשלבי צינור המיזוג.
+לכל שלב (ולכל גיליון) נרשמים: זמן ריצה, מספר שורות בכניסה וביציאה, שינוי בזיכרון התהליך (RSS)
+ושיא הזיכרון במהלך השלב (כשהדגימה ברקע פעילה — ראו MergeStats.track_peak).
+התוצאה מוצגת כטבלה בדף המיזוג ונשמרת כ־JSON ליד קובץ הפלט, כדי לעקוב אחרי רגרסיות לאורך זמן.
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+import pandas as pd
+
+try:
+    import psutil  # noqa
+    HAVE_PSUTIL = True
+except Exception:
+    HAVE_PSUTIL = False
+
+
+def rss_mb() -> float | None:
+    """זיכרון התהליך הנוכחי (RSS) ב־MB; None אם אין דרך למדוד במערכת הזו."""
+    if HAVE_PSUTIL:
+        return psutil.Process().memory_info().rss / 2**20
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except Exception:
+        return None
+
+
+COLUMNS = ["stage", "sheet", "seconds", "rows_in", "rows_out", "mem_delta_mb", "peak_mb"]
+
+
+class MergeStats:
+    """אוסף רשומות מדידה; כל רשומה היא dict עם העמודות שב־COLUMNS."""
+
+    def __init__(self, sample_interval: float = 0.02):
+        self.rows: list[dict] = []
+        self.sample_interval = sample_interval
+        self._peak: float | None = None
+        self._sampler: threading.Thread | None = None
+        self._stop = threading.Event()
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.sample_interval):
+            m = rss_mb()
+            if m is not None and (self._peak is None or m > self._peak):
+                self._peak = m
+
+    @contextmanager
+    def track_peak(self):
+        """דגימת RSS ב־thread ברקע לאורך הבלוק, כדי שכל שלב יקבל גם peak_mb (שיא הזיכרון בזמן השלב)."""
+        if rss_mb() is None:
+            yield
+            return
+        self._stop.clear()
+        self._peak = rss_mb()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+        try:
+            yield
+        finally:
+            self._stop.set()
+            self._sampler.join()
+            self._sampler = None
+
+    @property
+    def peak_mb(self) -> float | None:
+        return peak_mb(self.rows)
+
+    @contextmanager
+    def stage(self, name: str, sheet: str = "", rows_in: int | None = None):
+        """
+        מודד את הבלוק ומוסיף רשומה. הבלוק מקבל את הרשומה ויכול לעדכן בה rows_out:
+            with stats.stage("decode", rows_in=len(df)) as rec:
+                df = decode(df); rec["rows_out"] = len(df)
+        """
+        rec = {"stage": name, "sheet": sheet, "seconds": 0.0,
+               "rows_in": rows_in, "rows_out": None, "mem_delta_mb": None, "peak_mb": None}
+        m0 = rss_mb()
+        # שיא חיצוני נשמר בצד; בזמן השלב הדגימה מתחילה מהזיכרון הנוכחי
+        outer_peak, self._peak = self._peak, m0
+        t0 = time.perf_counter()
+        try:
+            yield rec
+        finally:
+            rec["seconds"] = round(time.perf_counter() - t0, 4)
+            m1 = rss_mb()
+            if m0 is not None and m1 is not None:
+                rec["mem_delta_mb"] = round(m1 - m0, 2)
+            if self._sampler is not None and self._peak is not None:
+                stage_peak = max(self._peak, m1 or 0)
+                rec["peak_mb"] = round(stage_peak, 2)
+                self._peak = stage_peak if outer_peak is None else max(outer_peak, stage_peak)
+            else:
+                self._peak = outer_peak
+            self.rows.append(rec)
+
+    def extend(self, rows: list[dict]) -> None:
+        self.rows.extend(rows)
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.rows, columns=COLUMNS)
+
+    def to_json(self) -> str:
+        return json.dumps(self.rows, ensure_ascii=False, indent=1)
+
+
+def peak_mb(rows: list[dict]) -> float | None:
+    """שיא הזיכרון שנמדד בהרצה (הערך הגבוה מבין כל השלבים); None אם לא נדגם."""
+    peaks = [r["peak_mb"] for r in rows if r.get("peak_mb") is not None]
+    return max(peaks) if peaks else None
+
+
+def frame_memory(rows: list[dict]) -> tuple[float, float] | None:
+    """זיכרון הטבלה הממוזגת (MB) לפני ואחרי המרת הסכמה — משלב schema; None אם השלב לא רץ."""
+    for r in rows:
+        if r.get("stage") == "schema" and r.get("frame_mb_before") is not None:
+            return r["frame_mb_before"], r["frame_mb_after"]
+    return None
+
+
+def stage(stats: MergeStats | None, name: str, sheet: str = "", rows_in: int | None = None):
+    """כמו MergeStats.stage, אבל בלי מדידה כשאין אובייקט stats (מחזיר dict ריק לעדכון)."""
+    if stats is None:
+        return nullcontext({})
+    return stats.stage(name, sheet=sheet, rows_in=rows_in)
+
+
+# ---------- דיווח התקדמות ----------
+# מאזין אחד לתהליך: בעבודת רקע (job_pool) הוא כותב את ההתקדמות לקובץ ובודק ביטול; בלי מאזין הדיווח לא עושה כלום.
+_listener = None
+_span = (0.0, 1.0)
+
+
+def set_progress_listener(fn) -> object:
+    """קובע את המאזין (fn(fraction, text)) ומחזיר את הקודם."""
+    global _listener
+    previous, _listener = _listener, fn
+    return previous
+
+
+def report_progress(fraction: float, text: str = "") -> None:
+    """
+    מדווח התקדמות (0–1) בתוך הטווח הנוכחי (ראו progress_span). המאזין יכול לזרוק חריגה
+    (job_pool.JobCancelled) — כך שנקודת הדיווח היא גם נקודת הביטול.
+    """
+    if _listener is None:
+        return
+    start, end = _span
+    _listener(start + (end - start) * min(max(fraction, 0.0), 1.0), text)
+
+
+@contextmanager
+def progress_span(start: float, end: float):
+    """דיווחים בתוך הבלוק (0–1) ממופים לטווח [start, end] של הטווח החיצוני — למשל שלב הקריאה מתוך כל המיזוג."""
+    global _span
+    outer = _span
+    width = outer[1] - outer[0]
+    _span = (outer[0] + width * start, outer[0] + width * end)
+    try:
+        yield
+    finally:
+        _span = outer
@@ -0,0 +1,398 @@
+# -*- coding: utf-8 -*-
+"""
+out_of_core.py — מיזוג ארכיון רב־שנתי בלי להחזיק את כל הדאטה בזיכרון.
+כל גיליון נקרא במקטעים (sheet_reader), כל מקטע עובר את אותם שלבי עיבוד (postprocess + כפילויות)
+ונכתב מיד למאגר Parquet בדיסק, מחולק לפי שנה ו'אזור' (‏<תיקייה>/שנה=2021/תיקיית_אזור=מרכז/part-….parquet).
+עמודות החלוקה הן עמודות עזר משלהן: 'אזור' עצמו נשמר בקבצים כפי שהוא, והמאגר נפתח גם ב־pd.read_parquet /
+pyarrow.dataset רגילים (עם עמודות החלוקה כעמודות נוספות).
+הזיכרון תלוי בגודל המקטע ולא בגודל הארכיון; קובץ xlsx (מלא או מדגם) נוצר רק כשמבקשים.
+ליד הדאטה נשמרים: ‎_merge_dataset.json (תיאור המאגר), ‎_mapping_log.parquet ו־‎_duplicates.parquet.
+עם snapshots — כל מקטע נכתב גם לגרסה חדשה במאגר הגרסאות (merge_snapshots), להשוואה בין הרצות.
+שימוש:
+  python merge_engine.py <קבצי דוחות...> --cities ... --trees ... --dataset <תיקייה> [--xlsx sample|full]
+"""
+from __future__ import annotations
+
+import json
+import shutil
+import tempfile
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    HAVE_PYARROW = True
+except Exception:
+    HAVE_PYARROW = False
+
+from bi_aggregations import build_pivots, merge_pivots
+from sheet_reader import iter_sheet_chunks, open_workbook
+from merge_stats import MergeStats, stage
+from upload_sources import list_workbooks, sheet_label
+from merge_engine import (
+    DATE_COLS,
+    _default_layouts,
+    DEDUPE_KEY,
+    DEDUPE_MODES,
+    PIPELINE_VERSION,
+    find_duplicates,
+    key_values,
+    load_luts,
+    postprocess,
+    write_excel,
+)
+
+MANIFEST_NAME = "_merge_dataset.json"
+LOG_NAME = "_mapping_log.parquet"
+DUPLICATES_NAME = "_duplicates.parquet"
+YEAR_COL = "שנה"
+AREA_COL = "תיקיית_אזור"
+PARTITION_COLS = (YEAR_COL, AREA_COL)
+# תיקייה לשורות בלי שנה / אזור: ערך חסר בחלוקה (‎__HIVE_DEFAULT_PARTITION__) מפיל את pd.read_parquet
+NO_YEAR = 0
+NO_AREA = "ללא"
+ROW_COL = "__row__"
+FLUSH_ROWS = 200_000
+SAMPLE_ROWS = 50_000
+BOOL_COLS = ("__is_cut__", "__is_move__", "__is_dup__")
+
+
+@dataclass
+class DatasetResult:
+    """
+    תוצאת מיזוג out-of-core: נתיב המאגר ותיאורו, יומן המיפוי, רשומות הכפילויות, מדידות,
+    הטבלאות המסכמות על כל הארכיון (גם כשה־xlsx הוא מדגם), ו־xlsx/מדגם רק אם התבקשו.
+    """
+    dataset_dir: Path
+    manifest: dict
+    log_rows: list[dict] = field(default_factory=list)
+    duplicates: pd.DataFrame | None = None
+    stats: list[dict] = field(default_factory=list)
+    sample: pd.DataFrame | None = None
+    xlsx: bytes = b""
+    pivots: dict[str, pd.DataFrame] = field(default_factory=dict)
+
+
+# ---------- הכנת מקטע לכתיבה ----------
+
+def _year(chunk: pd.DataFrame) -> pd.Series:
+    """שנת הרישיון: מ'מ-תאריך', ואם חסר — מ'עד-תאריך'; בלי שניהם — NO_YEAR."""
+    year = pd.Series(pd.NA, index=chunk.index, dtype="Int16")
+    for c in ("מ-תאריך", "עד-תאריך"):
+        if c in chunk.columns:
+            year = year.fillna(chunk[c].dt.year.astype("Int16"))
+    return year.fillna(NO_YEAR)
+
+
+def _partition_value(s: pd.Series) -> pd.Series:
+    """ערך 'אזור' כשם תיקייה (עמודת AREA_COL; 'אזור' עצמו לא משתנה): מחרוזת נקייה, בלי '/' ; ריק → NO_AREA."""
+    out = s.astype("string").str.strip().str.replace("/", "-", regex=False)
+    return out.mask(out == "").fillna(NO_AREA)
+
+
+def _arrow_schema(columns: list[str]) -> "pa.Schema":
+    """סכמה קבועה לכל המקטעים: תאריכים, דגלים ומספר שורה בטיפוס שלהם, וכל השאר מחרוזות (ללא איבוד מידע)."""
+    fields = []
+    for c in columns:
+        if c in DATE_COLS:
+            fields.append(pa.field(c, pa.timestamp("ns")))
+        elif c in BOOL_COLS:
+            fields.append(pa.field(c, pa.bool_()))
+        elif c == YEAR_COL:
+            fields.append(pa.field(c, pa.int16()))
+        elif c == ROW_COL:
+            fields.append(pa.field(c, pa.int64()))
+        else:
+            fields.append(pa.field(c, pa.string()))
+    return pa.schema(fields)
+
+
+def _to_arrow(frame: pd.DataFrame, schema: "pa.Schema") -> "pa.Table":
+    """
+    בלי מטא־הנתונים של pandas: עמודות החלוקה יוצאות מהקבצים ונקראות חזרה מהנתיב בטיפוס אחר
+    (dictionary), ומטא־נתונים שמתארים אותן כ־int16 מפילים את pd.read_parquet על המאגר.
+    """
+    cols = {}
+    for f in schema:
+        s = frame[f.name] if f.name in frame.columns else pd.Series(None, index=frame.index, dtype=object)
+        if pa.types.is_string(f.type) and s.dtype != "string":
+            s = s.astype("string")
+        cols[f.name] = s
+    table = pa.Table.from_pandas(pd.DataFrame(cols), schema=schema, preserve_index=False)
+    return table.replace_schema_metadata(None)
+
+
+def _to_arrow_file(frame: pd.DataFrame, path: Path) -> None:
+    """קובץ לוואי (יומן מיפוי / כפילויות) באותה סכמה — עמודות מעורבות נשמרות כמחרוזות."""
+    import pyarrow.parquet as pq
+    pq.write_table(_to_arrow(frame, _arrow_schema(list(frame.columns))), path, compression="zstd")
+
+
+class _SeenKeys:
+    """
+    המפתחות שכבר נכתבו. בזיכרון — רק hash המפתח ומספר סידורי של הרשומה, כמערכים ממוינים לפי ה־hash
+    (16 בתים לכל רשומה ייחודית); בדיקה — searchsorted על כל המקטע בבת אחת.
+    ערכי המפתח עצמם (merge_engine.key_values) נכתבים לקובץ Arrow זמני אחד לכל מקטע ב־spill_dir,
+    ונקראים חזרה רק לשורות שה־hash שלהן כבר נראה: רשומה נחשבת כפולה רק אם הערכים זהים, לא בהתנגשות hash.
+    """
+
+    def __init__(self, spill_dir: str | Path) -> None:
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.ids = np.empty(0, dtype=np.int64)
+        self._dir = Path(spill_dir)
+        self._starts = np.empty(0, dtype=np.int64)  # המספר הסידורי הראשון בכל קובץ
+        self._count = 0
+
+    def _path(self, part: int) -> Path:
+        return self._dir / f"keys-{part:05d}.arrow"
+
+    def _values(self, ids: np.ndarray) -> np.ndarray:
+        """ערכי המפתח השמורים לכל מספר סידורי (מערך object, שורה לכל מספר) — רק מהקבצים הדרושים."""
+        parts = np.searchsorted(self._starts, ids, side="right") - 1
+        out = None
+        for part in np.unique(parts):
+            sel = parts == part
+            with pa.memory_map(str(self._path(part))) as src:
+                table = pa.ipc.open_file(src).read_all()
+                rows = table.take(pa.array(ids[sel] - self._starts[part])).to_pandas().to_numpy(dtype=object)
+            if out is None:
+                out = np.empty((len(ids), rows.shape[1]), dtype=object)
+            out[sel] = rows
+        return out
+
+    def contains(self, hashes: np.ndarray, values: pd.DataFrame) -> np.ndarray:
+        lo = np.searchsorted(self.hashes, hashes, side="left")
+        hi = np.searchsorted(self.hashes, hashes, side="right")
+        found = np.zeros(len(hashes), dtype=bool)
+        hits = np.flatnonzero(hi > lo)
+        if not len(hits):
+            return found
+        # לכל שורה — כל הרשומות השמורות עם אותו hash (כמעט תמיד אחת)
+        n = (hi - lo)[hits]
+        rows = np.repeat(hits, n)
+        pos = np.repeat(lo[hits], n) + np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+        same = (self._values(self.ids[pos]) == values.to_numpy(dtype=object)[rows]).all(axis=1)
+        found[rows[same]] = True
+        return found
+
+    def add(self, hashes: np.ndarray, values: pd.DataFrame) -> None:
+        if not len(hashes):
+            return
+        table = pa.table({c: pa.array(values[c].to_numpy(dtype=object), type=pa.string()) for c in values.columns})
+        with pa.OSFile(str(self._path(len(self._starts))), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        ids = np.arange(self._count, self._count + len(hashes), dtype=np.int64)
+        self._starts = np.append(self._starts, self._count)
+        self._count += len(hashes)
+        order = np.argsort(hashes, kind="stable")
+        at = np.searchsorted(self.hashes, hashes[order])
+        self.hashes = np.insert(self.hashes, at, hashes[order])
+        self.ids = np.insert(self.ids, at, ids[order])
+
+
+def _dedupe_chunk(chunk: pd.DataFrame, seen: _SeenKeys, mode: str) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    כפילויות במקטע, גם מול כל מה שכבר נכתב: hash המפתח (ראו merge_engine.find_duplicates) נבדק מול
+    ה־hash שנראו עד כה (_SeenKeys), ופגיעה מאומתת מול ערכי המפתח השמורים.
+    הדוח כולל את המופעים שהוסרו/סומנו (המופע הראשון כבר נכתב).
+    """
+    if mode == "off":
+        return chunk, pd.DataFrame()
+    hashes, dup, eligible = find_duplicates(chunk)
+    check = np.flatnonzero(eligible & ~dup)
+    key_cols = [c for c in DEDUPE_KEY if c in chunk.columns]
+    values = key_values(chunk[key_cols].iloc[check])
+    hit = seen.contains(hashes[check], values)
+    dup[check[hit]] = True
+    seen.add(hashes[check[~hit]], values[~hit])
+
+    report = chunk.loc[dup, key_cols + [c for c in ("__source_sheet__",) if c in chunk.columns]]
+    if mode == "drop":
+        chunk = chunk.loc[~dup]
+    else:
+        chunk["__is_dup__"] = dup
+    return chunk, report
+
+
+# ---------- המאגר ----------
+
+def _partitioning() -> "ds.Partitioning":
+    """שנה / אזור בסגנון hive; הטיפוסים מפורשים כדי שתיקייה כמו '02' לא תיקרא חזרה כמספר."""
+    return ds.partitioning(pa.schema([(YEAR_COL, pa.int16()), (AREA_COL, pa.string())]), flavor="hive")
+
+
+def _prepare_dir(root: Path) -> None:
+    """תיקייה חדשה, או מאגר קודם שלנו (עם ‎_merge_dataset.json) שנמחק; תיקייה אחרת שאינה ריקה — שגיאה."""
+    if root.exists() and any(root.iterdir()):
+        if not (root / MANIFEST_NAME).is_file():
+            raise ValueError(f"❌ התיקייה {root} אינה ריקה ואינה מאגר מיזוג קודם.")
+        shutil.rmtree(root)
+    root.mkdir(parents=True, exist_ok=True)
+
+
+def read_dataset(root: str | Path, columns: list[str] | None = None, limit: int | None = None) -> pd.DataFrame:
+    """
+    קורא את המאגר חזרה ל־DataFrame בסדר השורות המקורי ובסדר העמודות של המיזוג (בלי עמודות העזר).
+    limit — רק N השורות הראשונות בסדר המיזוג: מספרי השורות (__row__) רציפים מ־0, כך שזה סינון
+    ‎__row__ < N, וקבוצות שורות שכולן מעבר לו לא נקראות (לפי הסטטיסטיקות של Parquet).
+    """
+    root = Path(root)
+    manifest = json.loads((root / MANIFEST_NAME).read_text(encoding="utf-8"))
+    dataset = ds.dataset(root, format="parquet", partitioning=_partitioning())
+    table = dataset.to_table(filter=ds.field(ROW_COL) < limit) if limit else dataset.to_table()
+    df = table.to_pandas()
+    df = df.sort_values(ROW_COL, kind="stable").reset_index(drop=True)
+    order = [c for c in manifest["columns"] if c in df.columns and c not in (ROW_COL, *PARTITION_COLS)]
+    if columns is not None:
+        order = [c for c in order if c in columns]
+    df = df[order]
+    if "אזור" in df.columns:
+        df["אזור"] = df["אזור"].astype(object).where(df["אזור"].notna(), np.nan)
+    return df
+
+
+def run_partitioned_merge(
+    main_files,
+    city_file,
+    tree_file,
+    dataset_dir: str | Path,
+    xlsx: str | None = None,
+    sample_rows: int = SAMPLE_ROWS,
+    dedupe_mode: str = "flag",
+    flush_rows: int = FLUSH_ROWS,
+    snapshots=None,
+) -> DatasetResult:
+    """
+    מיזוג out-of-core של קובץ/קבצי דוחות למאגר Parquet מחולק (שנה / אזור) ב־dataset_dir.
+    xlsx — None (ברירת מחדל: בלי Excel), 'sample' (מדגם של sample_rows שורות) או 'full' (כל המאגר — דורש זיכרון).
+    dedupe_mode — כמו ב־run_merge; כפילויות נבדקות מול כל מה שכבר נכתב, בכל הקבצים.
+    snapshots — SnapshotStore אופציונלי: המקטעים נכתבים גם לגרסה חדשה בו (מזהה הגרסה נרשם ב־manifest).
+    """
+    if not HAVE_PYARROW:
+        raise RuntimeError("❌ מיזוג out-of-core דורש את pyarrow (pip install pyarrow).")
+    if xlsx not in (None, "sample", "full"):
+        raise ValueError(f"ערך xlsx לא מוכר: {xlsx}")
+    if dedupe_mode not in DEDUPE_MODES:
+        raise ValueError(f"מצב כפילויות לא מוכר: {dedupe_mode}")
+    if not isinstance(main_files, (list, tuple)):
+        main_files = [main_files]
+
+    root = Path(dataset_dir)
+    _prepare_dir(root)
+    stats = MergeStats()
+    log_rows: list[dict] = []
+    dup_parts: list[pd.DataFrame] = []
+    pending: list[pd.DataFrame] = []
+    pending_rows = 0
+    # טבלאות מסכמות חלקיות לכל מקטע; מאוחדות בכל flush, כך שבזיכרון נשארת רק טבלה מצטברת אחת
+    pivot_parts: list[dict[str, pd.DataFrame]] = []
+    state = {"rows": 0, "flushes": 0, "schema": None, "columns": None}
+    partitioning = _partitioning()
+
+    def flush() -> None:
+        nonlocal pending, pending_rows
+        if not pending:
+            return
+        with stage(stats, "write_dataset", rows_in=pending_rows):
+            frame = pd.concat(pending, ignore_index=True)
+            pending, pending_rows = [], 0
+            if len(pivot_parts) > 1:
+                pivot_parts[:] = [merge_pivots(pivot_parts)]
+            if state["schema"] is None:
+                state["columns"] = list(frame.columns)
+                state["schema"] = _arrow_schema(state["columns"])
+            ds.write_dataset(
+                _to_arrow(frame, state["schema"]),
+                root,
+                format="parquet",
+                partitioning=partitioning,
+                basename_template=f"part-{state['flushes']:05d}-{{i}}.parquet",
+                existing_data_behavior="overwrite_or_ignore",
+                file_options=ds.ParquetFileFormat().make_write_options(compression="zstd"),
+            )
+            state["flushes"] += 1
+
+    with stats.track_peak(), stage(stats, "total") as total, ExitStack() as stack:
+        city_lut, tree_lut = load_luts(city_file, tree_file, stats=stats)
+        seen = _SeenKeys(stack.enter_context(tempfile.TemporaryDirectory(prefix="forestry-keys-")))
+        layouts = _default_layouts()
+        books = list_workbooks(main_files)
+        # כתיבה לקובץ זמני; יציאה עם שגיאה מוחקת אותו בלי לרשום גרסה
+        snapshot = None
+        if snapshots is not None:
+            snapshot = stack.enter_context(
+                snapshots.writer(label=f"dedupe={dedupe_mode}", sources=[b.name for b in books]))
+        for book in books:
+            wb = open_workbook(book.open())
+            try:
+                for sname in wb.sheetnames:
+                    label = sheet_label(book, sname, len(books) > 1)
+                    with stage(stats, "sheet", sheet=label) as rec:
+                        n_in = 0
+                        for chunk in iter_sheet_chunks(wb[sname], label, log_rows, layouts=layouts):
+                            n_in += len(chunk)
+                            chunk = postprocess(chunk, city_lut, tree_lut)
+                            chunk, dups = _dedupe_chunk(chunk, seen, dedupe_mode)
+                            if not dups.empty:
+                                dup_parts.append(dups)
+                            if snapshot is not None:
+                                snapshot.add(chunk)
+                            pivot_parts.append(build_pivots(chunk))
+                            chunk[YEAR_COL] = _year(chunk)
+                            chunk[AREA_COL] = _partition_value(chunk["אזור"])
+                            chunk[ROW_COL] = np.arange(state["rows"], state["rows"] + len(chunk), dtype=np.int64)
+                            state["rows"] += len(chunk)
+                            pending.append(chunk)
+                            pending_rows += len(chunk)
+                            if pending_rows >= flush_rows:
+                                flush()
+                        rec["rows_in"], rec["rows_out"] = n_in, None
+            finally:
+                wb.close()
+        flush()
+        if layouts is not None:
+            layouts.save()
+        snapshot_id = None
+        if snapshot is not None:
+            with stage(stats, "snapshot", rows_in=state["rows"]):
+                snapshot_id = snapshot.close()
+
+        duplicates = pd.concat(dup_parts, ignore_index=True) if dup_parts else pd.DataFrame()
+        if not duplicates.empty:
+            duplicates["__kept__"] = False
+            _to_arrow_file(duplicates, root / DUPLICATES_NAME)
+        _to_arrow_file(pd.DataFrame(log_rows), root / LOG_NAME)
+
+        dataset = ds.dataset(root, format="parquet", partitioning=_partitioning())
+        manifest = {
+            "pipeline_version": PIPELINE_VERSION,
+            "rows": state["rows"],
+            "columns": state["columns"] or [],
+            "partitioning": list(PARTITION_COLS),
+            "files": len(dataset.files),
+            "dedupe_mode": dedupe_mode,
+            "duplicates": int(len(duplicates)),
+            "sources": [b.name for b in books],
+            "snapshot": snapshot_id,
+        }
+        (root / MANIFEST_NAME).write_text(json.dumps(manifest, ensure_ascii=False, indent=1), encoding="utf-8")
+
+        pivots = merge_pivots(pivot_parts) if pivot_parts else {}
+        sample, xlsx_bytes = None, b""
+        if xlsx:
+            with stage(stats, "write_excel") as rec:
+                sample = read_dataset(root, limit=sample_rows if xlsx == "sample" else None)
+                xlsx_bytes = write_excel(sample, log_rows, duplicates, pivots)
+                rec["rows_out"] = len(sample)
+        total["rows_out"] = state["rows"]
+
+    return DatasetResult(
+        dataset_dir=root, manifest=manifest, log_rows=log_rows, duplicates=duplicates,
+        stats=stats.rows, sample=sample, xlsx=xlsx_bytes, pivots=pivots,
+    )
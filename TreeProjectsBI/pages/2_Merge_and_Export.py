@@ -1,22 +1,23 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
-import io
-import re
-import numpy as np
+import json
+
 import pandas as pd
 import streamlit as st
-from openpyxl import load_workbook
-from openpyxl.utils import get_column_letter
-from openpyxl.styles import Alignment
 
 from style_pack import inject_base_css, apply_plotly_theme, hero_header, glass_container
-from utils_he import (
-    TARGET_COLS,
-    map_col,
-    detect_header_row,
-    clean_text,
+from merge_engine import (
+    DUPLICATES_SHEET, OUTPUT_NAME, PARQUET_NAME, to_parquet_frame,
 )
+from excel_backend import pick_backend
+from job_pool import JobCancelled
+from job_ui import STATE_LABELS, job_progress, run_job, session_owner, shared_pool
+from lut_compiler import file_digest
+from merge_cache import MergeCache
+from merge_snapshots import DIFF_NAME, HAVE_PYARROW, SnapshotStore, diff_snapshots, diff_to_excel
+from merge_stats import frame_memory, peak_mb
+from upload_prefetch import Prefetcher
 
 # ===================== UI / DESIGN =====================
 inject_base_css(bg_main="assets/bg_main.jpg", bg_sidebar="assets/bg_sidebar.jpg")
@@ -25,17 +26,21 @@ hero_header("🧩 Merge & Export", "מיזוג, פיענוח והמרות — ג
 
 st.title("🌳 forestry_and_trees_report2024 — דוחות כריתה אחוד")
 st.caption(
-    "טען/י: 1) קובץ הדוחות המאוחד (ללא רשימות), "
+    "טען/י: 1) קובץ הדוחות המאוחד (ללא רשימות) — או כמה חוברות / קובצי CSV / ארכיון zip שלהם, "
     "2) קובץ 'רשימת ערים לפי קודים', "
     "3) קובץ 'רשימת עצים לפי קודים'."
 )
+st.caption(f"מנוע קריאת Excel: {pick_backend()}")
 
 with glass_container():
-    main_file = st.file_uploader(
-        "📁 קובץ דוחות כריתה אחוד (ללא רשימות עצים/יישובים)",
-        type=["xlsx"],
+    main_files = st.file_uploader(
+        "📁 קובצי דוחות כריתה (xlsx / csv אחד או יותר, או zip שלהם; ללא רשימות עצים/יישובים)",
+        type=["xlsx", "xlsm", "csv", "tsv", "zip"],
+        accept_multiple_files=True,
         key="main",
     )
+    # כל החוברות (וכל חברי הארכיונים) נכנסים לאותה לולאת מיפוי גליונות — ראו upload_sources
+    main_file = list(main_files) or None
     city_file = st.file_uploader(
         "🏙️ קובץ 'רשימת ערים לפי קודים'",
         type=["xlsx"],
@@ -47,508 +52,246 @@ with glass_container():
         key="trees",
     )
 
-run_btn = st.button("🚀 הרץ מיזוג והמרות")
-
-
-# ===================== HELPERS =====================
-
-def get_series(df: pd.DataFrame, col_name: str) -> pd.Series:
-    """אם יש עמודות כפולות באותו השם — מאחד עם bfill ולוקח עמודה אחת."""
-    mask = (df.columns == col_name)
-    cols = df.loc[:, mask]
-    if cols.shape[1] == 0:
-        return pd.Series([pd.NA] * len(df), index=df.index)
-    if cols.shape[1] == 1:
-        return cols.iloc[:, 0]
-    return cols.bfill(axis=1).iloc[:, 0]
-
-
-def safe_to_datetime_series(s: pd.Series) -> pd.Series:
-    """המרת תאריכים לעמידה לשגיאות כולל מספרים סריאליים של אקסל."""
-    dt = pd.to_datetime(s, errors="coerce", infer_datetime_format=True, dayfirst=True)
-    need = dt.isna()
-    if need.any():
-        numeric = pd.to_numeric(s[need], errors="coerce")
-        good = numeric[numeric.notna()]
-        if not good.empty:
-            dt.loc[good.index] = pd.to_datetime(
-                good,
-                unit="D",
-                origin="1899-12-30",
-                errors="coerce",
-            )
-    return dt
-
-
-# ---------- פיענוח קודים: פעולה + סיבה ----------
-
-ACTION_MAP = {1: "כריתה", 2: "העתקה"}
+@st.cache_resource
+def _prefetcher() -> Prefetcher:
+    return Prefetcher(shared_pool())
 
-REASON_MAP = {
-    1: "אחר",
-    2: "בטיחות",
-    3: "מחלת עץ",
-    4: "סכנה בריאותית",
-    5: "בנייה",
-    6: "הכשרה חקלאית",
-    7: "עץ מת",
-    8: "דילול יער",
-    9: "קריאה",
-    10: "סניטציה",
-}
 
+@st.cache_resource
+def _merge_cache() -> MergeCache:
+    return MergeCache()
 
-def _to_int_or_nan(val):
-    if pd.isna(val):
-        return np.nan
-    try:
-        f = float(str(val).strip())
-        i = int(f)
-        return i if f == i else np.nan
-    except Exception:
-        return np.nan
 
+@st.cache_resource
+def _snapshots() -> SnapshotStore | None:
+    """כל הרצה מפורשת (לחיצה על הכפתור) נשמרת כגרסה (תיקיית snapshots במטמון), להשוואה בין הרצות בתחתית הדף."""
+    return SnapshotStore() if HAVE_PYARROW else None
 
-def decode_action_reason(df: pd.DataFrame) -> pd.DataFrame:
-    """
-    מייצר:
-    - פעולה_מפוענחת
-    - פעולה_מפוענחת (2)
-    - סיבה_מפוענחת
-    רק כאשר מדובר בקוד מספרי; טקסט חופשי נשאר כמו שהוא.
-    """
-    out = df.copy()
-
-    # פעולה ראשית
-    if "פעולה" in out.columns:
-        act = out["פעולה"].map(_to_int_or_nan)
-        out["פעולה_מפוענחת"] = np.where(
-            act.notna(),
-            act.map(ACTION_MAP).fillna(out["פעולה"].astype(str)),
-            out["פעולה"].astype(str),
-        )
-
-    # פעולה שנייה
-    if "פעולה (2)" in out.columns:
-        act2 = out["פעולה (2)"].map(_to_int_or_nan)
-        out["פעולה_מפוענחת (2)"] = np.where(
-            act2.notna(),
-            act2.map(ACTION_MAP).fillna(out["פעולה (2)"].astype(str)),
-            out["פעולה (2)"].astype(str),
-        )
-
-    # סיבה
-    if "סיבה" in out.columns:
-        rea = out["סיבה"].map(_to_int_or_nan)
-        out["סיבה_מפוענחת"] = np.where(
-            rea.notna(),
-            rea.map(REASON_MAP).fillna(out["סיבה"].astype(str)),
-            out["סיבה"].astype(str),
-        )
-    elif "סיבה  מילולית" in out.columns:
-        out["סיבה_מפוענחת"] = out["סיבה  מילולית"].astype(str)
 
-    return out
+# ===================== עיבוד ברקע מרגע ההעלאה =====================
+# כל קובץ נשלח לעיבוד מיד כשהוא מועלה (תור העבודות המשותף, ראו job_pool); הכפתור רק מצטרף לתוצאות שכבר חושבו
+prefetch = _prefetcher()
+owner = session_owner()
+uploads = {"main": main_file, "city": city_file, "tree": tree_file}
 
 
-def reorder_columns(df: pd.DataFrame) -> pd.DataFrame:
+def _upload_digests() -> dict:
     """
-    מסדר את העמודות כך ש:
-    - 'פעולה' ליד 'פעולה_מפוענחת'
-    - 'פעולה (2)' ליד 'פעולה_מפוענחת (2)'
-    - 'סיבה' / 'סיבה  מילולית' ליד 'סיבה_מפוענחת'
-    ושאר העמודות נשארות באותו סדר יחסי.
+    file_digest של כל קובץ שהועלה, מחושב פעם אחת לכל קובץ (לפי file_id) ונשמר ב־session_state —
+    בלי לקרוא שוב את כל התוכן בכל rerun של הדף (מפתחות העבודות ומפתח המטמון).
     """
-    cols = list(df.columns)
-    new_order: list[str] = []
+    known = st.session_state.get("upload_digests", {})
+    files = [f for v in uploads.values() if v is not None for f in (v if isinstance(v, list) else [v])]
+    memo = {f.file_id: known.get(f.file_id) or file_digest(f) for f in files}
+    st.session_state["upload_digests"] = memo
+    return {kind: [memo[f.file_id] for f in v] if isinstance(v, list) else memo[v.file_id]
+            for kind, v in uploads.items() if v is not None}
 
-    # פעולה 1
-    if "פעולה" in cols:
-        new_order.append("פעולה")
-    if "פעולה_מפוענחת" in cols:
-        new_order.append("פעולה_מפוענחת")
 
-    # פעולה 2
-    if "פעולה (2)" in cols:
-        new_order.append("פעולה (2)")
-    if "פעולה_מפוענחת (2)" in cols:
-        new_order.append("פעולה_מפוענחת (2)")
+digests = _upload_digests()
+job_keys = {kind: prefetch.submit(kind, f, owner=owner, digest=digests[kind])
+            for kind, f in uploads.items() if f is not None}
 
-    # סיבות
-    if "סיבה" in cols:
-        new_order.append("סיבה")
-    if "סיבה_מפוענחת" in cols:
-        new_order.append("סיבה_מפוענחת")
-    if "סיבה  מילולית" in cols:
-        new_order.append("סיבה  מילולית")
 
-    # שאר העמודות בסדר המקורי
-    for c in cols:
-        if c not in new_order:
-            new_order.append(c)
+def _jobs_pending() -> bool:
+    return any(prefetch.state(k) in ("queued", "running") for k in job_keys.values())
 
-    return df[new_order].copy()
 
-
-# ---------- לוקאפ ערים / עצים מקבצי המפתח ----------
-
-def _load_city_lut(city_file) -> dict[int, str]:
-    """
-    קורא את קובץ 'רשימת ערים לפי קודים' גם אם:
-    - יש כותרת בשורה 1
-    - שורה ריקה אחרי
-    - שורת הכותרות האמיתית רק בשורה 2/3/4...
-    מחפש שורה שיש בה גם 'ישוב' וגם 'סמל'.
-    """
-    df0 = pd.read_excel(city_file, sheet_name=0, header=None)
-    header_row = None
-
-    for i, row in df0.iterrows():
-        vals = [str(v) for v in row.tolist()]
-        joined = " ".join(vals)
-        if ("ישוב" in joined) and ("סמל" in joined):
-            header_row = i
-            break
-
-    if header_row is None:
-        raise ValueError("❌ בקובץ הערים לא נמצאה שורת כותרת עם 'ישוב' ו-'סמל ישוב'.")
-
-    headers = [
-        "" if pd.isna(v) else str(v).strip()
-        for v in df0.iloc[header_row].tolist()
-    ]
-    df = df0.iloc[header_row + 1:].copy()
-    df.columns = headers
-
-    name_col = None
-    code_col = None
-    for c in df.columns:
-        cs = str(c)
-        if "ישוב" in cs and "סמל" not in cs and name_col is None:
-            name_col = c
-        if "סמל" in cs and code_col is None:
-            code_col = c
-
-    if name_col is None or code_col is None:
-        raise ValueError("❌ בקובץ הערים חייבות להיות עמודות 'ישוב' ו-'סמל ישוב' (או שמות דומים).")
-
-    codes = pd.to_numeric(df[code_col], errors="coerce")
-    names = df[name_col].astype(str)
-
-    lut: dict[int, str] = {}
-    for code, name in zip(codes, names):
-        if pd.isna(code):
-            continue
-        try:
-            lut[int(code)] = name.strip()
-        except Exception:
-            continue
-    return lut
-
-
-def _load_tree_lut(tree_file) -> dict[int, str]:
-    """
-    קורא את קובץ 'רשימת עצים לפי קודים' גם אם:
-    - יש כותרת גדולה בשורה 1 ('רשימת עצים')
-    - יש שורות ריקות באמצע
-    - שורת הכותרות האמיתית (Tree, שם עץ וכו') מתחילה רק בשורה 3/4...
-    """
-    df0 = pd.read_excel(tree_file, sheet_name=0, header=None)
-
-    header_row = None
-
-    # 1) מחפש שורה שיש בה עמודה המכילה 'tree'
-    for i, row in df0.iterrows():
-        cells = ["" if pd.isna(v) else str(v) for v in row.tolist()]
-        if any("tree" in c.lower() for c in cells):
-            header_row = i
-            break
-
-    # 2) אם לא נמצא — לוקח את השורה הלא־ריקה הראשונה בתור כותרת
-    if header_row is None:
-        for i, row in df0.iterrows():
-            if not pd.isna(row).all():
-                header_row = i
-                break
-
-    if header_row is None:
-        raise ValueError("❌ בקובץ העצים לא נמצאה שורת כותרת מתאימה (עם עמודת Tree).")
-
-    headers = [
-        "" if pd.isna(v) else str(v).strip()
-        for v in df0.iloc[header_row].tolist()
-    ]
-    df = df0.iloc[header_row + 1:].copy()
-    df.columns = headers
-
-    code_col = None
-    name_col = None
-
-    # עמודת הקוד (Tree)
-    for c in df.columns:
-        if "tree" in str(c).lower():
-            code_col = c
-            break
-
-    # עמודת שם העץ בעברית (שם עץ)
-    for c in df.columns:
-        cs = str(c)
-        if "שם" in cs and "עץ" in cs:
-            name_col = c
-            break
-
-    if code_col is None or name_col is None:
-        raise ValueError("❌ בקובץ העצים חייבות להיות עמודות 'Tree' ו-'שם עץ' (או שמות דומים).")
-
-    codes = pd.to_numeric(df[code_col], errors="coerce")
-    names = df[name_col].astype(str)
-
-    lut: dict[int, str] = {}
-    for code, name in zip(codes, names):
-        if pd.isna(code):
+def upload_status():
+    """סטטוס לכל קובץ; כשהעבודה האחרונה מסתיימת — הדף כולו רץ מחדש כדי להתחיל את המיזוג ברקע."""
+    if not job_keys:
+        return
+    cols = st.columns(len(job_keys))
+    for col, (kind, key) in zip(cols, job_keys.items()):
+        job = prefetch.job(key)
+        if job is None:
             continue
-        try:
-            lut[int(code)] = name.strip()
-        except Exception:
-            continue
-    return lut
-
-
-def apply_city_tree_lookups(
-    merged: pd.DataFrame,
-    city_lut: dict[int, str],
-    tree_lut: dict[int, str],
-) -> pd.DataFrame:
-    """
-    ממיר קודים → שמות בתוך הדוח הממוזג:
-    - בעמודת 'יישוב' (אם יש קודים מספריים)
-    - בעמודות מין עץ (אם לפעמים יש שם קוד מספרי במקום שם)
-    """
-    df = merged.copy()
-
-    # ---- ישובים ----
-    if "יישוב" in df.columns:
-        codes = pd.to_numeric(df["יישוב"], errors="coerce")
-        mask = codes.notna()
-        mapped = codes[mask].astype(int).map(city_lut)
-        df.loc[mask & mapped.notna(), "יישוב"] = mapped[mapped.notna()]
-
-    # ---- מיני עץ ----
-    tree_cols = [
-        c for c in df.columns
-        if ("שם   מין עץ" in c) or ("שם מין עץ" in c) or (c == "מין עץ")
-    ]
-    for col in tree_cols:
-        codes = pd.to_numeric(df[col], errors="coerce")
-        mask = codes.notna()
-        mapped = codes[mask].astype(int).map(tree_lut)
-        df.loc[mask & mapped.notna(), col] = mapped[mapped.notna()]
-
-    return df
-
-
-# ---------- סיווג פעולה: כריתה / העתקה ----------
-
-EXCLUDE_PRUNE = r"(דילול|גיזום|תחזוקה|טיפול|חידוש\s*צמרת|עיצוב\s*נוף)"
-INCLUDE_CUT = r"(כרית(?:ה|ות)?|כרת|כרות|כריתת)"
-INCLUDE_MOVE = r"(העתק(?:ה)?|שימור|transplant|preserv)"
-
-
-def classify_actions(
-    df: pd.DataFrame,
-    col_act1: str | None,
-    col_act2: str | None,
-    col_reason: str | None,
-):
-    """
-    יוצר דגלים בוליאניים:
-    - __is_cut__  → שורת כריתה
-    - __is_move__ → שורת העתקה/שימור
-    """
-    pieces = []
-    for c in (col_act1, col_act2, col_reason):
-        if c and c in df.columns:
-            pieces.append(df[c].astype(str))
-
-    if not pieces:
-        txt = pd.Series([""] * len(df), index=df.index)
-    else:
-        txt = pieces[0]
-        for p in pieces[1:]:
-            txt = txt.str.cat(p, sep=" ", na_rep="")
-
-    txt = (
-        txt.str.replace("\u200f", "", regex=False)
-           .str.replace("\u200e", "", regex=False)
-           .str.strip()
-    )
+        label = STATE_LABELS.get(job.state, job.state)
+        col.caption(f"{label} · {job.name} · {job.seconds:.1f} שנ'")
+        if job.state == "running":
+            fraction, text = job.progress
+            col.progress(min(max(fraction, 0.0), 1.0), text=text or None)
+        if job.state == "error":
+            col.caption(f"{job.future.exception()}")
+    if st.session_state.get("prefetch_pending") and not _jobs_pending():
+        st.session_state["prefetch_pending"] = False
+        st.rerun()
+
+
+# מתרענן כל שנייה רק כל עוד יש עבודה ברקע
+st.session_state["prefetch_pending"] = _jobs_pending()
+st.fragment(upload_status, run_every=1.0 if st.session_state["prefetch_pending"] else None)()
+
+# ברירת המחדל — סימון: שום שורה לא נעלמת מהקובץ בלי שבחרו בכך
+DEDUPE_LABELS = {
+    "flag": "סימון בלבד (__is_dup__)",
+    "drop": "הסרת כפילויות (נשמר המופע הראשון)",
+    "off": "ללא בדיקת כפילויות",
+}
+dedupe_mode = st.radio(
+    "🔁 רישיונות שמופיעים ביותר מגיליון אחד",
+    options=list(DEDUPE_LABELS),
+    format_func=DEDUPE_LABELS.get,
+    horizontal=True,
+)
 
-    prune = txt.str.contains(EXCLUDE_PRUNE, case=False, regex=True, na=False)
-    cut = txt.str.contains(INCLUDE_CUT, case=False, regex=True, na=False) & ~prune
-    move = txt.str.contains(INCLUDE_MOVE, case=False, regex=True, na=False)
+# כששלושת הקבצים מוכנים — המיזוג המלא מתחיל ברקע לפי מצב הכפילויות שנבחר
+# שגיאה בהגשה (למשל ארכיון בלי חוברות) נשמרת ומוצגת מתחת לבחירה, עד שהקבצים או המצב משתנים
+if len(job_keys) == len(uploads) and not _jobs_pending():
+    try:
+        prefetch.submit_merge(main_file, city_file, tree_file, dedupe_mode, _merge_cache(), owner=owner,
+                              digests=digests)
+        st.session_state.pop("eager_merge_error", None)
+    except Exception as e:
+        st.session_state["eager_merge_error"] = str(e)
+else:
+    st.session_state.pop("eager_merge_error", None)
+if "eager_merge_error" in st.session_state:
+    st.error(f"שגיאה בהכנת המיזוג ברקע: {st.session_state['eager_merge_error']}")
 
-    return cut.fillna(False), move.fillna(False)
+run_btn = st.button("🚀 הרץ מיזוג והמרות")
 
 
 # ===================== MAIN RUN =====================
 
+result = None
+
 if run_btn:
     if not main_file or not city_file or not tree_file:
         st.error("אנא העלה את שלושת הקבצים: דוחות, רשימת ערים, רשימת עצים.")
         st.stop()
 
     try:
-        # 1) טעינת לוקאפ ערים / עצים
-        city_lut = _load_city_lut(city_file)
-        tree_lut = _load_tree_lut(tree_file)
-
-        # 2) קריאת קובץ הדוחות (מאוחד ללא גליונות מפתח)
-        xls = pd.ExcelFile(main_file, engine="openpyxl")
-
-        merged_parts: list[pd.DataFrame] = []
-        log_rows: list[dict] = []
-
-        for sname in xls.sheet_names:
-            df_raw = pd.read_excel(xls, sheet_name=sname, header=None)
-            if df_raw.empty:
-                continue
-
-            # כותרת אמיתית של הדוח (חיפוש בשורות הראשונות)
-            hdr = detect_header_row(df_raw, scan_rows=8)
-            headers = [clean_text(c) for c in df_raw.iloc[hdr].tolist()]
-            df = df_raw.iloc[hdr + 1:].reset_index(drop=True)
-
-            if len(headers) < df.shape[1]:
-                headers += [f"Unnamed_{i}" for i in range(df.shape[1] - len(headers))]
-            headers = headers[: df.shape[1]]
-            df.columns = headers
-
-            out = pd.DataFrame(index=df.index, columns=TARGET_COLS)
-            used = set()
-
-            for c in df.columns:
-                tgt = map_col(c)
-                if not tgt:
-                    log_rows.append({"sheet": sname, "source_column": c, "mapped_to": ""})
-                    continue
-
-                ser = get_series(df, c)
-
-                if tgt == "פעולה":
-                    if "פעולה" not in used:
-                        out["פעולה"] = ser
-                        used.add("פעולה")
-                    else:
-                        out["פעולה (2)"] = ser
-                        used.add("פעולה (2)")
-                else:
-                    out[tgt] = ser
-                    used.add(tgt)
-
-                log_rows.append({"sheet": sname, "source_column": c, "mapped_to": tgt})
-
-            out["__source_sheet__"] = sname
-            merged_parts.append(out)
-
-        merged = (
-            pd.concat(merged_parts, ignore_index=True)
-            if merged_parts else pd.DataFrame(columns=TARGET_COLS)
-        )
-
-        # 3) המרת קודים → שמות (יישוב + מין עץ)
-        merged = apply_city_tree_lookups(merged, city_lut, tree_lut)
-
-        # 4) פיענוח פעולה/סיבה למלל
-        merged = decode_action_reason(merged)
-
-        # 4.5) סידור העמודות כך שהקודים והטקסט יהיו אחד ליד השני
-        merged = reorder_columns(merged)
-
-        # 5) תאריכים
-        for c in ("מ-תאריך", "עד-תאריך"):
-            if c in merged.columns:
-                merged[c] = safe_to_datetime_series(merged[c])
-
-        # 6) דגלי כריתה/העתקה
-        col_act1 = (
-            "פעולה_מפוענחת"
-            if "פעולה_מפוענחת" in merged.columns
-            else ("פעולה" if "פעולה" in merged.columns else None)
-        )
-        col_act2 = (
-            "פעולה_מפוענחת (2)"
-            if "פעולה_מפוענחת (2)" in merged.columns
-            else ("פעולה (2)" if "פעולה (2)" in merged.columns else None)
-        )
-        col_reason = (
-            "סיבה_מפוענחת"
-            if "סיבה_מפוענחת" in merged.columns
-            else (
-                "סיבה"
-                if "סיבה" in merged.columns
-                else ("סיבה  מילולית" if "סיבה  מילולית" in merged.columns else None)
-            )
-        )
-
-        is_cut, is_move = classify_actions(merged, col_act1, col_act2, col_reason)
-        merged["__is_cut__"] = is_cut
-        merged["__is_move__"] = is_move
-
-        # 7) כתיבה ל־Excel + עיצוב עמודות
-        base = io.BytesIO()
-        with pd.ExcelWriter(base, engine="openpyxl") as writer:
-            merged.to_excel(writer, sheet_name="Merged", index=False)
-            pd.DataFrame({"TargetColumns": TARGET_COLS}).to_excel(
-                writer, sheet_name="TargetHeaders", index=False
-            )
-            pd.DataFrame(log_rows).to_excel(
-                writer, sheet_name="MappingLog", index=False
-            )
+        # המפתח נשמר ב־session_state כדי שהתוצאה תוצג שוב (מהמטמון) גם אחרי rerun של ווידג'ט אחר;
+        # המיזוג עצמו רץ בתור העבודות, והדף מציג את ההתקדמות שלו עד שהוא מסתיים
+        st.session_state["merge_key"] = prefetch.submit_merge(
+            main_file, city_file, tree_file, dedupe_mode, _merge_cache(), owner=owner, eager=False,
+            digests=digests)
+        # גרסה נשמרת רק על לחיצה — אחרי שהתוצאה מוכנה (ראו למטה), לא על המיזוג האוטומטי
+        st.session_state["snapshot_key"] = st.session_state["merge_key"]
+    except Exception as e:
+        st.error(f"שגיאה בעיבוד הקבצים: {e}")
 
-        wb = load_workbook(io.BytesIO(base.getvalue()))
-        ws = wb["Merged"]
-        header = [c.value for c in ws[1]]
-
-        def _set_col_width(name: str, width: int):
-            if name in header:
-                idx = header.index(name) + 1
-                ws.column_dimensions[get_column_letter(idx)].width = width
-
-        # תאריכים
-        for name in ("מ-תאריך", "עד-תאריך"):
-            if name in header:
-                i = header.index(name) + 1
-                for row in ws.iter_rows(min_row=2, min_col=i, max_col=i, max_row=ws.max_row):
-                    cell = row[0]
-                    cell.number_format = "yyyy-mm-dd"
-                    cell.alignment = Alignment(horizontal="right")
-                _set_col_width(name, 16)
-
-        # עמודות שימושיות נוספות
-        _set_col_width("יישוב", 22)
-        _set_col_width("שם   מין עץ", 22)
-        _set_col_width("הערות", 26)
-        _set_col_width("פעולה_מפוענחת", 14)
-        _set_col_width("פעולה_מפוענחת (2)", 16)
-        _set_col_width("סיבה_מפוענחת", 16)
-
-        final = io.BytesIO()
-        wb.save(final)
-
-        st.success("✅ הקובץ הממוזג והמפוענח מוכן להורדה.")
+if "merge_key" in st.session_state:
+    key = st.session_state["merge_key"]
+    result = _merge_cache().get(key)
+    if result is None and prefetch.job(key) is not None:
+        job_progress(prefetch.pool, key, "🚀 מיזוג")
+        try:
+            result = prefetch.result(key)
+        except JobCancelled:
+            st.session_state.pop("merge_key", None)
+            st.warning("המיזוג בוטל.")
+        except Exception as e:
+            st.session_state.pop("merge_key", None)
+            st.error(f"שגיאה בעיבוד הקבצים: {e}")
+
+if result is not None and _snapshots() is not None and st.session_state.get("snapshot_key") == key:
+    del st.session_state["snapshot_key"]
+    prefetch.submit_snapshot(main_file, city_file, tree_file, dedupe_mode, _merge_cache(), _snapshots(), owner=owner)
+
+if result is not None:
+    merged = result.merged
+
+    st.success("✅ הקובץ הממוזג והמפוענח מוכן להורדה.")
+    dups = result.duplicates
+    n_dup = 0 if dups is None or dups.empty else int((~dups["__kept__"]).sum())
+    if n_dup and "__is_dup__" not in merged.columns:
+        st.warning(f"⚠️ {n_dup:,} רשומות כפולות הוסרו מהקובץ ({len(merged):,} שורות נשארו); "
+                   f"המופעים שהוסרו מפורטים בגיליון {DUPLICATES_SHEET}.")
+    elif n_dup:
+        st.info(f"🔁 {n_dup:,} רשומות סומנו ככפולות בעמודה __is_dup__ — הן נשארות בקובץ, "
+                f"אבל לא נספרות בטבלאות המסכמות ובדפי ה־BI.")
+    st.download_button(
+        f"⬇️ הורד {OUTPUT_NAME}",
+        data=result.xlsx,
+        file_name=OUTPUT_NAME,
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        use_container_width=True,
+    )
+    if result.parquet:
         st.download_button(
-            "⬇️ הורד merged_forest_reports_FINAL_dates_fixed.xlsx",
-            data=final.getvalue(),
-            file_name="merged_forest_reports_FINAL_dates_fixed.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            f"⬇️ הורד {PARQUET_NAME} (טעינה מהירה בדף BI כריתה)",
+            data=result.parquet,
+            file_name=PARQUET_NAME,
+            mime="application/vnd.apache.parquet",
             use_container_width=True,
         )
 
-        with st.expander("תצוגה מקדימה (50 שורות ראשונות)", expanded=False):
-            st.dataframe(merged.head(50))
-
-    except Exception as e:
-        st.error(f"שגיאה בעיבוד הקבצים: {e}")
+    with st.expander("תצוגה מקדימה (50 שורות ראשונות)", expanded=False):
+        # קטגוריות מעורבות (קוד/טקסט) מהסכמה הקומפקטית → מחרוזות, כמו בייצוא ל־Parquet
+        st.dataframe(to_parquet_frame(merged.head(50)))
+
+    if result.pivots:
+        with st.expander("📊 טבלאות מסכמות (גליונות Pivot בקובץ)", expanded=False):
+            for tab, (title, table) in zip(st.tabs(list(result.pivots)), result.pivots.items()):
+                tab.dataframe(to_parquet_frame(table), use_container_width=True, hide_index=True)
+
+    if n_dup:
+        with st.expander(f"🔁 כפילויות: {n_dup:,} רשומות ב־{dups['__dup_group__'].nunique():,} קבוצות "
+                         f"(גיליון {DUPLICATES_SHEET} בקובץ)", expanded=False):
+            st.dataframe(to_parquet_frame(dups.head(500)), use_container_width=True)
+
+    if result.stats:
+        with st.expander("⏱️ זמני שלבים (זמן, שורות וזיכרון לכל שלב/גיליון)", expanded=False):
+            peak = peak_mb(result.stats)
+            mem = frame_memory(result.stats)
+            cols = st.columns(2)
+            if peak is not None:
+                cols[0].metric("שיא זיכרון בהרצה (MB)", f"{peak:,.0f}")
+            if mem is not None:
+                cols[1].metric("זיכרון הטבלה אחרי המרת הסכמה (MB)", f"{mem[1]:,.1f}",
+                               delta=f"{mem[1] - mem[0]:,.1f}", delta_color="inverse")
+            st.dataframe(pd.DataFrame(result.stats), use_container_width=True)
+            st.download_button(
+                "⬇️ הורד merge_timings.json",
+                data=json.dumps(result.stats, ensure_ascii=False, indent=1).encode("utf-8"),
+                file_name="merge_timings.json",
+                mime="application/json",
+            )
 
-else:
+elif "merge_key" not in st.session_state and not run_btn:
     st.info("📎 העלה את שלושת הקבצים ולחץ על הכפתור כדי ליצור קובץ BI מאוחד.")
+
+
+# ===================== גרסאות והשוואה בין הרצות =====================
+# בסוף הדף: השוואה שעדיין רצה עוצרת את הדף (run_job), וכל מה שמעליה כבר הוצג
+snapshots = _snapshots()
+versions = snapshots.versions() if snapshots is not None else []
+if len(versions) >= 2:
+    with st.expander(f"🕓 גרסאות והשוואה ({len(versions)} גרסאות שמורות)", expanded=False):
+        labels = {v["id"]: f"{v['id']} · {v['created']} · {v['rows']:,} שורות" for v in reversed(versions)}
+        ids = list(labels)
+        cols = st.columns(2)
+        new_id = cols[0].selectbox("גרסה חדשה", ids, index=0, format_func=labels.get, key="snapshot_new")
+        old_id = cols[1].selectbox("גרסה קודמת", ids, index=1, format_func=labels.get, key="snapshot_old")
+        if st.button("🔍 השווה גרסאות"):
+            st.session_state["snapshot_pair"] = (old_id, new_id)
+
+        pair = st.session_state.get("snapshot_pair")
+        if pair and all(v in labels for v in pair):
+            old_id, new_id = pair
+            diff = run_job(diff_snapshots, str(snapshots.root), old_id, new_id,
+                           key=f"diff-{old_id}-{new_id}", title="🔍 השוואת גרסאות")
+            s = diff.summary
+            st.caption(f"{diff.old} → {diff.new}")
+            cols = st.columns(4)
+            cols[0].metric("שורות", f"{s['שורות חדש']:,}", delta=f"{s['שורות חדש'] - s['שורות קודם']:,}")
+            cols[1].metric("נוספו", f"{s['נוספו']:,}")
+            cols[2].metric("הוסרו", f"{s['הוסרו']:,}")
+            cols[3].metric("שונו", f"{s['שונו']:,}")
+            if not diff.by_city.empty:
+                st.markdown("**שינויים לפי יישוב**")
+                st.dataframe(diff.by_city, use_container_width=True, hide_index=True)
+            tabs = st.tabs(["➕ נוספו", "➖ הוסרו", "✏️ שונו (לפי תא)"])
+            for tab, frame in zip(tabs, (diff.added, diff.removed, diff.modified)):
+                tab.dataframe(to_parquet_frame(frame.head(500)), use_container_width=True, hide_index=True)
+            xlsx_key = f"diff-xlsx-{old_id}-{new_id}"
+            if xlsx_key not in st.session_state:
+                st.session_state[xlsx_key] = diff_to_excel(diff)
+            st.download_button(
+                f"⬇️ הורד {DIFF_NAME}",
+                data=st.session_state[xlsx_key],
+                file_name=DIFF_NAME,
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            )
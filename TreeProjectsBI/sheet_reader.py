@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+sheet_reader.py — קריאה זורמת (streaming) של גליונות דוחות הכריתה.
+קורא שורות ישירות מהחוברת (iter_rows — calamine או openpyxl, ראו excel_backend), מאתר את שורת הכותרת
+בשורות הראשונות ומחזיר מקטעים (chunks) שכבר ממופים לתבנית TARGET_COLS —
+בלי לבנות את הגיליון כולו כ־DataFrame גולמי, כך שצריכת הזיכרון לא תלויה בגודל הגיליון.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from itertools import chain
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+from openpyxl.cell.cell import ERROR_CODES
+
+from excel_backend import open_workbook  # noqa: F401 — מיוצא מכאן לשאר המודולים
+from utils_he import TARGET_COLS, map_col, detect_header_row, clean_text
+
+CHUNK_ROWS = 20_000
+
+
+def _trim_row(row: tuple) -> list:
+    """תאים ריקים/שגיאה → None, והסרת תאים ריקים בסוף השורה (כמו pandas)."""
+    vals = [
+        None if (v is None or v == "" or (isinstance(v, str) and v in ERROR_CODES)) else v
+        for v in row
+    ]
+    while vals and vals[-1] is None:
+        vals.pop()
+    return vals
+
+
+def build_mapping_plan(headers: list[str], sname: str, log_rows: list[dict]) -> dict[str, tuple[int, ...]]:
+    """
+    מתרגם שורת כותרות לתוכנית מיפוי: עמודת יעד → אינדקסי עמודות המקור.
+    עמודות כפולות באותו שם מאוחדות (הערך הלא־ריק הראשון), ו'פעולה' שנייה עוברת ל'פעולה (2)'.
+    מוסיף ל־log_rows שורה לכל עמודת מקור.
+    """
+    plan: dict[str, tuple[int, ...]] = {}
+    used = set()
+    for c in headers:
+        tgt = map_col(c)
+        if not tgt:
+            log_rows.append({"sheet": sname, "source_column": c, "mapped_to": ""})
+            continue
+
+        idxs = tuple(j for j, h in enumerate(headers) if h == c)
+
+        if tgt == "פעולה":
+            if "פעולה" not in used:
+                plan["פעולה"] = idxs
+                used.add("פעולה")
+            else:
+                plan["פעולה (2)"] = idxs
+                used.add("פעולה (2)")
+        else:
+            plan[tgt] = idxs
+            used.add(tgt)
+
+        log_rows.append({"sheet": sname, "source_column": c, "mapped_to": tgt})
+    return plan
+
+
+@dataclass(frozen=True)
+class CompiledPlan:
+    """
+    תוכנית מיפוי מהודרת לגיליון (מ־build_mapping_plan), כך שבניית מקטע היא כמה פעולות numpy על כל הטבלה:
+      src / dst — עמודת המקור הראשונה של כל עמודת יעד ממופה, ומיקום עמודת היעד ב־TARGET_COLS
+                  (העתקה אחת של כל העמודות בבת אחת);
+      fallback  — (מיקום יעד, עמודות מקור נוספות) לעמודות כפולות באותו שם: משלימות את התאים הריקים לפי הסדר.
+    """
+    src: np.ndarray
+    dst: np.ndarray
+    fallback: tuple[tuple[int, tuple[int, ...]], ...]
+
+
+_TARGET_POS = {t: i for i, t in enumerate(TARGET_COLS)}
+
+
+def compile_plan(plan: dict[str, tuple[int, ...]]) -> CompiledPlan:
+    items = [(_TARGET_POS[tgt], idxs) for tgt, idxs in plan.items() if idxs and tgt in _TARGET_POS]
+    return CompiledPlan(
+        src=np.array([idxs[0] for _, idxs in items], dtype=np.intp),
+        dst=np.array([pos for pos, _ in items], dtype=np.intp),
+        fallback=tuple((pos, tuple(idxs[1:])) for pos, idxs in items if len(idxs) > 1),
+    )
+
+
+def assemble_chunk(values: np.ndarray, cplan: CompiledPlan, sname: str) -> pd.DataFrame:
+    """
+    מקטע בתבנית TARGET_COLS מתוך מטריצת ערכי המקור (שורות × עמודות, object), לפי תוכנית מהודרת.
+    עמודות מקור שחסרות במטריצה (מעבר לרוחב שלה) נחשבות ריקות; תא ריק → NaN.
+    """
+    n, width = values.shape
+    out = np.empty((n, len(TARGET_COLS)), dtype=object)  # מלא ב־None
+    ok = cplan.src < width
+    out[:, cplan.dst[ok]] = values[:, cplan.src[ok]]
+    for pos, idxs in cplan.fallback:
+        col = out[:, pos]
+        for j in idxs:
+            missing = pd.isna(col)
+            if not missing.any():
+                break
+            if j < width:
+                col[missing] = values[missing, j]
+    out[pd.isna(out)] = np.nan
+    out[:, _TARGET_POS["__source_sheet__"]] = sname
+    return pd.DataFrame(out, columns=TARGET_COLS, dtype=object)
+
+
+def _build_chunk(rows: list[list], cplan: CompiledPlan, sname: str) -> pd.DataFrame:
+    # שורות באורכים שונים → מטריצה אחת מרופדת ב־None (בנייה ב־C, בלי לולאה על התאים)
+    values = pd.DataFrame(rows, dtype=object).to_numpy() if rows else np.empty((0, 0), dtype=object)
+    return assemble_chunk(values, cplan, sname)
+
+
+def _resolve_layout(head: list[list], sname: str, scan_rows: int, layouts=None):
+    """
+    שורת הכותרת ותוכנית המיפוי לגיליון, לפי השורות הראשונות (head, אחרי _trim_row).
+    מחזיר (hdr, headers, plan, sheet_log, layout_key); פריסה מוכרת נלקחת ממטמון הפריסות, חדשה נלמדת.
+    """
+    known = layouts.match(head) if (layouts is not None and any(head)) else None
+    sheet_log: list[dict] = []
+    if known is not None:
+        layout_key, entry, hdr = known
+        headers = [c for c, _ in entry["columns"]]
+        plan = {tgt: tuple(idxs) for tgt, idxs in entry["plan"].items()}
+        sheet_log = [{"sheet": sname, "source_column": c, "mapped_to": t} for c, t in entry["columns"]]
+    else:
+        hdr = detect_header_row(pd.DataFrame(head), scan_rows=scan_rows) if head else 0
+        header_row = head[hdr] if head else []
+        headers = [clean_text(c) for c in header_row]
+        plan = build_mapping_plan(headers, sname, sheet_log)
+        layout_key = layouts.learn(head, hdr, plan, sheet_log, sname) if (layouts is not None and any(head)) else None
+    return hdr, headers, plan, sheet_log, layout_key
+
+
+def _finish_log(
+    sheet_log: list[dict], sname: str, headers: list, width: int, layout_key, layouts, log_rows: list[dict],
+) -> None:
+    # עמודות ללא כותרת מעבר לשורת הכותרת נרשמות כלא ממופות
+    sheet_log += [
+        {"sheet": sname, "source_column": "", "mapped_to": ""}
+        for _ in range(len(headers), width)
+    ]
+    if layout_key is not None:
+        is_new = layout_key in layouts.new
+        for r in sheet_log:
+            r["layout"] = layout_key
+            r["new_layout"] = is_new
+    log_rows.extend(sheet_log)
+
+
+def _iter_frame_chunks(
+    frame: pd.DataFrame,
+    sname: str,
+    log_rows: list[dict],
+    scan_rows: int,
+    chunk_rows: int,
+    info: dict | None,
+    layouts,
+) -> Iterator[pd.DataFrame]:
+    """
+    iter_sheet_chunks לגיליון שכבר נקרא כטבלה עמודתית (CSV, ראו csv_backend): אותו זיהוי כותרת ומיפוי,
+    אבל הטבלה כולה ממופה בבת אחת (assemble_chunk) במקום לולאה על השורות.
+    """
+    head = [_trim_row(r) for r in frame.head(scan_rows).itertuples(index=False, name=None)]
+    if not any(head):
+        return
+    hdr, headers, plan, sheet_log, layout_key = _resolve_layout(head, sname, scan_rows, layouts)
+    if info is not None:
+        info["header_row"] = hdr
+
+    # כמו בקריאה הזורמת: שורות ריקות בסוף הגיליון לא נכנסות, ושורות ריקות באמצע נשמרות
+    filled = frame.notna().to_numpy()
+    rows_filled = filled.any(axis=1)
+    last = int(np.flatnonzero(rows_filled)[-1]) + 1
+    body = frame.iloc[hdr + 1:last].reset_index(drop=True)
+    cols_filled = np.flatnonzero(filled[:last].any(axis=0))
+    width = int(cols_filled[-1]) + 1 if len(cols_filled) else 0
+
+    mapped = assemble_chunk(body.to_numpy(dtype=object), compile_plan(plan), sname)
+    if not len(mapped):
+        yield mapped
+    for start in range(0, len(mapped), chunk_rows):
+        yield mapped.iloc[start:start + chunk_rows].reset_index(drop=True)
+
+    _finish_log(sheet_log, sname, headers, width, layout_key, layouts, log_rows)
+
+
+def iter_sheet_chunks(
+    ws,
+    sname: str,
+    log_rows: list[dict],
+    scan_rows: int = 8,
+    chunk_rows: int = CHUNK_ROWS,
+    info: dict | None = None,
+    layouts=None,
+) -> Iterator[pd.DataFrame]:
+    """
+    מחזיר מקטעי DataFrame בתבנית TARGET_COLS עבור גיליון אחד.
+    גיליון ריק לא מחזיר כלום ולא נרשם ב־log_rows (כמו בקריאה המלאה).
+    info — dict אופציונלי שמקבל את 'header_row' (אינדקס שורת הכותרת שזוהתה).
+    layouts — LayoutCache אופציונלי: פריסה מוכרת מדלגת על זיהוי הכותרת והמיפוי, פריסה חדשה נלמדת.
+              במקרה כזה כל שורה ב־log_rows מקבלת גם 'layout' (טביעת האצבע) ו־'new_layout'.
+    גיליון CSV (csv_backend.CsvSheet) ממופה ישירות מהטבלה העמודתית שלו.
+    """
+    if isinstance(getattr(ws, "frame", None), pd.DataFrame):
+        yield from _iter_frame_chunks(ws.frame, sname, log_rows, scan_rows, chunk_rows, info, layouts)
+        return
+    if hasattr(ws, "reset_dimensions"):
+        ws.reset_dimensions()
+    rows = (_trim_row(r) for r in ws.iter_rows(values_only=True))
+
+    # כותרת אמיתית של הדוח (חיפוש בשורות הראשונות בלבד)
+    head: list[list] = []
+    for row in rows:
+        head.append(row)
+        if len(head) >= scan_rows:
+            break
+    hdr, headers, plan, sheet_log, layout_key = _resolve_layout(head, sname, scan_rows, layouts)
+    if info is not None:
+        info["header_row"] = hdr
+    cplan = compile_plan(plan)
+
+    width = max((len(r) for r in head), default=0)
+    saw_data = any(head)
+    yielded = False
+    pending_empty = 0
+    buf: list[list] = []
+
+    for row in chain(head[hdr + 1:], rows):
+        if not row:
+            # שורות ריקות נשמרות רק אם יש אחריהן נתונים
+            pending_empty += 1
+            continue
+        saw_data = True
+        width = max(width, len(row))
+        if pending_empty:
+            buf.extend([] for _ in range(pending_empty))
+            pending_empty = 0
+        buf.append(row)
+        if len(buf) >= chunk_rows:
+            yield _build_chunk(buf, cplan, sname)
+            yielded = True
+            buf = []
+
+    if not saw_data:
+        return
+    if buf or not yielded:
+        yield _build_chunk(buf, cplan, sname)
+
+    _finish_log(sheet_log, sname, headers, width, layout_key, layouts, log_rows)
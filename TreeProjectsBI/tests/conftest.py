@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""fixtures משותפים: חוברת דוחות קטנה מהמחולל הסינתטי (benchmarks/workload.py) ותיקיית מטמון זמנית."""
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+import layout_cache  # noqa: E402
+import lut_compiler  # noqa: E402
+import workload  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def workbooks(tmp_path_factory):
+    """(חוברת דוחות, רשימת ערים, רשימת עצים, תיאור) — 4 גליונות בכל הפריסות, עם כפילויות בין גליונות."""
+    root = tmp_path_factory.mktemp("workload")
+    main, cities, trees = root / "main.xlsx", root / "cities.xlsx", root / "trees.xlsx"
+    info = workload.write_cutting_workbook(main, rows=800, sheets=4, seed=3, dup_rate=0.02)
+    workload.write_city_list(cities)
+    workload.write_tree_list(trees)
+    return main, cities, trees, info
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """מטמון הפריסות וטבלאות הקודים בתיקייה זמנית, כדי שבדיקה לא תלויה במטמון של הרצה קודמת."""
+    path = tmp_path / "cache"
+    monkeypatch.setattr(lut_compiler, "DEFAULT_CACHE_DIR", path)
+    monkeypatch.setattr(layout_cache, "DEFAULT_CACHE_DIR", path)
+    return path
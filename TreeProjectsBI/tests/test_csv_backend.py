@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""בדיקות רגרסיה ל־csv_backend: מספרים ארוכים נשארים טקסט, וקידוד cp1255 שמתגלה רק אחרי הדגימה."""
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import csv_backend  # noqa: E402
+from csv_backend import SNIFF_BYTES, _pandas_column, read_csv_frame  # noqa: E402
+
+LONG_IDS = ["9007199254740993", "12345678901234567890", "-98765432109876543", "1234567890123456"]
+
+
+@pytest.mark.parametrize("arrow", [True, False])
+def test_long_ids_stay_text(monkeypatch, arrow):
+    if not arrow:
+        monkeypatch.setattr(csv_backend, "HAVE_PYARROW", False)
+    body = "מספר רישיון,מספר עצים\n" + "".join(f"{v},48.0\n" for v in LONG_IDS)
+    frame = read_csv_frame(body.encode("utf-8"), "ids.csv")
+    # עד 2**53 — מספר שלם מדויק (כמו תא מספרי ב־xlsx); מעבר לזה — הטקסט המקורי
+    assert frame[0].tolist()[1:] == LONG_IDS[:3] + [1234567890123456]
+    assert frame[1].tolist()[1:] == [48] * len(LONG_IDS)
+
+
+def test_exact_numbers_still_converted():
+    vals = np.array(["9007199254740991", "-12", "1.5", "abc", None], dtype=object)
+    assert _pandas_column(vals).tolist() == [9007199254740991, -12, 1.5, "abc", None]
+
+
+@pytest.mark.parametrize("arrow", [True, False])
+def test_cp1255_after_sniff_window(monkeypatch, arrow):
+    if not arrow:
+        monkeypatch.setattr(csv_backend, "HAVE_PYARROW", False)
+    filler = "a,b\n" * (SNIFF_BYTES // 4 + 10)
+    data = (filler + "עץ,3\n").encode("cp1255")
+    assert data[:SNIFF_BYTES].isascii()
+    frame = read_csv_frame(data, "late.csv")
+    assert frame.iloc[-1].tolist() == ["עץ", 3]
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""parse_dates: ערכים מעורבים (datetime / serial / טקסט), וזיהוי פורמט נפרד לכל גיליון (groups)."""
+from __future__ import annotations
+
+import datetime as dt
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from date_engine import parse_dates  # noqa: E402
+
+T = pd.Timestamp
+
+
+def test_mixed_kinds():
+    s = pd.Series([dt.datetime(2024, 3, 4), 45292, "15/07/2023", "2024-05-06", None, "לא תאריך"], dtype=object)
+    assert parse_dates(s).tolist()[:4] == [T("2024-03-04"), T("2024-01-01"), T("2023-07-15"), T("2024-05-06")]
+    assert parse_dates(s).isna().tolist()[4:] == [True, True]
+
+
+def test_format_per_group():
+    # גיליון a יום־חודש, גיליון b חודש־יום: '01/02/2024' מתפרש לפי הגיליון שלו
+    s = pd.Series(["02/01/2024", "01/02/2024", "31/12/2024", "12/31/2024"], dtype=object)
+    groups = pd.Series(["a", "b", "a", "b"])
+    out = parse_dates(s, groups=groups)
+    assert out.tolist() == [T("2024-01-02"), T("2024-01-02"), T("2024-12-31"), T("2024-12-31")]
+    # בלי groups — פורמט אחד לכל העמודה
+    assert parse_dates(s)[1] == T("2024-02-01")
+
+
+def test_groups_same_as_separate_calls():
+    rng = np.random.default_rng(0)
+    days = pd.date_range("2023-01-01", periods=200, freq="D")
+    day_first = days.strftime("%d/%m/%Y").tolist()
+    month_first = days.strftime("%m/%d/%Y").tolist()
+    groups = pd.Series(rng.choice(["a", "b"], size=200), index=np.arange(200)[::-1], name="__source_sheet__")
+    s = pd.Series(
+        [d if g == "a" else m for d, m, g in zip(day_first, month_first, groups)],
+        index=groups.index, name="מ-תאריך", dtype=object,
+    )
+    out = parse_dates(s, groups=groups)
+    assert out.index.equals(s.index) and out.name == s.name
+    for g in ("a", "b"):
+        sel = groups == g
+        pd.testing.assert_series_equal(out[sel], parse_dates(s[sel]))
+    assert (out.to_numpy() == days.to_numpy()).all()
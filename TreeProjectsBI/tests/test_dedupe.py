@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""בדיקות ל־dedupe: סימון/הסרה של כפילויות, נירמול המפתח, והתנגשות hash שלא מסירה רשומה."""
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from merge_engine import DEDUPE_KEY, dedupe, find_duplicates  # noqa: E402
+
+
+def _frame(licenses, trees=None) -> pd.DataFrame:
+    n = len(licenses)
+    df = pd.DataFrame({c: ["x"] * n for c in DEDUPE_KEY})
+    df["מספר רישיון"] = licenses
+    df["מספר עצים"] = trees if trees is not None else [3] * n
+    df["__source_sheet__"] = [f"s{i}" for i in range(n)]
+    return df
+
+
+def _collide(monkeypatch):
+    """כל ערך מקבל אותו hash — כל השורות מועמדות, וההחלטה תלויה רק בבדיקת הערכים."""
+    monkeypatch.setattr(pd.util, "hash_array", lambda vals, *a, **kw: np.zeros(len(vals), dtype=np.uint64))
+
+
+def test_flag_is_default_and_keeps_rows():
+    df = _frame(["1", "2", "1", "1"])
+    out, report = dedupe(df)
+    assert len(out) == 4
+    assert out["__is_dup__"].tolist() == [False, False, True, True]
+    assert report["__dup_group__"].tolist() == [1, 1, 1]
+    assert report["__kept__"].tolist() == [True, False, False]
+
+
+def test_drop_keeps_first_occurrence():
+    df = _frame(["1", "2", "1"])
+    out, report = dedupe(df, "drop")
+    assert out["__source_sheet__"].tolist() == ["s0", "s1"]
+    assert report["__source_sheet__"].tolist() == ["s0", "s2"]
+
+
+def test_off_and_unknown_mode():
+    df = _frame(["1", "1"])
+    out, report = dedupe(df, "off")
+    assert len(out) == 2 and "__is_dup__" not in out and report.empty
+    with pytest.raises(ValueError):
+        dedupe(df, "remove")
+
+
+def test_key_is_normalized():
+    # '48.0' / 48 / ' 48 ' הם אותו ערך
+    df = _frame(["7", "7", "7"], trees=["48.0", 48, " 48 "])
+    _, dup, _ = find_duplicates(df)
+    assert dup.tolist() == [False, True, True]
+
+
+def test_missing_license_never_duplicate():
+    df = _frame([None, None, "5"])
+    _, dup, eligible = find_duplicates(df)
+    assert not dup.any()
+    assert eligible.tolist() == [False, False, True]
+
+
+@pytest.mark.parametrize("mode", ["flag", "drop"])
+def test_hash_collision_does_not_drop(monkeypatch, mode):
+    df = _frame(["1", "2", "3", "2"])
+    _collide(monkeypatch)
+    hashes, dup, _ = find_duplicates(df)
+    assert len(set(hashes.tolist())) == 1
+    assert dup.tolist() == [False, False, False, True]
+    out, report = dedupe(df, mode)
+    assert len(out) == (3 if mode == "drop" else 4)
+    # בדוח רק הקבוצה האמיתית (רישיון 2), לא כל השורות שה־hash שלהן זהה
+    assert report["מספר רישיון"].tolist() == ["2", "2"]
+
+
+def test_out_of_core_collision_does_not_drop(monkeypatch, tmp_path):
+    pytest.importorskip("pyarrow")
+    from out_of_core import _dedupe_chunk, _SeenKeys
+
+    _collide(monkeypatch)
+    seen = _SeenKeys(tmp_path)
+    first, _ = _dedupe_chunk(_frame(["1", "2"]), seen, "flag")
+    second, report = _dedupe_chunk(_frame(["3", "2", "4"]), seen, "flag")
+    assert not first["__is_dup__"].any()
+    assert second["__is_dup__"].tolist() == [False, True, False]
+    assert report["מספר רישיון"].tolist() == ["2"]
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""מיזוג מצטבר מול מיזוג מלא: אותה טבלה, אותן טבלאות מסכמות ואותו MappingLog — בהרצה ראשונה, מהמאגר ואחרי שינוי."""
+from __future__ import annotations
+
+import json
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+from openpyxl import load_workbook
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from incremental_merge import MANIFEST_NAME, run_incremental_merge  # noqa: E402
+from merge_engine import run_merge  # noqa: E402
+
+
+def _log(rows):
+    # new_layout תלוי בסדר ההרצות (מי למד את הפריסה ראשון), לא בתוכן
+    return [{k: v for k, v in r.items() if k != "new_layout"} for r in rows]
+
+
+def assert_same_result(full, inc):
+    pd.testing.assert_frame_equal(full.merged, inc.merged)
+    assert full.pivots.keys() == inc.pivots.keys()
+    for sheet in full.pivots:
+        # מפתחות הטבלאות של המיזוג המצטבר מגיעים מצירוף טבלאות, ולכן object ולא category
+        pd.testing.assert_frame_equal(
+            full.pivots[sheet].astype(object).reset_index(drop=True),
+            inc.pivots[sheet].astype(object).reset_index(drop=True),
+        )
+    assert _log(full.log_rows) == _log(inc.log_rows)
+    pd.testing.assert_frame_equal(full.duplicates, inc.duplicates)
+
+
+def _reprocessed(store) -> list[str]:
+    return json.loads((store / MANIFEST_NAME).read_text(encoding="utf-8"))["reprocessed"]
+
+
+@pytest.mark.parametrize("mode", ["flag", "drop", "off"])
+def test_matches_full_merge(workbooks, tmp_path, mode):
+    main, cities, trees, info = workbooks
+    full = run_merge(main, cities, trees, dedupe_mode=mode)
+    store = tmp_path / "store"
+
+    first = run_incremental_merge(main, cities, trees, store, dedupe_mode=mode)
+    assert_same_result(full, first)
+    assert len(_reprocessed(store)) == info["sheets"]
+
+    again = run_incremental_merge(main, cities, trees, store, dedupe_mode=mode)
+    assert_same_result(full, again)
+    assert _reprocessed(store) == []
+    assert again.xlsx == first.xlsx
+
+
+def test_changed_sheet_reprocessed(workbooks, tmp_path):
+    main, cities, trees, _ = workbooks
+    store = tmp_path / "store"
+    # שתי הגרסאות נשמרות דרך openpyxl, כך שרק הגיליון שנערך שונה ב־XML
+    wb = load_workbook(main)
+    base = tmp_path / "base.xlsx"
+    wb.save(base)
+    before = run_incremental_merge(base, cities, trees, store, dedupe_mode="drop")
+
+    # השורה האחרונה בגיליון האחרון מוכפלת — רשומה כפולה חדשה, שגם מופחתת מהטבלאות המסכמות
+    ws = wb[wb.sheetnames[-1]]
+    ws.append([c.value for c in ws[ws.max_row]])
+    changed = tmp_path / "changed.xlsx"
+    wb.save(changed)
+
+    inc = run_incremental_merge(changed, cities, trees, store, dedupe_mode="drop")
+    assert _reprocessed(store) == [wb.sheetnames[-1]]
+    assert len(inc.merged) == len(before.merged)
+    assert inc.duplicates["__dup_group__"].nunique() > before.duplicates["__dup_group__"].nunique()
+    assert_same_result(run_merge(changed, cities, trees, dedupe_mode="drop"), inc)
+
+
+def test_lut_change_invalidates_store(workbooks, tmp_path):
+    main, cities, trees, info = workbooks
+    store = tmp_path / "store"
+    run_incremental_merge(main, cities, trees, store)
+
+    wb = load_workbook(cities)
+    ws = wb.active
+    ws.append([ws.max_row, "יישוב חדש", 99999])
+    other = tmp_path / "cities2.xlsx"
+    wb.save(other)
+
+    inc = run_incremental_merge(main, other, trees, store)
+    assert len(_reprocessed(store)) == info["sheets"]
+    assert_same_result(run_merge(main, other, trees), inc)
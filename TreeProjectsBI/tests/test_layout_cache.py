@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""מטמון הפריסות: פריסה נלמדת פעם אחת לכל סוג גיליון, ופריסה מוכרת נותנת בדיוק את אותו מיפוי ואותה טבלה."""
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "benchmarks"))
+import layout_cache  # noqa: E402
+import workload  # noqa: E402
+from layout_cache import LayoutCache  # noqa: E402
+from merge_engine import run_merge  # noqa: E402
+
+
+def _without_layout(rows):
+    return [{k: v for k, v in r.items() if k not in ("layout", "new_layout")} for r in rows]
+
+
+def test_known_layout_same_result(workbooks, tmp_path):
+    main, cities, trees, _ = workbooks
+    path = tmp_path / "layouts.json"
+
+    plain = run_merge(main, cities, trees, layouts=None)
+    learned = run_merge(main, cities, trees, layouts=LayoutCache(path))
+    known = run_merge(main, cities, trees, layouts=LayoutCache(path))
+
+    pd.testing.assert_frame_equal(plain.merged, learned.merged)
+    pd.testing.assert_frame_equal(plain.merged, known.merged)
+    assert _without_layout(learned.log_rows) == _without_layout(plain.log_rows)
+    assert _without_layout(known.log_rows) == _without_layout(plain.log_rows)
+    assert all(r["new_layout"] for r in learned.log_rows)
+    assert not any(r["new_layout"] for r in known.log_rows)
+    assert [r["layout"] for r in known.log_rows] == [r["layout"] for r in learned.log_rows]
+
+
+def test_layout_shared_between_sheets(tmp_path):
+    # 8 גליונות בארבע פריסות, עם שורות כותרת מוזזות וערים שונות — ארבע פריסות נלמדות
+    main, cities, trees = tmp_path / "main.xlsx", tmp_path / "cities.xlsx", tmp_path / "trees.xlsx"
+    workload.write_cutting_workbook(main, rows=400, sheets=8, seed=1)
+    workload.write_city_list(cities)
+    workload.write_tree_list(trees)
+    cache = LayoutCache(tmp_path / "layouts.json")
+    result = run_merge(main, cities, trees, layouts=cache)
+    assert len(cache.layouts) == len(workload.LAYOUTS)
+    by_sheet = {r["sheet"]: r["layout"] for r in result.log_rows}
+    assert len(by_sheet) == 8 and len(set(by_sheet.values())) == len(workload.LAYOUTS)
+
+
+def test_signature_change_invalidates(workbooks, tmp_path, monkeypatch):
+    main, cities, trees, _ = workbooks
+    path = tmp_path / "layouts.json"
+    run_merge(main, cities, trees, layouts=LayoutCache(path))
+    assert LayoutCache(path).layouts
+
+    monkeypatch.setattr(layout_cache, "LAYOUT_VERSION", layout_cache.LAYOUT_VERSION + "-test")
+    assert LayoutCache(path).layouts == {}
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+upload_prefetch.py — עיבוד קבצים ברקע מרגע ההעלאה, עוד לפני שלוחצים על כפתור המיזוג.
+כל קובץ שהועלה נשלח מיד לתור העבודות המשותף (job_pool — תהליכים נפרדים, עם הגבלת מקביליות) לפי סוגו:
+  city / tree — קומפילציית טבלת הקודים (lut_compiler; נשמרת במטמון הדיסק, וממנו המיזוג טוען אותה),
+  main        — קריאה ומיפוי של כל הגליונות (read_and_map); קובץ אחד או כמה, כולל ארכיוני zip (upload_sources).
+כששלושת הקבצים מוכנים מתחילה ברקע גם הרצת המיזוג המלאה (run_merge) לאותו מצב כפילויות, והתוצאה נשמרת
+ב־MergeCache — כך שלחיצה על הכפתור רק מצטרפת לעבודה שכבר רצה או הסתיימה.
+העבודות מזוהות לפי hash התוכן, כך שאותו קובץ (גם מסשן אחר) לא מעובד פעמיים; מזהה העבודה בתור הוא המפתח.
+"""
+from __future__ import annotations
+
+import hashlib
+
+from job_pool import Job, JobPool
+from lut_compiler import file_digest, load_city_table, load_tree_table
+from merge_engine import _default_layouts, merge_cache_key, read_and_map, run_merge
+from merge_stats import MergeStats
+from upload_sources import detach
+
+KINDS = ("main", "city", "tree")
+
+
+# ---------- עבודות ----------
+
+def _parse_lut(kind: str, data: bytes):
+    table = (load_city_table if kind == "city" else load_tree_table)(data)
+    return len(table.lut)
+
+
+def _parse_main(files: list):
+    """read_and_map על קבצי הדוחות; מחזיר את הצורה ש־run_merge(mapped=...) מצפה לה."""
+    stats = MergeStats()
+    merged, log_rows = read_and_map(files, stats=stats, layouts=_default_layouts())
+    return merged, log_rows, stats.rows
+
+
+def job_key(kind: str, uploaded, digest: str | list[str] | None = None) -> str:
+    """
+    מפתח עבודה: סוג + hash התוכן; לכמה קבצים — hash של רשימת ה־hash לפי הסדר.
+    digest — file_digest שכבר חושב (רשימה לרשימת קבצים), כדי לא לקרוא שוב את התוכן.
+    """
+    if digest is None:
+        digest = [file_digest(f) for f in uploaded] if isinstance(uploaded, (list, tuple)) else file_digest(uploaded)
+    if isinstance(digest, (list, tuple)):
+        digest = hashlib.sha256("|".join(digest).encode()).hexdigest()
+    return f"{kind}-{digest}"
+
+
+class Prefetcher:
+    """
+    עבודות הרקע של דף המיזוג, על גבי JobPool (מחזיקים מופע אחד לתהליך, למשל ב־st.cache_resource).
+    owner — מזהה הסשן שמגיש (ראו job_ui.session_owner), לחלוקה ההוגנת של התור בין סשנים.
+    """
+
+    def __init__(self, pool: JobPool | None = None):
+        self.pool = pool or JobPool()
+
+    def submit(self, kind: str, uploaded, owner: str = "", digest: str | list[str] | None = None) -> str:
+        """
+        שולח קובץ שהועלה לעיבוד לפי סוגו ('main' / 'city' / 'tree'). מחזיר את מפתח העבודה.
+        main יכול להיות גם רשימת קבצים (כמה חוברות / ארכיוני zip). digest — ראו job_key.
+        """
+        if kind not in KINDS:
+            raise ValueError(f"סוג קובץ לא מוכר: {kind}")
+        key = job_key(kind, uploaded, digest)
+        if kind == "main":
+            files = [detach(f) for f in (uploaded if isinstance(uploaded, (list, tuple)) else [uploaded])]
+            name = files[0].name if len(files) == 1 else f"{len(files)} קבצים"
+            return self.pool.submit(_parse_main, files, name=name, owner=owner, key=key)
+        data = uploaded.getvalue() if hasattr(uploaded, "getvalue") else uploaded
+        return self.pool.submit(_parse_lut, kind, data, name=getattr(uploaded, "name", kind), owner=owner, key=key)
+
+    def _merge_args(self, main_file, city_file, tree_file) -> list:
+        mains = [detach(f) for f in (main_file if isinstance(main_file, (list, tuple)) else [main_file])]
+        return [mains] + [f.getvalue() if hasattr(f, "getvalue") else f for f in (city_file, tree_file)]
+
+    def submit_merge(self, main_file, city_file, tree_file, dedupe_mode: str, cache, owner: str = "",
+                     eager: bool = True, digests: dict | None = None) -> str | None:
+        """
+        מריץ ברקע את המיזוג המלא (run_merge, שגם שומר ל־cache). מחזיר את מפתח העבודה (מפתח המטמון).
+        eager — ההפעלה האוטומטית: רק כששלוש עבודות הקבצים הסתיימו בהצלחה (אחרת None), ובלי להפעיל מחדש
+        מיזוג שבוטל או נכשל. בלי eager (לחיצה על הכפתור) — מתחיל מיד, עם קריאת הדוחות אם עוד לא הסתיימה.
+        גרסה (merge_snapshots) לא נשמרת כאן — רק על הרצה מפורשת, ראו submit_snapshot.
+        digests — file_digest שכבר חושבו לפי סוג ({'main': [...], 'city': ..., 'tree': ...}).
+        """
+        digests = digests or {}
+        keys = [job_key(k, f, digests.get(k)) for k, f in zip(KINDS, (main_file, city_file, tree_file))]
+        if eager and any(self.state(k) != "done" for k in keys):
+            return None
+        key = merge_cache_key(cache, main_file, city_file, tree_file, dedupe_mode, digests=digests or None)
+        if eager and self.state(key) in ("error", "cancelled"):
+            return key
+        if cache.get(key) is not None:
+            return key
+        mapped = self.result(keys[0]) if self.state(keys[0]) == "done" else None
+        return self.pool.submit(run_merge, *self._merge_args(main_file, city_file, tree_file), name="מיזוג",
+                                owner=owner, key=key, cache=cache, dedupe_mode=dedupe_mode, mapped=mapped)
+
+    def submit_snapshot(self, main_file, city_file, tree_file, dedupe_mode: str, cache, snapshots,
+                        owner: str = "") -> str:
+        """
+        שומר ברקע את תוצאת המיזוג (שכבר נמצאת ב־cache) כגרסה ב־snapshots: run_merge מהמטמון, בלי למזג שוב.
+        נקרא אחרי הרצה מפורשת בלבד, כך שהמיזוג האוטומטי מרגע ההעלאה לא יוצר גרסאות.
+        """
+        return self.pool.submit(run_merge, *self._merge_args(main_file, city_file, tree_file), name="שמירת גרסה",
+                                owner=owner, cache=cache, dedupe_mode=dedupe_mode, snapshots=snapshots)
+
+    def job(self, key: str | None) -> Job | None:
+        return self.pool.job(key)
+
+    def state(self, key: str | None) -> str:
+        return self.pool.state(key)
+
+    def result(self, key: str, timeout: float | None = None):
+        """ממתין לסיום העבודה ומחזיר את תוצאתה (או מעלה את השגיאה שלה)."""
+        return self.pool.result(key, timeout)
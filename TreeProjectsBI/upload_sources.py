@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+upload_sources.py — קבצי הדוחות שנכנסים למיזוג: קובץ אחד, כמה חוברות, או ארכיון zip של חוברות.
+"חוברת" כאן היא גם קובץ CSV / TSV (גיליון אחד בשם הקובץ, ראו csv_backend).
+list_workbooks פורס את הקלט לרשימת חוברות; כל חוברת נפתחת רק כשמגיעים אליה (WorkbookSource.open),
+כך שמארכיון zip נפרס בכל רגע חבר אחד בלבד, ישר מהבתים של ההעלאה (בלי לחלץ את כל הארכיון לזיכרון או לדיסק).
+קובץ שהועלה לא מועתק: UploadedFile.getvalue() / BytesIO מחזירים את אותו אובייקט bytes, כך שכל נפח ההעלאה
+נמצא בזיכרון פעם אחת.
+לתהליכים אחרים עוברת רק הפניה קטנה (ref: נתיב הקובץ/הארכיון ושם החבר, ראו source_refs / open_ref) —
+כל worker פורס לעצמו את החבר שלו, וההעלאה עצמה לא נשלחת בכל משימה.
+"""
+from __future__ import annotations
+
+import io
+import os
+import zipfile
+from dataclasses import dataclass, field
+from pathlib import Path, PurePosixPath
+
+from csv_backend import CSV_EXTS
+
+WORKBOOK_EXTS = (".xlsx", ".xlsm")
+SOURCE_EXTS = WORKBOOK_EXTS + CSV_EXTS
+ARCHIVE_EXTS = (".zip",)
+
+
+@dataclass
+class WorkbookSource:
+    """
+    חוברת אחת בקלט. name — לתצוגה (קובץ, או ארכיון/חבר); label — קידומת לשמות הגליונות
+    כשיש יותר מחוברת אחת (ראו sheet_label). data — נתיב הקובץ או ה־bytes שלו (הארכיון כולו, לחבר בארכיון);
+    member — שם החבר בארכיון, או None. open() מחזיר נתיב או BytesIO לקריאה, עם שם הקובץ (‎.name).
+    """
+    name: str
+    label: str
+    data: str | bytes = field(repr=False)
+    member: str | None = None
+
+    def open(self):
+        return open_ref((self.data, self.member, self.name))
+
+    @property
+    def is_csv(self) -> bool:
+        return Path(self.name).suffix.lower() in CSV_EXTS
+
+
+def _data(f):
+    """נתיב נשאר נתיב; קובץ שהועלה / BytesIO → ה־bytes שלו (getvalue לא מעתיק)."""
+    if isinstance(f, (str, Path)):
+        return str(f)
+    if isinstance(f, (bytes, bytearray)):
+        return f
+    if hasattr(f, "getvalue"):
+        return f.getvalue()
+    f.seek(0)
+    return f.read()
+
+
+def detach(f):
+    """
+    קובץ שהועלה → BytesIO עצמאי על אותם bytes (בלי העתקה) ועם אותו שם; נתיב נשאר נתיב.
+    מתאים להעברה לעבודת רקע: מיקום הקריאה לא משותף עם האובייקט של Streamlit.
+    """
+    data = _data(f)
+    if isinstance(data, str):
+        return data
+    buf = io.BytesIO(data)
+    buf.name = _display_name(f, 0)
+    return buf
+
+
+def _stream(data):
+    return data if isinstance(data, str) else io.BytesIO(data)
+
+
+def _display_name(f, i: int) -> str:
+    if isinstance(f, (str, Path)):
+        return Path(f).name
+    return getattr(f, "name", None) or f"קובץ {i + 1}"
+
+
+def is_archive(f, name: str | None = None) -> bool:
+    """
+    ארכיון zip של חוברות (ולא חוברת xlsx — שגם היא zip). לפי הסיומת, ובלי סיומת מוכרת — לפי התוכן:
+    ל־xlsx יש ‎[Content_Types].xml בשורש.
+    """
+    name = name or _display_name(f, 0)
+    ext = Path(name).suffix.lower()
+    if ext in ARCHIVE_EXTS:
+        return True
+    if ext in SOURCE_EXTS:
+        return False
+    data = _data(f)
+    src = _stream(data)
+    if not zipfile.is_zipfile(src):
+        return False
+    with zipfile.ZipFile(_stream(data)) as zf:
+        return "[Content_Types].xml" not in zf.namelist()
+
+
+def _is_workbook_member(info: zipfile.ZipInfo) -> bool:
+    """חוברות ו־CSV בלבד: בלי תיקיות, בלי קבצי המערכת של macOS ובלי קבצי נעילה של Excel (‎~$…)."""
+    path = PurePosixPath(info.filename)
+    if info.is_dir() or "__MACOSX" in path.parts or path.name.startswith(("~$", ".")):
+        return False
+    return path.suffix.lower() in SOURCE_EXTS
+
+
+def _named(data: bytes, name: str) -> io.BytesIO:
+    buf = io.BytesIO(data)
+    buf.name = name
+    return buf
+
+
+def open_ref(ref: tuple):
+    """
+    (data, member, name) → נתיב או BytesIO לקריאה, כמו WorkbookSource.open. data — נתיב או bytes;
+    חבר בארכיון נפרס מתוך הארכיון (לבד, בלי שאר החברים).
+    """
+    data, member, name = ref
+    if member is None:
+        return data if isinstance(data, str) else _named(data, name)
+    with zipfile.ZipFile(_stream(data)) as zf:
+        return _named(zf.read(member), PurePosixPath(member).name)
+
+
+def source_refs(books: list[WorkbookSource], directory: str) -> list[tuple]:
+    """
+    הפניות קטנות לחוברות (ראו open_ref), שאפשר לשלוח לתהליך אחר: נתיב נשאר נתיב, וקובץ שהועלה נכתב פעם אחת
+    ל־directory (ארכיון — פעם אחת לכל החברים שלו), כך שבמשימה עובר רק נתיב ושם חבר.
+    """
+    spilled: dict[int, str] = {}
+    refs = []
+    for book in books:
+        data = book.data
+        ext = ARCHIVE_EXTS[0] if book.member is not None else Path(book.name).suffix.lower()
+        # בלי סיומת מוכרת סוג הקובץ מזוהה לפי התוכן — נשאר bytes
+        if not isinstance(data, str) and ext in ARCHIVE_EXTS + SOURCE_EXTS:
+            if id(data) not in spilled:
+                # תיקייה לכל קובץ, בשמו המקורי (שם הגיליון של CSV נגזר משם הקובץ)
+                fname = Path(book.name).name if book.member is None else f"archive{ext}"
+                path = os.path.join(directory, str(len(spilled)), fname)
+                os.makedirs(os.path.dirname(path))
+                with open(path, "wb") as fh:
+                    fh.write(data)
+                spilled[id(data)] = path
+            data = spilled[id(data)]
+        refs.append((data, book.member, book.name))
+    return refs
+
+
+def list_workbooks(files) -> list[WorkbookSource]:
+    """
+    כל החוברות בקלט, לפי הסדר: קבצים לפי סדר ההעלאה, וחברי ארכיון לפי הסדר שבארכיון.
+    files — קובץ אחד או רשימה (נתיבים, bytes או קבצים שהועלו). ארכיון בלי חוברות — ValueError.
+    """
+    if not isinstance(files, (list, tuple)):
+        files = [files]
+    out: list[WorkbookSource] = []
+    for i, f in enumerate(files):
+        name = _display_name(f, i)
+        data = _data(f)
+        if not is_archive(data, name):
+            out.append(WorkbookSource(name=name, label=Path(name).stem, data=data))
+            continue
+        with zipfile.ZipFile(_stream(data)) as zf:
+            members = [m.filename for m in zf.infolist() if _is_workbook_member(m)]
+        if not members:
+            raise ValueError(f"בארכיון {name} אין קבצי Excel / CSV ({', '.join(SOURCE_EXTS)})")
+        for m in members:
+            out.append(WorkbookSource(
+                name=f"{name}/{m}",
+                label=str(PurePosixPath(m).with_suffix("")),
+                data=data,
+                member=m,
+            ))
+    return out
+
+
+def sheet_label(src: WorkbookSource, sname: str, multi: bool) -> str:
+    """
+    שם הגיליון ב־__source_sheet__ וב־MappingLog: עם כמה חוברות — '<חוברת>/<גיליון>', כי שמות גליונות חוזרים.
+    ב־CSV הקובץ הוא הגיליון — תמיד שם הקובץ.
+    """
+    if src.is_csv:
+        return src.label
+    return f"{src.label}/{sname}" if multi else sname
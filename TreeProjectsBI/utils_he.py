@@ -3,6 +3,8 @@ from __future__ import annotations
 import re
 import pandas as pd
 
+from date_engine import parse_dates
+
 # ---------- ניקוי ונירמול בסיסי ----------
 def clean_text(x):
     if pd.isna(x):
@@ -95,41 +97,6 @@ def detect_header_row(df_headless: pd.DataFrame, scan_rows: int = 8):
             best_score, best_row = score, r
     return best_row
 
-# ---------- קריאת לוקאפ עצים/יישובים ----------
-def build_city_tree_luts(xls: pd.ExcelFile):
-    """מוציא מילוני קוד→שם מהגיליונות 'רשימת ערים לפי קודים' ו'רשימת עצים לפי קודים' גם אם יש 'כותרות עמוקות'."""
-    # ערים
-    cities_raw = pd.read_excel(xls, sheet_name="רשימת ערים לפי קודים", header=None)
-    cities = cities_raw.iloc[3:].reset_index(drop=True)
-    if cities.shape[1] >= 3:
-        cities.columns = ["rownum","שם יישוב","קוד"] + [f"extra_{i}" for i in range(cities.shape[1]-3)]
-    else:
-        cities.columns = [f"c{i}" for i in range(cities.shape[1])]
-    city_lut = {}
-    if "קוד" in cities.columns and "שם יישוב" in cities.columns:
-        for _, r in cities.dropna(how="all").iterrows():
-            code = norm_key(r["קוד"])
-            name = clean_text(r["שם יישוב"])
-            if code and name:
-                city_lut[code] = name
-
-    # עצים
-    trees_raw = pd.read_excel(xls, sheet_name="רשימת עצים לפי קודים", header=None)
-    trees = trees_raw.iloc[3:].reset_index(drop=True)
-    if trees.shape[1] >= 5:
-        trees.columns = ["קוד","סוג עץ","שם עץ","שם באנגלית","growth_form"] + [f"extra_{i}" for i in range(trees.shape[1]-5)]
-    else:
-        trees.columns = [f"t{i}" for i in range(trees.shape[1])]
-    tree_lut = {}
-    if "קוד" in trees.columns and "שם עץ" in trees.columns:
-        for _, r in trees.dropna(how="all").iterrows():
-            code = norm_key(r["קוד"])
-            name = clean_text(r["שם עץ"])
-            if code and name:
-                tree_lut[code] = name
-
-    return city_lut, tree_lut
-
 # ---------- המרת קודים לשמות ----------
 def apply_lookups(merged_df: pd.DataFrame, city_lut: dict, tree_lut: dict):
     COL_CITY = "יישוב"; COL_TREE = "שם   מין עץ"
@@ -146,7 +113,7 @@ def apply_lookups(merged_df: pd.DataFrame, city_lut: dict, tree_lut: dict):
 def parse_dates_inplace(df: pd.DataFrame):
     for c in ["מ-תאריך", "עד-תאריך"]:
         if c in df.columns:
-            df[c] = pd.to_datetime(df[c], errors="coerce", dayfirst=False, infer_datetime_format=True)
+            df[c] = parse_dates(df[c], dayfirst=False)
 
 def ensure_numeric(df: pd.DataFrame, cols):
     for c in cols: